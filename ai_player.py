@@ -1,18 +1,24 @@
 # ai_player.py
 # AI玩家接口和实现
 
+import asyncio
+import hashlib
+import json
+import os
 import random
+import threading
 import time
-from typing import List, Dict, Any, Tuple, Optional
+from typing import List, Dict, Any, Tuple, Optional, Callable, Awaitable, Generator
 from engine_info import Card, Action, GameStage, Player
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 from game_info import GameAction, GameInfoState, GamePlayerAction, GameResult
 import re
-from anthropic import Anthropic
+from anthropic import Anthropic, AsyncAnthropic
 
 DESISION_PROMPT_PATH = "prompt/decision_prompt.txt"
 REFLECT_PROMPT_PATH = "prompt/reflect_prompt.txt"
 REFLECT_ALL_PROMPT_PATH = "prompt/reflect_all_prompt.txt"
+LLMFlow = Generator[str, Dict[str, str], Any]  # yield prompt，接收响应，返回最终结果
 RED = '\033[31m'
 RESET = '\033[0m'
 
@@ -45,6 +51,101 @@ def prepare_game_state_for_log(game_state) -> Dict[str, Any]:
     }
 
 
+class LLMResponseCache:
+    """LLM 响应缓存，按（模型名, prompt）命中，可在多张牌桌、多个线程间共享
+
+    同一请求正在进行时，其他线程等待它的结果而不是重复请求；失败的请求不缓存。
+    指定 path 时缓存以 JSON Lines 追加保存，下次运行时重新载入。
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._responses: Dict[str, Dict[str, str]] = {}
+        self._pending: Dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if path and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._responses[entry["key"]] = entry["response"]
+
+    @staticmethod
+    def make_key(model_name: str, prompt: str) -> str:
+        return hashlib.sha256(f"{model_name}\n{prompt}".encode("utf-8")).hexdigest()
+
+    def get_or_call(self, model_name: str, prompt: str, call: Callable[[str], Dict[str, str]]) -> Dict[str, str]:
+        key = self.make_key(model_name, prompt)
+        while True:
+            with self._lock:
+                if key in self._responses:
+                    self.hits += 1
+                    return self._responses[key]
+                event = self._pending.get(key)
+                if event is None:
+                    event = self._pending[key] = threading.Event()
+                    self.misses += 1
+                    break
+            # 相同请求正在进行，等待后重新查询（对方失败时由本线程重新请求）
+            event.wait()
+
+        try:
+            response = call(prompt)
+        except BaseException:
+            with self._lock:
+                del self._pending[key]
+            event.set()
+            raise
+        with self._lock:
+            self._responses[key] = response
+            del self._pending[key]
+            if self.path:
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps({"key": key, "response": response}, ensure_ascii=False) + "\n")
+        event.set()
+        return response
+
+    async def get_or_call_async(
+        self, model_name: str, prompt: str, call: Callable[[str], Awaitable[Dict[str, str]]]
+    ) -> Dict[str, str]:
+        """get_or_call 的异步版本，可以和同步调用方共享同一个缓存"""
+        key = self.make_key(model_name, prompt)
+        while True:
+            with self._lock:
+                if key in self._responses:
+                    self.hits += 1
+                    return self._responses[key]
+                event = self._pending.get(key)
+                if event is None:
+                    event = self._pending[key] = threading.Event()
+                    self.misses += 1
+                    break
+            await asyncio.to_thread(event.wait)
+
+        try:
+            response = await call(prompt)
+        except BaseException:
+            with self._lock:
+                del self._pending[key]
+            event.set()
+            raise
+        with self._lock:
+            self._responses[key] = response
+            del self._pending[key]
+            if self.path:
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps({"key": key, "response": response}, ensure_ascii=False) + "\n")
+        event.set()
+        return response
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {"entries": len(self._responses), "hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0}
+
+
 class AIPlayer:
     """AI玩家基类,定义AI玩家接口"""
 
@@ -82,6 +183,17 @@ class AIPlayer:
         """在游戏结束后，根据游戏结果进行反思和学习"""
         raise NotImplementedError("子类必须实现此方法")
 
+    async def make_decision_async(self, game_state: GameInfoState) -> GamePlayerAction:
+        """make_decision 的异步版本，供异步牌局循环使用
+
+        默认在线程中执行同步实现；能够不占线程等待的玩家（异步 SDK、Web 玩家）应重写此方法
+        """
+        return await asyncio.to_thread(self.make_decision, game_state)
+
+    async def reflect_on_game_async(self, game_state: GameInfoState, game_result: GameResult):
+        """reflect_on_game 的异步版本，默认在线程中执行同步实现"""
+        return await asyncio.to_thread(self.reflect_on_game, game_state, game_result)
+
 
 class HumanPlayer(AIPlayer):
     def __init__(self, name: str):
@@ -191,9 +303,13 @@ class LLMPlayer(AIPlayer):
         self.api_key = api_key
         self.base_url = base_url
         self.client = None
+        self.async_client = None
+        self._async_client_loop = None
         self.opinions = {}
         self.all_player_previous = '对他们还不了解'
         self.game_logger = game_logger  # 新增：日志记录器
+        self.response_cache: Optional[LLMResponseCache] = None  # 设置后相同的 prompt 复用已有的响应
+        self._last_cached_prompt: Optional[str] = None
 
     def _call_llm_api(self, prompt: str) -> str:
         """调用大语言模型API获取响应"""
@@ -205,13 +321,87 @@ class LLMPlayer(AIPlayer):
         content = self._call_llm_api(prompt)
         return {"content": content, "reasoning_content": ""}
 
+    def _request_llm(self, prompt: str) -> Dict[str, str]:
+        """获取 LLM 响应，设置了 response_cache 时优先使用缓存
+
+        连续两次相同的 prompt 说明上次的响应无法解析或行动被引擎拒绝，此时绕过缓存重新请求，
+        避免同一个响应被反复使用导致死循环
+        """
+        if self.response_cache is None or prompt == self._last_cached_prompt:
+            self._last_cached_prompt = None
+            return self._call_llm_api_with_metadata(prompt)
+        self._last_cached_prompt = prompt
+        return self.response_cache.get_or_call(self.model_name, prompt, self._call_llm_api_with_metadata)
+
+    async def _call_llm_api_with_metadata_async(self, prompt: str) -> Dict[str, str]:
+        """异步调用大语言模型API，子类没有异步客户端时在线程中执行同步调用"""
+        return await asyncio.to_thread(self._call_llm_api_with_metadata, prompt)
+
+    def _get_async_client(self, factory: Callable[[], Any]) -> Any:
+        """异步客户端绑定创建它的事件循环，同步接口每次 asyncio.run 都是新的循环，循环变化时重新创建"""
+        loop = asyncio.get_running_loop()
+        if self.async_client is None or self._async_client_loop is not loop:
+            self.async_client = factory()
+            self._async_client_loop = loop
+        return self.async_client
+
+    async def _request_llm_async(self, prompt: str) -> Dict[str, str]:
+        """_request_llm 的异步版本"""
+        if self.response_cache is None or prompt == self._last_cached_prompt:
+            self._last_cached_prompt = None
+            return await self._call_llm_api_with_metadata_async(prompt)
+        self._last_cached_prompt = prompt
+        return await self.response_cache.get_or_call_async(self.model_name, prompt, self._call_llm_api_with_metadata_async)
+
+    # 决策和反思流程写成生成器：需要调用大模型时 yield prompt，由同步或异步驱动函数把响应（或异常）送回，
+    # 两种调用方式共用同一份流程
+    def _drive(self, flow: LLMFlow) -> Any:
+        try:
+            prompt = next(flow)
+            while True:
+                try:
+                    response = self._request_llm(prompt)
+                except Exception as e:
+                    prompt = flow.throw(e)
+                else:
+                    prompt = flow.send(response)
+        except StopIteration as stop:
+            return stop.value
+
+    async def _drive_async(self, flow: LLMFlow) -> Any:
+        try:
+            prompt = next(flow)
+            while True:
+                try:
+                    response = await self._request_llm_async(prompt)
+                except Exception as e:
+                    prompt = flow.throw(e)
+                else:
+                    prompt = flow.send(response)
+        except StopIteration as stop:
+            return stop.value
+
     def make_decision(self, game_state: GameInfoState) -> GamePlayerAction:
+        return self._drive(self._decision_flow(game_state))
+
+    async def make_decision_async(self, game_state: GameInfoState) -> GamePlayerAction:
+        return await self._drive_async(self._decision_flow(game_state))
+
+    def reflect_on_game(self, game_state: GameInfoState, game_result: GameResult):
+        return self._drive(self._reflection_flow(game_state, game_result))
+
+    async def reflect_on_game_async(self, game_state: GameInfoState, game_result: GameResult):
+        return await self._drive_async(self._reflection_flow(game_state, game_result))
+
+    def _decision_flow(self, game_state: GameInfoState) -> LLMFlow:
         print(f"玩家 {self.name} 正在思考...", flush=True)
         if getattr(self, "reveal_hand_in_stdout", True):
             print(f"他的手牌是：{', '.join(str(card) for card in self.player.hand)}", flush=True)
             print(f"他的筹码量：{self.player.chips}", flush=True)
 
         prompt = ""
+        prompt_template = self._read_file(DESISION_PROMPT_PATH)
+        prompt_vars = None
         raw_response = ""
         reasoning_content = ""
         error = ""
@@ -221,10 +411,11 @@ class LLMPlayer(AIPlayer):
         for i in range(3):
             try:
                 # 构建提示信息
-                prompt = self._build_prompt(game_state)
+                prompt_vars = self._build_prompt_vars(game_state)
+                prompt = prompt_template.format(**prompt_vars)
 
                 # 调用大语言模型获取决策
-                response_with_metadata = self._call_llm_api_with_metadata(prompt)
+                response_with_metadata = yield prompt
                 raw_response = response_with_metadata.get("content", "")
                 reasoning_content = response_with_metadata.get("reasoning_content", "")
 
@@ -246,7 +437,9 @@ class LLMPlayer(AIPlayer):
                         behavior=result.behavior,
                         reasoning_content=reasoning_content,
                         response_time=time.time() - start_time,
-                        error=error
+                        error=error,
+                        prompt_template=prompt_template,
+                        prompt_vars=prompt_vars
                     )
 
                 return result
@@ -270,7 +463,9 @@ class LLMPlayer(AIPlayer):
                 behavior='无表情',
                 reasoning_content=reasoning_content,
                 response_time=time.time() - start_time,
-                error=error
+                error=error,
+                prompt_template=prompt_template if prompt else None,
+                prompt_vars=prompt_vars if prompt else None
             )
 
         return GamePlayerAction(
@@ -283,7 +478,10 @@ class LLMPlayer(AIPlayer):
     def _build_prompt(self, game_state: GameInfoState) -> str:
         """构建提示信息"""
         basePrompt = self._read_file(DESISION_PROMPT_PATH)
+        return basePrompt.format(**self._build_prompt_vars(game_state))
 
+    def _build_prompt_vars(self, game_state: GameInfoState) -> Dict[str, str]:
+        """构建填入决策prompt模板的变量"""
         # 生成游戏游戏相关信息
         game_info = game_state.get_common_game_info()
 
@@ -299,15 +497,13 @@ class LLMPlayer(AIPlayer):
         # 生成当前玩家对其他人物的评估
         player_performance = self.get_player_performance(game_state.players_info)
 
-        prompt = basePrompt.format(
-            game_info=game_info,
-            self_info=self_info,
-            player_info=player_info,
-            action_history=action_history,
-            player_performance=self.all_player_previous
-        )
-
-        return prompt
+        return {
+            "game_info": game_info,
+            "self_info": self_info,
+            "player_info": player_info,
+            "action_history": action_history,
+            "player_performance": self.all_player_previous
+        }
 
     def _parse_response(self, response: str, game_state: GameInfoState) -> GamePlayerAction:
         """解析大语言模型的响应"""
@@ -359,7 +555,7 @@ class LLMPlayer(AIPlayer):
         else:
             raise ValueError("无法从响应中提取有效数据")
 
-    def reflect_on_game(self, game_state: GameInfoState, game_result: GameResult):
+    def _reflection_flow(self, game_state: GameInfoState, game_result: GameResult) -> LLMFlow:
         if getattr(self, "show_llm_stdout", True):
             print(f'玩家 {self.name} 正在反思和总结...')
         # 生成当前轮次的对局历史
@@ -372,16 +568,17 @@ class LLMPlayer(AIPlayer):
         # 使用一次调用为所有玩家进行分析
         basePrompt = self._read_file(REFLECT_ALL_PROMPT_PATH)
         prompt = ""
+        prompt_vars = {
+            "self_name": self.player.name,
+            "user_info": player_info,
+            "action_history": action_history,
+            "game_result": result_str,
+            "previous_opinion": self.all_player_previous
+        }
         raw_response = ""
         try:
-            prompt = basePrompt.format(
-                self_name=self.player.name,
-                user_info=player_info,
-                action_history=action_history,
-                game_result=result_str,
-                previous_opinion=self.all_player_previous
-            )
-            response_with_metadata = self._call_llm_api_with_metadata(prompt)
+            prompt = basePrompt.format(**prompt_vars)
+            response_with_metadata = yield prompt
             raw_response = response_with_metadata.get("content", "")
             content = raw_response
             # 更新对其他玩家的印象
@@ -398,7 +595,9 @@ class LLMPlayer(AIPlayer):
                     prompt=prompt,
                     game_result=result_str,
                     raw_response=raw_response,
-                    updated_opinions={"all_players": content}
+                    updated_opinions={"all_players": content},
+                    prompt_template=basePrompt,
+                    prompt_vars=prompt_vars
                 )
         except Exception as e:
             if getattr(self, "show_llm_stdout", True):
@@ -412,7 +611,9 @@ class LLMPlayer(AIPlayer):
                     prompt=prompt if prompt else "",
                     game_result=result_str,
                     raw_response=raw_response if raw_response else "",
-                    updated_opinions={}
+                    updated_opinions={},
+                    prompt_template=basePrompt if prompt else None,
+                    prompt_vars=prompt_vars if prompt else None
                 )
 
     def _read_file(self, filepath: str) -> str:
@@ -506,7 +707,23 @@ class OpenAiLLMUser(LLMPlayer):
             raise RuntimeError(
                 f"OpenAI请求失败(model={self.model_name}, base_url={self.base_url}): {e}"
             ) from e
+        return self._response_metadata(response)
+
+    async def _call_llm_api_with_metadata_async(self, prompt: str) -> Dict[str, str]:
+        """使用异步客户端调用OpenAI兼容接口，等待响应时不占用线程"""
+        client = self._get_async_client(lambda: AsyncOpenAI(api_key=self.api_key, base_url=self.base_url))
+        try:
+            response = await client.chat.completions.create(
+                model=self.model_name,
+                messages=[{"role": "user", "content": prompt}]
+            )
+        except Exception as e:
+            raise RuntimeError(
+                f"OpenAI请求失败(model={self.model_name}, base_url={self.base_url}): {e}"
+            ) from e
+        return self._response_metadata(response)
 
+    def _response_metadata(self, response: Any) -> Dict[str, str]:
         if response.choices:
             message = response.choices[0].message
             content = message.content if message.content else ""
@@ -562,7 +779,19 @@ class AnthropicLLMUser(LLMPlayer):
             model=self.model_name,
             messages=messages
         )
+        return self._response_metadata(response)
+
+    async def _call_llm_api_with_metadata_async(self, prompt: str) -> Dict[str, str]:
+        """使用异步客户端调用Anthropic接口，等待响应时不占用线程"""
+        client = self._get_async_client(lambda: AsyncAnthropic(api_key=self.api_key, base_url=self.base_url))
+        response = await client.messages.create(
+            max_tokens=1024,
+            model=self.model_name,
+            messages=[{"role": "user", "content": prompt}]
+        )
+        return self._response_metadata(response)
 
+    def _response_metadata(self, response: Any) -> Dict[str, str]:
         if response.content:
             message = response.content[0]
             content = message.text if message.text else ""
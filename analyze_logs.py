@@ -1,17 +1,105 @@
 # analyze_logs.py
 # 增强日志分析工具
 
+import argparse
 import json
 import os
-from typing import Dict, List, Any
-from collections import defaultdict
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Any, Optional, Tuple, Callable
+from collections import defaultdict, OrderedDict
+
+from game_logger import resolve_prompt
+from segmented_log import SegmentedLog, SEGMENT_DIR, INDEX_FILE, get_segment_path
+
+
+def normalize_action(action: str) -> str:
+    """统一行动名称为 Action 枚举值（fold/check/call/raise/all-in），兼容 FOLD、ALL_IN 等写法"""
+    return str(action).strip().lower().replace("_", "-")
+
+
+class IndexedLog:
+    """已加载的增强日志及其二级索引，首次加载时一次性构建"""
+
+    def __init__(self, data: Dict[str, Any]):
+        self.data = data
+        self.decisions_by_player: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        self.decisions_by_model: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        self.decisions_by_hand: Dict[int, List[Dict[str, Any]]] = defaultdict(list)
+        self.decisions_by_stage: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        self.decisions_by_hand_stage: Dict[Tuple[int, str], List[Dict[str, Any]]] = defaultdict(list)
+        self.reflections_by_player: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        self.events_by_type: Dict[int, List[Dict[str, Any]]] = defaultdict(list)
+        self.total_hands = 0
+
+        for decision in data.get("llm_decisions", []):
+            self.decisions_by_player[decision["player_name"]].append(decision)
+            self.decisions_by_model[decision["model_name"]].append(decision)
+            self.decisions_by_hand[decision["hand_number"]].append(decision)
+            self.decisions_by_stage[decision["stage"]].append(decision)
+            self.decisions_by_hand_stage[(decision["hand_number"], decision["stage"])].append(decision)
+
+        for reflection in data.get("llm_reflections", []):
+            self.reflections_by_player[reflection["player_name"]].append(reflection)
+
+        for event in data.get("events", []):
+            self.events_by_type[event.get("type", 0)].append(event)
+            self.total_hands = max(self.total_hands, event.get("hand_number", 0))
+
+
+class LogCache:
+    """进程内的日志缓存，按文件 mtime 和大小判断是否失效，超出容量时淘汰最久未使用的日志"""
+
+    def __init__(self, max_entries: int = 8):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, int, IndexedLog]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, filename: str, loader: Optional[Callable[[], Dict[str, Any]]] = None) -> IndexedLog:
+        """获取日志，文件未变化时直接返回缓存；loader 用于非单文件JSON的日志（如分段存储的索引文件）"""
+        stat = os.stat(filename)
+        key = os.path.abspath(filename)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] == stat.st_mtime and entry[1] == stat.st_size:
+                self._entries.move_to_end(key)
+                return entry[2]
+
+        if loader is not None:
+            indexed = IndexedLog(loader())
+        else:
+            with open(filename, 'r', encoding='utf-8') as f:
+                indexed = IndexedLog(json.load(f))
+
+        with self._lock:
+            self._entries[key] = (stat.st_mtime, stat.st_size, indexed)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return indexed
+
+    def invalidate(self, filename: Optional[str] = None):
+        """清除指定文件或全部缓存"""
+        with self._lock:
+            if filename is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(os.path.abspath(filename), None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+# 默认在进程内共享的日志缓存
+default_log_cache = LogCache()
 
 
 class LogAnalyzer:
     """增强日志分析器"""
 
-    def __init__(self, log_dir: str = "game_logs"):
+    def __init__(self, log_dir: str = "game_logs", cache: Optional[LogCache] = None):
         self.log_dir = log_dir
+        self.cache = cache if cache is not None else default_log_cache
 
     def list_enhanced_logs(self) -> List[str]:
         """列出所有增强日志文件"""
@@ -24,18 +112,25 @@ class LogAnalyzer:
                 logs.append(os.path.join(self.log_dir, file))
         return logs
 
-    def load_log(self, game_id: str) -> Dict[str, Any]:
-        """加载指定游戏的增强日志"""
+    def load_indexed_log(self, game_id: str) -> IndexedLog:
+        """加载指定游戏的增强日志及其索引（带缓存），没有单文件日志时读取分段存储（如对局未正常结束）"""
         filename = os.path.join(self.log_dir, f"enhanced_poker_game_{game_id}.json")
-        if not os.path.exists(filename):
-            raise FileNotFoundError(f"找不到日志文件: {filename}")
+        if os.path.exists(filename):
+            return self.cache.get(filename)
+        segment_path = get_segment_path(self.log_dir, game_id)
+        index_file = os.path.join(segment_path, INDEX_FILE)
+        if os.path.exists(index_file):
+            return self.cache.get(index_file, loader=lambda: SegmentedLog(segment_path).to_enhanced())
+        raise FileNotFoundError(f"找不到日志文件: {filename}")
 
-        with open(filename, 'r', encoding='utf-8') as f:
-            return json.load(f)
+    def load_log(self, game_id: str) -> Dict[str, Any]:
+        """加载指定游戏的增强日志"""
+        return self.load_indexed_log(game_id).data
 
     def get_game_summary(self, game_id: str) -> Dict[str, Any]:
         """获取游戏摘要"""
-        log = self.load_log(game_id)
+        indexed = self.load_indexed_log(game_id)
+        log = indexed.data
 
         return {
             "game_id": log["game_id"],
@@ -45,24 +140,33 @@ class LogAnalyzer:
             "total_decisions": len(log["llm_decisions"]),
             "total_reflections": len(log["llm_reflections"]),
             "final_rankings": log.get("final_rankings", []),
-            "total_hands": max([e.get("hand_number", 0) for e in log["events"]], default=0)
+            "total_hands": indexed.total_hands
         }
 
     def get_player_decisions(self, game_id: str, player_name: str) -> List[Dict[str, Any]]:
         """获取指定玩家的所有决策"""
-        log = self.load_log(game_id)
-        return [
-            decision for decision in log["llm_decisions"]
-            if decision["player_name"] == player_name
-        ]
+        return list(self.load_indexed_log(game_id).decisions_by_player.get(player_name, []))
 
     def get_player_reflections(self, game_id: str, player_name: str) -> List[Dict[str, Any]]:
         """获取指定玩家的所有反思"""
+        return list(self.load_indexed_log(game_id).reflections_by_player.get(player_name, []))
+
+    def get_stage_decisions(self, game_id: str, stage: str) -> List[Dict[str, Any]]:
+        """获取某个阶段的所有决策"""
+        return list(self.load_indexed_log(game_id).decisions_by_stage.get(stage, []))
+
+    def get_hand_decisions(self, game_id: str, hand_number: int) -> List[Dict[str, Any]]:
+        """获取某一手牌的所有决策"""
+        return list(self.load_indexed_log(game_id).decisions_by_hand.get(hand_number, []))
+
+    def get_prompt(self, game_id: str, record: Dict[str, Any]) -> str:
+        """还原决策或反思记录的完整prompt（日志中的prompt可能以模板+变量或哈希形式存储）"""
         log = self.load_log(game_id)
-        return [
-            reflection for reflection in log["llm_reflections"]
-            if reflection["player_name"] == player_name
-        ]
+        return resolve_prompt(record, log.get("prompt_templates", {}), log.get("prompt_blobs", {}))
+
+    def get_events_by_type(self, game_id: str, event_type: int) -> List[Dict[str, Any]]:
+        """获取指定类型的所有游戏事件"""
+        return list(self.load_indexed_log(game_id).events_by_type.get(event_type, []))
 
     def analyze_decision_patterns(self, game_id: str, player_name: str) -> Dict[str, Any]:
         """分析玩家的决策模式"""
@@ -77,18 +181,18 @@ class LogAnalyzer:
         all_in_count = 0
 
         for decision in decisions:
-            action = decision["parsed_action"]
+            action = normalize_action(decision["parsed_action"])
             action_counts[action] += 1
             stage_action_counts[decision["stage"]][action] += 1
             total_response_time += decision.get("response_time", 0)
 
-            if action == "FOLD":
+            if action == "fold":
                 fold_count += 1
-            elif action == "RAISE":
+            elif action == "raise":
                 raise_count += 1
-            elif action == "CALL":
+            elif action == "call":
                 call_count += 1
-            elif action == "ALL_IN":
+            elif action == "all-in":
                 all_in_count += 1
 
         total_decisions = len(decisions)
@@ -109,12 +213,8 @@ class LogAnalyzer:
 
     def get_decision_by_stage(self, game_id: str, hand_number: int, stage: str, player_name: str = None) -> List[Dict[str, Any]]:
         """获取特定阶段的所有决策"""
-        log = self.load_log(game_id)
-
-        decisions = [
-            decision for decision in log["llm_decisions"]
-            if decision["hand_number"] == hand_number and decision["stage"] == stage
-        ]
+        indexed = self.load_indexed_log(game_id)
+        decisions = list(indexed.decisions_by_hand_stage.get((hand_number, stage), []))
 
         if player_name:
             decisions = [d for d in decisions if d["player_name"] == player_name]
@@ -123,7 +223,7 @@ class LogAnalyzer:
 
     def compare_models(self, game_id: str) -> Dict[str, Any]:
         """对比不同模型的表现"""
-        log = self.load_log(game_id)
+        indexed = self.load_indexed_log(game_id)
 
         model_stats = defaultdict(lambda: {
             "decisions": 0,
@@ -133,19 +233,19 @@ class LogAnalyzer:
             "call_count": 0
         })
 
-        for decision in log["llm_decisions"]:
-            model_name = decision["model_name"]
+        for model_name, decisions in indexed.decisions_by_model.items():
             stats = model_stats[model_name]
-            stats["decisions"] += 1
-            stats["total_response_time"] += decision.get("response_time", 0)
-
-            action = decision["parsed_action"]
-            if action == "FOLD":
-                stats["fold_count"] += 1
-            elif action == "RAISE":
-                stats["raise_count"] += 1
-            elif action == "CALL":
-                stats["call_count"] += 1
+            for decision in decisions:
+                stats["decisions"] += 1
+                stats["total_response_time"] += decision.get("response_time", 0)
+
+                action = normalize_action(decision["parsed_action"])
+                if action == "fold":
+                    stats["fold_count"] += 1
+                elif action == "raise":
+                    stats["raise_count"] += 1
+                elif action == "call":
+                    stats["call_count"] += 1
 
         # 计算统计数据
         comparison = {}
@@ -192,6 +292,237 @@ class LogAnalyzer:
         return json.dumps(timeline, ensure_ascii=False, indent=2)
 
 
+def list_log_sources(log_dir: str) -> List[Tuple[str, str]]:
+    """列出可导入的日志：(源文件, 游戏ID)，单文件日志优先，只有分段存储的对局用其索引文件"""
+    sources = []
+    seen = set()
+    for filename in LogAnalyzer(log_dir).list_enhanced_logs():
+        game_id = os.path.basename(filename)[len("enhanced_poker_game_"):-len(".json")]
+        sources.append((filename, game_id))
+        seen.add(game_id)
+    segment_root = os.path.join(log_dir, SEGMENT_DIR)
+    if os.path.isdir(segment_root):
+        for game_id in sorted(os.listdir(segment_root)):
+            index_file = os.path.join(segment_root, game_id, INDEX_FILE)
+            if game_id not in seen and os.path.exists(index_file):
+                sources.append((index_file, game_id))
+    return sources
+
+
+def load_log_source(filename: str) -> Dict[str, Any]:
+    """读取 list_log_sources 返回的源文件（单文件日志或分段索引）为增强日志格式"""
+    if os.path.basename(filename) == INDEX_FILE:
+        return SegmentedLog(os.path.dirname(filename)).to_enhanced()
+    with open(filename, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def summarize_log_file(filename: str) -> Dict[str, Any]:
+    """统计单个日志源（单文件日志或分段索引）中各模型的部分聚合结果（在子进程中执行，结果可直接合并）"""
+    log = load_log_source(filename)
+
+    player_models = {p["name"]: p.get("model_name", "unknown") for p in log.get("players", [])}
+    initial_chips = {p["name"]: p.get("initial_chips", log.get("initial_chips", 0)) for p in log.get("players", [])}
+
+    models: Dict[str, Dict[str, Any]] = {}
+
+    def model_entry(model_name: str) -> Dict[str, Any]:
+        if model_name not in models:
+            models[model_name] = {
+                "decisions": 0,
+                "action_counts": {},
+                "response_times": [],
+                "hands_played": 0,
+                "hands_won": 0,
+                "games": 0,
+                "games_won": 0,
+                "chip_delta": 0
+            }
+        return models[model_name]
+
+    hands_by_player = defaultdict(set)
+    for decision in log.get("llm_decisions", []):
+        model_name = decision.get("model_name") or player_models.get(decision["player_name"], "unknown")
+        entry = model_entry(model_name)
+        entry["decisions"] += 1
+        action = normalize_action(decision.get("parsed_action", ""))
+        entry["action_counts"][action] = entry["action_counts"].get(action, 0) + 1
+        entry["response_times"].append(round(decision.get("response_time", 0.0), 3))
+        hands_by_player[decision["player_name"]].add(decision["hand_number"])
+
+    for player_name, hands in hands_by_player.items():
+        model_entry(player_models.get(player_name, "unknown"))["hands_played"] += len(hands)
+
+    for event in log.get("events", []):
+        if event.get("type") != 6:
+            continue
+        for winner in event.get("winners", []):
+            model_entry(player_models.get(winner["name"], "unknown"))["hands_won"] += 1
+
+    for ranking in log.get("final_rankings", []):
+        entry = model_entry(ranking.get("model_name") or player_models.get(ranking["name"], "unknown"))
+        entry["games"] += 1
+        if ranking.get("rank") == 1:
+            entry["games_won"] += 1
+        entry["chip_delta"] += ranking.get("final_chips", 0) - initial_chips.get(ranking["name"], 0)
+
+    return {"game_id": log.get("game_id", ""), "models": models}
+
+
+def merge_model_partials(partials: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """合并多个日志的部分聚合结果"""
+    merged: Dict[str, Dict[str, Any]] = {}
+    for partial in partials:
+        for model_name, stats in partial["models"].items():
+            entry = merged.setdefault(model_name, {
+                "decisions": 0,
+                "action_counts": defaultdict(int),
+                "response_times": [],
+                "hands_played": 0,
+                "hands_won": 0,
+                "games": 0,
+                "games_won": 0,
+                "chip_delta": 0
+            })
+            for key in ("decisions", "hands_played", "hands_won", "games", "games_won", "chip_delta"):
+                entry[key] += stats[key]
+            for action, count in stats["action_counts"].items():
+                entry["action_counts"][action] += count
+            entry["response_times"].extend(stats["response_times"])
+    return merged
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """线性插值计算百分位数，sorted_values 需已排序"""
+    if not sorted_values:
+        return 0.0
+    pos = (len(sorted_values) - 1) * q
+    lower = int(pos)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (pos - lower)
+
+
+class CorpusAnalyzer:
+    """跨对局的语料级分析器
+
+    用进程池并行统计 log_dir 下所有增强日志，并把每个文件的部分结果按 mtime 和大小缓存到
+    cache_file 中，新增对局后重新运行只需处理新文件。
+    """
+
+    CACHE_VERSION = 1
+
+    def __init__(self, log_dir: str = "game_logs", cache_file: Optional[str] = None, max_workers: Optional[int] = None):
+        self.log_dir = log_dir
+        self.cache_file = cache_file or os.path.join(log_dir, ".corpus_cache.json")
+        self.max_workers = max_workers
+        self.last_processed = 0  # 最近一次统计中重新处理的文件数
+
+    def _load_cache(self) -> Dict[str, Any]:
+        if not os.path.exists(self.cache_file):
+            return {}
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if cache.get("version") != self.CACHE_VERSION:
+            return {}
+        return cache.get("files", {})
+
+    def _save_cache(self, files: Dict[str, Any]):
+        tmp_file = self.cache_file + ".tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump({"version": self.CACHE_VERSION, "files": files}, f, ensure_ascii=False)
+        os.replace(tmp_file, self.cache_file)
+
+    def collect_partials(self) -> List[Dict[str, Any]]:
+        """获取所有日志的部分聚合结果，只有新增或变化的文件会被重新处理"""
+        cached = self._load_cache()
+        files: Dict[str, Any] = {}
+        pending: List[Tuple[str, os.stat_result]] = []
+
+        # 有界内存模式的对局没有单文件日志，按分段索引读取；缓存键用相对路径，各对局的索引文件同名
+        for filename, _ in list_log_sources(self.log_dir):
+            stat = os.stat(filename)
+            name = os.path.relpath(filename, self.log_dir)
+            entry = cached.get(name)
+            if entry and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+                files[name] = entry
+            else:
+                pending.append((filename, stat))
+
+        if pending:
+            filenames = [filename for filename, _ in pending]
+            if len(pending) == 1 or self.max_workers == 1:
+                results = [summarize_log_file(filename) for filename in filenames]
+            else:
+                with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+                    chunksize = max(1, len(filenames) // ((self.max_workers or os.cpu_count() or 1) * 4))
+                    results = list(executor.map(summarize_log_file, filenames, chunksize=chunksize))
+            for (filename, stat), partial in zip(pending, results):
+                files[os.path.relpath(filename, self.log_dir)] = {
+                    "mtime": stat.st_mtime,
+                    "size": stat.st_size,
+                    "partial": partial
+                }
+
+        # 没有新文件且没有文件被删除时不需要重写缓存
+        if pending or len(files) != len(cached):
+            self._save_cache(files)
+        self.last_processed = len(pending)
+        return [entry["partial"] for entry in files.values()]
+
+    def analyze(self) -> Dict[str, Any]:
+        """统计所有对局中各模型的表现"""
+        partials = self.collect_partials()
+        merged = merge_model_partials(partials)
+
+        models = {}
+        for model_name, stats in merged.items():
+            decisions = stats["decisions"]
+            times = sorted(stats["response_times"])
+            action_counts = dict(stats["action_counts"])
+            models[model_name] = {
+                "total_decisions": decisions,
+                "action_distribution": action_counts,
+                "action_rates": {
+                    action: count / decisions for action, count in action_counts.items()
+                } if decisions > 0 else {},
+                "response_time_p50": percentile(times, 0.5),
+                "response_time_p90": percentile(times, 0.9),
+                "response_time_p99": percentile(times, 0.99),
+                "hands_played": stats["hands_played"],
+                "hand_win_rate": stats["hands_won"] / stats["hands_played"] if stats["hands_played"] > 0 else 0,
+                "games": stats["games"],
+                "game_win_rate": stats["games_won"] / stats["games"] if stats["games"] > 0 else 0,
+                "total_chip_delta": stats["chip_delta"],
+                "avg_chip_delta": stats["chip_delta"] / stats["games"] if stats["games"] > 0 else 0
+            }
+
+        return {
+            "total_games": len(partials),
+            "processed_files": self.last_processed,
+            "models": models
+        }
+
+
+def print_corpus_summary(log_dir: str = "game_logs", max_workers: Optional[int] = None):
+    """打印所有对局的模型汇总"""
+    result = CorpusAnalyzer(log_dir, max_workers=max_workers).analyze()
+    print(f"共 {result['total_games']} 局对局，本次处理 {result['processed_files']} 个新增或变化的日志")
+    print("="*80)
+    for model_name, stats in sorted(result["models"].items()):
+        print(f"\n模型: {model_name}")
+        print(f"  总决策数: {stats['total_decisions']}")
+        print(f"  响应时间 P50/P90/P99: {stats['response_time_p50']:.2f}/{stats['response_time_p90']:.2f}/{stats['response_time_p99']:.2f}秒")
+        print(f"  手牌胜率: {stats['hand_win_rate']:.2%} ({stats['hands_played']} 手)")
+        print(f"  对局胜率: {stats['game_win_rate']:.2%} ({stats['games']} 局)")
+        print(f"  筹码变化: 总计 {stats['total_chip_delta']}, 平均每局 {stats['avg_chip_delta']:.1f}")
+        print(f"  行动分布:")
+        for action, rate in sorted(stats["action_rates"].items()):
+            print(f"    {action}: {stats['action_distribution'][action]} ({rate:.1%})")
+
+
 def print_analysis_example():
     """打印分析示例"""
     analyzer = LogAnalyzer()
@@ -207,7 +538,7 @@ def print_analysis_example():
 
     # 分析第一个日志
     for log_file in logs[:1]:  # 只分析第一个作为示例
-        game_id = log_file.replace("enhanced_poker_game_", "").replace(".json", "")
+        game_id = os.path.basename(log_file).replace("enhanced_poker_game_", "").replace(".json", "")
 
         print(f"\n分析游戏: {game_id}")
         print("="*80)
@@ -266,4 +597,13 @@ def print_analysis_example():
 
 
 if __name__ == "__main__":
-    print_analysis_example()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", action="store_true", help="汇总 log_dir 下所有对局的模型表现")
+    parser.add_argument("--log-dir", default="game_logs")
+    parser.add_argument("--workers", type=int, default=None, help="并行处理的进程数，默认使用全部CPU")
+    args = parser.parse_args()
+
+    if args.corpus:
+        print_corpus_summary(args.log_dir, max_workers=args.workers)
+    else:
+        print_analysis_example()
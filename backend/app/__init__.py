@@ -4,12 +4,11 @@ import asyncio
 import logging
 import os
 import sys
-import time
 from pathlib import Path
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional
 
 from dotenv import load_dotenv
-from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, HTTPException, Response, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 
 PROJECT_ROOT = Path(__file__).resolve().parents[2]
@@ -20,10 +19,14 @@ from .protocol import (
     ClientWsEnvelope,
     PlayerConfig,
     PlayerKind,
+    RoomInfo,
     StartGameRequest,
     StartGameResponse,
 )
-from .room_manager import RoomManager, default_players, serialize_table_snapshot
+from .fanout import HERO_STREAM, Outgoing, RoomBroadcast, encode_message
+from .room_manager import Room, RoomCapacityError, RoomManager, default_players, serialize_table_snapshot
+from log_writer import get_default_log_writer
+from live_stats import LiveWatcher
 
 logging.basicConfig(
     level=logging.INFO,
@@ -42,6 +45,8 @@ app.add_middleware(
 )
 
 room_manager = RoomManager(project_root=PROJECT_ROOT)
+# 服务长期运行：已结束对局的实时流读完即删除，只保留最近结束的 100 局的对局信息
+live_watcher = LiveWatcher(str(PROJECT_ROOT / "game_logs"), prune_finished=True, keep_finished=100)
 
 
 @app.on_event("startup")
@@ -51,17 +56,31 @@ async def _on_startup() -> None:
     logger.info("startup ok project_root=%s", PROJECT_ROOT)
 
 
+@app.on_event("shutdown")
+async def _on_shutdown() -> None:
+    # 先结束所有房间并等它们保存完日志，再写完后台队列中剩余的日志退出；
+    # 反过来的话，还在运行的房间写日志时写入器已关闭，牌局会以错误结束并丢失最终日志
+    pending = room_manager.shutdown()
+    if pending:
+        await asyncio.wait([asyncio.wrap_future(f) for f in pending], timeout=10.0)
+    await asyncio.to_thread(get_default_log_writer().close, 10.0)
+    logger.info("shutdown log_writer=%s", get_default_log_writer().stats())
+
+
 @app.get("/health")
 async def health() -> Dict[str, Any]:
-    return {"ok": True}
+    return {"ok": True, "log_writer": get_default_log_writer().stats(), "rooms": room_manager.stats()}
 
 
-@app.post("/start", response_model=StartGameResponse)
-async def start_game(req: StartGameRequest) -> StartGameResponse:
-    initial_chips = req.initial_chips if req.initial_chips is not None else int(os.getenv("INITIAL_CHIPS", "1000"))
-    small_blind = req.small_blind if req.small_blind is not None else int(os.getenv("SMALL_BLIND", "5"))
-    big_blind = req.big_blind if req.big_blind is not None else int(os.getenv("BIG_BLIND", "10"))
-    num_hands = req.num_hands if req.num_hands is not None else int(os.getenv("NUM_HANDS", "10"))
+@app.get("/live_stats")
+async def live_stats() -> Dict[str, Any]:
+    """进行中及已结束对局的实时模型统计（增量读取 game_logs/live/ 下的实时流）"""
+    return await asyncio.to_thread(live_watcher.snapshot)
+
+
+def _players_for_request(req: StartGameRequest) -> List[PlayerConfig]:
+    if req.opponents == "random_bot":
+        return default_players(req.human_name)
 
     openai_api_key = os.getenv("OPENAI_API_KEY")
     openai_base_url = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
@@ -92,139 +111,244 @@ async def start_game(req: StartGameRequest) -> StartGameResponse:
                 base_url=anthropic_base_url,
             )
         )
+    return players
+
+
+def _start_room(req: StartGameRequest, single: bool) -> StartGameResponse:
+    initial_chips = req.initial_chips if req.initial_chips is not None else int(os.getenv("INITIAL_CHIPS", "1000"))
+    small_blind = req.small_blind if req.small_blind is not None else int(os.getenv("SMALL_BLIND", "5"))
+    big_blind = req.big_blind if req.big_blind is not None else int(os.getenv("BIG_BLIND", "10"))
+    num_hands = req.num_hands if req.num_hands is not None else int(os.getenv("NUM_HANDS", "10"))
+    players = _players_for_request(req)
+    config = {
+        "small_blind": small_blind,
+        "big_blind": big_blind,
+        "initial_chips": initial_chips,
+        "num_hands": num_hands,
+        "hero_name": req.human_name,
+        "seed": req.seed,
+    }
 
     try:
-        room = room_manager.start_single_game(
-            {
-                "small_blind": small_blind,
-                "big_blind": big_blind,
-                "initial_chips": initial_chips,
-                "num_hands": num_hands,
-                "hero_name": req.human_name,
-            },
-            players,
-        )
+        room = room_manager.start_single_game(config, players) if single else room_manager.start_game(config, players)
+    except RoomCapacityError as e:
+        # 运行中的房间数已达上限：拒绝而不是排队，客户端稍后重试
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     except ValueError as e:
-        if str(e) == "game already running":
-            raise HTTPException(status_code=409, detail=str(e))
         raise HTTPException(status_code=400, detail=str(e))
 
-    logger.info("single_game_started room_id=%s hero=%s", room.room_id, room.hero_name)
-    return StartGameResponse(hero_token=room.hero_token, status=room.status, ws_url=f"/ws?token={room.hero_token}")
+    logger.info("game_started room_id=%s hero=%s", room.room_id, room.hero_name)
+    return StartGameResponse(
+        room_id=room.room_id,
+        hero_token=room.hero_token,
+        status=room.status,
+        ws_url=f"/rooms/{room.room_id}/ws?token={room.hero_token}",
+    )
 
 
-@app.post("/actions")
-async def submit_action(token: str, payload: Dict[str, Any]) -> Dict[str, Any]:
-    r = room_manager.get_active_room()
+def _room_or_404(room_id: str) -> Room:
+    r = room_manager.get_room(room_id)
     if not r:
-        raise HTTPException(status_code=404, detail="game not started")
+        raise HTTPException(status_code=404, detail="room not found")
+    return r
+
+
+def _legacy_room(token: Optional[str]) -> Optional[Room]:
+    """旧版不带 room_id 的接口：有 token 时按 token 找房间，否则使用最近一次 /start 的房间"""
+    if token:
+        r = room_manager.find_room_by_token(token)
+        if r:
+            return r
+    return room_manager.get_active_room()
+
+
+def _submit_action(r: Room, token: str, payload: Dict[str, Any]) -> Dict[str, Any]:
     try:
-        room_manager.submit_hero_action(r.room_id, token, payload)
+        result = room_manager.submit_hero_action(r.room_id, token, payload)
     except ValueError as e:
         msg = str(e)
         if msg == "unauthorized":
             raise HTTPException(status_code=401, detail=msg)
         raise HTTPException(status_code=400, detail=msg)
-    return {"ok": True}
+    return {"ok": True, **result}
+
+
+def _snapshot_text(r: Room, stream: str, **extra: Any) -> str:
+    """某条流最近一次发布的完整状态（带 version）编码成的 STATE_SNAPSHOT 消息，seq 与流上的位置一致
+
+    同一版本的快照 payload 只编码一次，之后的 /snapshot、连接建立和 REQUEST_SNAPSHOT 直接复用
+    """
+    text = r.broadcast.snapshot_message(stream, **extra)
+    if text is not None:
+        return text
+    # 牌局还没发布过状态：现场序列化一次，不缓存
+    state: Dict[str, Any] = {}
+    if r.controller:
+        state = {**serialize_table_snapshot(r.controller, r.hero_name, reveal_hero_hand=stream == HERO_STREAM), "version": 0}
+    return encode_message({**r.broadcast.envelope("STATE_SNAPSHOT", state, stream), **extra})
+
+
+def _snapshot(r: Room, token: Optional[str]) -> Response:
+    if token is not None and not room_manager.validate_token(r.room_id, token):
+        raise HTTPException(status_code=401, detail="unauthorized")
+    stream = RoomBroadcast.stream_for(token is not None)
+    return Response(content=_snapshot_text(r, stream, status=r.status.value), media_type="application/json")
+
+
+def _room_info(r: Room) -> RoomInfo:
+    return RoomInfo(
+        room_id=r.room_id,
+        hero_name=r.hero_name,
+        status=r.status,
+        created_at=r.created_at,
+        hand_number=r.controller.table.hand_number if r.controller else 0,
+    )
+
+
+@app.get("/rooms", response_model=List[RoomInfo])
+async def list_rooms() -> List[RoomInfo]:
+    return [_room_info(r) for r in room_manager.list_rooms()]
+
+
+@app.post("/rooms", response_model=StartGameResponse)
+async def create_room(req: StartGameRequest) -> StartGameResponse:
+    return _start_room(req, single=False)
+
+
+@app.get("/rooms/{room_id}", response_model=RoomInfo)
+async def get_room(room_id: str) -> RoomInfo:
+    return _room_info(_room_or_404(room_id))
+
+
+@app.post("/rooms/{room_id}/actions")
+async def submit_room_action(room_id: str, token: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    return _submit_action(_room_or_404(room_id), token, payload)
+
+
+@app.get("/rooms/{room_id}/snapshot")
+async def get_room_snapshot(room_id: str, token: Optional[str] = None) -> Response:
+    return _snapshot(_room_or_404(room_id), token)
+
+
+@app.get("/rooms/{room_id}/metrics")
+async def get_room_metrics(room_id: str) -> Dict[str, Any]:
+    """房间的 WebSocket 扇出指标：连接数、发送延迟、队列深度和慢连接处理次数"""
+    return _room_or_404(room_id).broadcast.stats()
+
+
+@app.websocket("/rooms/{room_id}/ws")
+async def ws_room(
+    websocket: WebSocket, room_id: str, token: Optional[str] = None, last_seq: Optional[int] = None
+) -> None:
+    r = room_manager.get_room(room_id)
+    if not r:
+        await websocket.close(code=1008)
+        return
+    await _serve_ws(websocket, r, token, last_seq)
+
+
+@app.post("/start", response_model=StartGameResponse)
+async def start_game(req: StartGameRequest) -> StartGameResponse:
+    return _start_room(req, single=True)
+
+
+@app.post("/actions")
+async def submit_action(token: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    r = _legacy_room(token)
+    if not r:
+        raise HTTPException(status_code=404, detail="game not started")
+    return _submit_action(r, token, payload)
 
 
 @app.get("/snapshot")
-async def get_snapshot(token: Optional[str] = None) -> Dict[str, Any]:
-    r = room_manager.get_active_room()
+async def get_snapshot(token: Optional[str] = None) -> Response:
+    r = _legacy_room(token)
     if not r:
         raise HTTPException(status_code=404, detail="game not started")
-    if token is not None and not room_manager.validate_token(r.room_id, token):
-        raise HTTPException(status_code=401, detail="unauthorized")
-    reveal_hero_hand = token is not None and room_manager.validate_token(r.room_id, token)
-    payload = serialize_table_snapshot(r.controller, r.hero_name, reveal_hero_hand=reveal_hero_hand) if r.controller else {}
-    return {"type": "STATE_SNAPSHOT", "seq": r.next_seq(), "ts": time.time(), "payload": payload, "status": r.status}
+    return _snapshot(r, token)
 
 
 @app.websocket("/ws")
-async def ws_game(websocket: WebSocket, token: Optional[str] = None) -> None:
-    r = room_manager.get_active_room()
+async def ws_game(websocket: WebSocket, token: Optional[str] = None, last_seq: Optional[int] = None) -> None:
+    r = _legacy_room(token)
     if not r:
         await websocket.close(code=1008)
         return
+    await _serve_ws(websocket, r, token, last_seq)
+
 
+async def _serve_ws(websocket: WebSocket, r: Room, token: Optional[str], last_seq: Optional[int] = None) -> None:
     hero_authed = token is not None and room_manager.validate_token(r.room_id, token)
     await websocket.accept()
-    await r.broadcast.add(websocket, is_hero=hero_authed)
-    logger.info("ws_connected single room_id=%s hero_authed=%s", r.room_id, hero_authed)
+    stream = r.broadcast.add(websocket, is_hero=hero_authed)
+    logger.info("ws_connected room_id=%s hero_authed=%s", r.room_id, hero_authed)
+
+    def snapshot_messages() -> List[Any]:
+        # 快照取的是流上最近发布的版本，seq 为流的当前位置：之后的 STATE_DELTA 恰好以它为 base_version
+        version = r.broadcast.views[stream].version
+        messages: List[Any] = [Outgoing(text=_snapshot_text(r, stream), type="STATE_SNAPSHOT", version=version)]
+        request = r.last_action_request
+        if hero_authed and request:
+            # 重发的动作请求带上当前的剩余时间
+            if request.get("clock") and r.hero_player:
+                request = {**request, "clock": r.hero_player.clock.status()}
+            messages.append(r.broadcast.envelope("ACTION_REQUEST", request, stream))
+        return messages
+
+    def reply(type_: str, payload: Dict[str, Any]) -> None:
+        r.broadcast.send_direct(websocket, r.broadcast.envelope(type_, payload, stream))
+
+    def resume(from_seq: int) -> None:
+        # 查缓冲区和入队都在事件循环上同步完成，中间不会插入新的广播
+        if not r.broadcast.resume(websocket, from_seq):
+            r.broadcast.send_direct(websocket, *snapshot_messages())
 
     try:
         if r.controller:
-            await websocket.send_json(
-                {
-                    "type": "STARTED",
-                    "seq": r.next_seq(),
-                    "ts": time.time(),
-                    "payload": {"hero": hero_authed},
-                }
-            )
-            await websocket.send_json(
-                {
-                    "type": "STATE_SNAPSHOT",
-                    "seq": r.next_seq(),
-                    "ts": time.time(),
-                    "payload": serialize_table_snapshot(r.controller, r.hero_name, reveal_hero_hand=hero_authed),
-                }
-            )
-            if hero_authed and r.last_action_request:
-                await websocket.send_json(
-                    {
-                        "type": "ACTION_REQUEST",
-                        "seq": r.next_seq(),
-                        "ts": time.time(),
-                        "payload": r.last_action_request,
-                    }
-                )
+            if last_seq is None:
+                r.broadcast.send_direct(websocket, r.broadcast.envelope("STARTED", {"hero": hero_authed}, stream), *snapshot_messages())
+            else:
+                # 重连：带上断线前收到的最后一个 seq，只补发错过的广播，超出缓冲区时退回完整快照；
+                # STARTED 排在补发的消息之前，seq 取续传的起点，客户端不会误判为跳号
+                started = r.broadcast.envelope("STARTED", {"hero": hero_authed, "resume_from": last_seq}, stream, seq=last_seq)
+                r.broadcast.send_direct(websocket, started)
+                resume(last_seq)
         while True:
             raw = await websocket.receive_json()
             try:
                 msg = ClientWsEnvelope.model_validate(raw)
             except Exception:
-                await websocket.send_json({"type": "ERROR", "payload": {"error": "invalid message"}})
+                reply("ERROR", {"error": "invalid message"})
                 continue
 
             if msg.type == "PING":
-                await websocket.send_json({"type": "PONG", "seq": r.next_seq(), "ts": time.time(), "payload": {}})
+                reply("PONG", {})
                 continue
 
             if msg.type == "REQUEST_SNAPSHOT":
                 if r.controller:
-                    await websocket.send_json(
-                        {
-                            "type": "STATE_SNAPSHOT",
-                            "seq": r.next_seq(),
-                            "ts": time.time(),
-                            "payload": serialize_table_snapshot(r.controller, r.hero_name, reveal_hero_hand=hero_authed),
-                        }
-                    )
-                    if hero_authed and r.last_action_request:
-                        await websocket.send_json(
-                            {
-                                "type": "ACTION_REQUEST",
-                                "seq": r.next_seq(),
-                                "ts": time.time(),
-                                "payload": r.last_action_request,
-                            }
-                        )
+                    r.broadcast.send_direct(websocket, *snapshot_messages())
+                continue
+
+            if msg.type == "RESUME":
+                from_seq = msg.payload.get("last_seq")
+                if not isinstance(from_seq, int) or isinstance(from_seq, bool):
+                    reply("ERROR", {"error": "invalid last_seq"})
+                    continue
+                if r.controller:
+                    resume(from_seq)
                 continue
 
             if msg.type == "USER_ACTION":
                 if not hero_authed or not token:
-                    await websocket.send_json({"type": "ERROR", "payload": {"error": "unauthorized"}})
+                    reply("ERROR", {"error": "unauthorized"})
                     continue
                 try:
-                    room_manager.submit_hero_action(r.room_id, token, msg.payload)
-                    await websocket.send_json({"type": "ACK", "seq": r.next_seq(), "ts": time.time(), "payload": {}})
+                    reply("ACK", room_manager.submit_hero_action(r.room_id, token, msg.payload))
                 except ValueError as e:
-                    await websocket.send_json(
-                        {"type": "ERROR", "seq": r.next_seq(), "ts": time.time(), "payload": {"error": str(e)}}
-                    )
+                    reply("ERROR", {"error": str(e)})
                 continue
     except WebSocketDisconnect:
         return
     finally:
-        await r.broadcast.remove(websocket)
+        r.broadcast.remove(websocket)
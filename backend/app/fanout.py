@@ -0,0 +1,376 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, replace
+from typing import Any, Callable, Deque, Dict, Optional, Tuple, Union
+
+from .state_sync import ViewState
+
+logger = logging.getLogger("poker_backend")
+
+PUBLIC_STREAM = "public"
+HERO_STREAM = "hero"
+STREAMS = (PUBLIC_STREAM, HERO_STREAM)
+
+STATE_TYPES = ("STATE_SNAPSHOT", "STATE_DELTA")
+SLOW_CONSUMER_POLICIES = ("drop_state", "disconnect")
+DEFAULT_SEND_QUEUE_LIMIT = 256
+DEFAULT_RESUME_BUFFER = 512
+DEFAULT_STATE_WINDOW = 0.05
+# 这些事件发布前先把合并中的状态发出去：hero 决策和对局结束都需要看到最新的桌面
+FLUSH_STATE_BEFORE = ("ACTION_REQUEST", "GAME_END", "ROOM_IDLE")
+SLOW_CONSUMER_CLOSE_CODE = 1013  # Try Again Later：客户端应重连并重新同步
+LATENCY_SAMPLES = 2048
+
+
+def encode_message(msg: Dict[str, Any]) -> str:
+    # 与 WebSocket.send_json 的编码方式一致
+    return json.dumps(msg, separators=(",", ":"), ensure_ascii=False)
+
+
+def encode_envelope(type_: str, seq: int, payload_text: str, **extra: Any) -> str:
+    """用已编码好的 payload 拼出消息，结果与 encode_message 编码同样的 dict 一致（type_ 为协议里的消息类型，不需要转义）"""
+    tail = "".join(f",{encode_message(k)}:{encode_message(v)}" for k, v in extra.items())
+    return f'{{"type":"{type_}","seq":{seq},"ts":{time.time()!r},"payload":{payload_text}{tail}}}'
+
+
+@dataclass
+class Outgoing:
+    """已编码的待发送消息；同一条广播在一条流上只编码一次，所有连接共享同一个字符串"""
+    text: Optional[str]  # None 表示“发送时重新生成快照”的标记
+    type: str
+    version: int = 0
+    published_at: float = 0.0
+    seq: int = 0
+
+
+class ClientConnection:
+    """一个 WebSocket 连接的发送端：有界队列加独立的发送任务，慢连接只会拖慢自己"""
+
+    def __init__(self, ws: Any, stream: str, broadcast: "RoomBroadcast"):
+        self.ws = ws
+        self.stream = stream
+        self._broadcast = broadcast
+        self._queue: Deque[Outgoing] = deque()
+        self._wakeup = asyncio.Event()
+        self._resync_pending = False
+        self._skip_state_until = 0  # 重新同步的快照已覆盖这个版本及之前的状态消息
+        self._closing = False
+        self._close_code = 1000
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    @property
+    def depth(self) -> int:
+        return len(self._queue)
+
+    def offer(self, item: Outgoing) -> None:
+        """放入一条消息，队列已满时按房间的慢连接策略处理"""
+        if self._closing:
+            return
+        if len(self._queue) >= self._broadcast.queue_limit and not self._make_room(item):
+            return
+        if item.type in STATE_TYPES and self._resync_pending:
+            # 排队中的重新同步快照在发送时才生成，会包含这次状态变化
+            self._broadcast.dropped += 1
+            return
+        self._queue.append(item)
+        self._broadcast.peak_depth = max(self._broadcast.peak_depth, len(self._queue))
+        self._wakeup.set()
+
+    def _make_room(self, item: Outgoing) -> bool:
+        """drop_state 策略下丢掉队列中的状态消息，用一次重新同步的快照代替；离散事件从不丢弃，仍然放不下时断开连接"""
+        if self._broadcast.slow_consumer_policy == "drop_state":
+            kept = deque(q for q in self._queue if q.type not in STATE_TYPES)
+            dropped = len(self._queue) - len(kept)
+            if dropped or item.type in STATE_TYPES:
+                self._queue = kept
+                self._broadcast.dropped += dropped
+                if not self._resync_pending:
+                    self._resync_pending = True
+                    self._broadcast.resyncs += 1
+                    self._queue.append(Outgoing(text=None, type="STATE_SNAPSHOT"))
+            # 状态消息不会入队（由快照代替），只要快照标记放得下即可
+            if len(self._queue) < self._broadcast.queue_limit or (
+                item.type in STATE_TYPES and len(self._queue) <= self._broadcast.queue_limit
+            ):
+                return True
+        self.close(SLOW_CONSUMER_CLOSE_CODE)
+        return False
+
+    def close(self, code: int) -> None:
+        """丢弃未发送的消息并在发送任务中关闭连接"""
+        if self._closing:
+            return
+        self._closing = True
+        self._queue.clear()
+        self._close_code = code
+        self._broadcast.disconnects += 1
+        logger.info("ws_slow_consumer_closed stream=%s code=%s", self.stream, code)
+        self._wakeup.set()
+
+    def finish(self, code: int = 1000) -> None:
+        """发完已排队的消息后关闭连接，之后的广播不再发给它"""
+        if self._closing:
+            return
+        self._closing = True
+        self._close_code = code
+        self._wakeup.set()
+
+    def cancel(self) -> None:
+        self._task.cancel()
+
+    async def _run(self) -> None:
+        try:
+            while True:
+                if not self._queue:
+                    if self._closing:
+                        await self.ws.close(code=self._close_code)
+                        return
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                    continue
+                item = self._queue.popleft()
+                if item.text is None:
+                    self._resync_pending = False
+                    self._skip_state_until = self._broadcast.views[self.stream].version
+                    text = self._broadcast.snapshot_message(self.stream)
+                    if text is None:
+                        continue
+                elif item.type in STATE_TYPES and item.version <= self._skip_state_until:
+                    continue
+                else:
+                    text = item.text
+                await self.ws.send_text(text)
+                if item.published_at:
+                    self._broadcast.record_latency(time.perf_counter() - item.published_at)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # 连接已断开：接收循环会收到断开并把连接移除
+            self._queue.clear()
+            self._closing = True
+
+
+class StateCoalescer:
+    """状态发布的节流：距上次发布超过窗口时立即发布，窗口内的多次变化合并为窗口结束时的最新一次
+
+    离散事件不经过这里，照常按顺序立即发布；window 为 0 时每次变化都立即发布
+    """
+
+    def __init__(self, window: float = DEFAULT_STATE_WINDOW):
+        self.window = window
+        self._pending: Optional[Callable[[], None]] = None
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._last_flush = float("-inf")
+        self.requested = 0
+        self.flushed = 0
+
+    @property
+    def coalesced(self) -> int:
+        """被合并掉、没有单独发布的状态变化次数"""
+        return self.requested - self.flushed - (self._pending is not None)
+
+    def request(self, flush: Callable[[], None]) -> None:
+        """登记一次状态变化，flush 负责序列化并发布当前状态；只有最新登记的 flush 会被调用"""
+        self.requested += 1
+        self._pending = flush
+        if self._timer is not None:
+            return
+        delay = self._last_flush + self.window - time.monotonic()
+        if delay <= 0:
+            self.flush_pending()
+        else:
+            self._timer = asyncio.get_running_loop().call_later(delay, self.flush_pending)
+
+    def flush_pending(self) -> None:
+        """立即发布合并中的状态（没有待发布的状态时什么也不做）"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        flush, self._pending = self._pending, None
+        if flush is None:
+            return
+        self._last_flush = time.monotonic()
+        self.flushed += 1
+        flush()
+
+    def cancel(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._pending = None
+
+
+class RoomBroadcast:
+    """房间的两条输出流：公开流发给观众，hero 流发给持有 token 的连接
+
+    每条流有自己连续递增的 seq，客户端发现 seq 跳号即可知道丢了消息（重新请求快照）；
+    直接回复某个连接的消息（STARTED、ACK、PONG、快照等）不占用 seq，带的是该流当前的位置。
+    每条消息在每条流上只编码一次，再放进各连接自己的有界发送队列，由各自的发送任务并发发出。
+    每条流还保留最近 resume_buffer 条已编码的广播，重连的客户端带上 last_seq 即可只补收错过的消息。
+    状态更新经过 coalescer 节流，机器人连续行动时只发布窗口内最新的状态。
+    """
+
+    def __init__(
+        self,
+        queue_limit: int = DEFAULT_SEND_QUEUE_LIMIT,
+        slow_consumer_policy: str = "drop_state",
+        resume_buffer: int = DEFAULT_RESUME_BUFFER,
+        state_window: float = DEFAULT_STATE_WINDOW,
+    ):
+        if slow_consumer_policy not in SLOW_CONSUMER_POLICIES:
+            raise ValueError(f"unknown slow consumer policy: {slow_consumer_policy}")
+        self.queue_limit = queue_limit
+        self.slow_consumer_policy = slow_consumer_policy
+        self.views: Dict[str, ViewState] = {stream: ViewState() for stream in STREAMS}
+        self._connections: Dict[Any, ClientConnection] = {}
+        self._seq: Dict[str, int] = {stream: 0 for stream in STREAMS}
+        self._history: Dict[str, Deque[Outgoing]] = {stream: deque(maxlen=resume_buffer) for stream in STREAMS}
+        self._snapshot_cache: Dict[str, Tuple[int, str]] = {}  # stream -> (version, 已编码的快照 payload)
+        self.coalescer = StateCoalescer(state_window)
+        self._latencies: Deque[float] = deque(maxlen=LATENCY_SAMPLES)
+        self.published = 0
+        self.peak_depth = 0
+        self.dropped = 0
+        self.resyncs = 0
+        self.disconnects = 0
+        self.resumes = 0
+        self.resume_fallbacks = 0
+        self.snapshot_encodes = 0
+        self.snapshot_hits = 0
+
+    @staticmethod
+    def stream_for(is_hero: bool) -> str:
+        return HERO_STREAM if is_hero else PUBLIC_STREAM
+
+    def add(self, ws: Any, is_hero: bool = False) -> str:
+        """注册连接并启动它的发送任务，必须在事件循环上调用"""
+        stream = self.stream_for(is_hero)
+        self._connections[ws] = ClientConnection(ws, stream, self)
+        return stream
+
+    def remove(self, ws: Any) -> None:
+        conn = self._connections.pop(ws, None)
+        if conn:
+            conn.cancel()
+
+    def close_all(self, code: int = 1000) -> None:
+        """房间不再有后续消息时关闭所有连接，已排队的消息照常发完"""
+        for conn in list(self._connections.values()):
+            conn.finish(code)
+
+    @property
+    def connection_count(self) -> int:
+        return len(self._connections)
+
+    def envelope(self, type_: str, payload: Dict[str, Any], stream: str, seq: Optional[int] = None) -> Dict[str, Any]:
+        """直接回复用的消息，seq 默认为流的当前位置（不递增）"""
+        return {"type": type_, "seq": self._seq[stream] if seq is None else seq, "ts": time.time(), "payload": payload}
+
+    def snapshot_payload(self, stream: str) -> Optional[str]:
+        """流上当前版本的快照 payload（已编码），同一版本只编码一次；还没有发布过状态时返回 None"""
+        view = self.views[stream]
+        if view.state is None:
+            return None
+        cached = self._snapshot_cache.get(stream)
+        if cached and cached[0] == view.version:
+            self.snapshot_hits += 1
+            return cached[1]
+        text = encode_message(view.snapshot())
+        self._snapshot_cache[stream] = (view.version, text)
+        self.snapshot_encodes += 1
+        return text
+
+    def snapshot_message(self, stream: str, **extra: Any) -> Optional[str]:
+        """完整的 STATE_SNAPSHOT 消息，seq 为流的当前位置，extra 是附加在消息顶层的字段"""
+        payload = self.snapshot_payload(stream)
+        if payload is None:
+            return None
+        return encode_envelope("STATE_SNAPSHOT", self._seq[stream], payload, **extra)
+
+    def publish(self, type_: str, payload: Dict[str, Any], stream: Optional[str] = None) -> None:
+        """在一条流（默认两条都发）上分配 seq、编码一次并放入该流所有连接的发送队列"""
+        if type_ in FLUSH_STATE_BEFORE:
+            self.coalescer.flush_pending()
+        now = time.perf_counter()
+        version = payload.get("version", 0) if type_ in STATE_TYPES else 0
+        for name in (stream,) if stream else STREAMS:
+            self._seq[name] += 1
+            msg = {"type": type_, "seq": self._seq[name], "ts": time.time(), "payload": payload}
+            item = Outgoing(text=encode_message(msg), type=type_, version=version, published_at=now, seq=self._seq[name])
+            self._history[name].append(item)
+            self.published += 1
+            for conn in list(self._connections.values()):
+                if conn.stream == name:
+                    conn.offer(item)
+
+    def send_direct(self, ws: Any, *messages: Union[Dict[str, Any], Outgoing]) -> None:
+        """直接回复某个连接，与广播消息排在同一个发送队列里，保持先后顺序；消息可以是 dict 或已编码的 Outgoing"""
+        conn = self._connections.get(ws)
+        if conn:
+            for msg in messages:
+                if isinstance(msg, Outgoing):
+                    conn.offer(msg)
+                    continue
+                version = msg["payload"].get("version", 0) if msg["type"] in STATE_TYPES else 0
+                conn.offer(Outgoing(text=encode_message(msg), type=msg["type"], version=version))
+
+    def resume(self, ws: Any, last_seq: int) -> bool:
+        """把连接所在流上 last_seq 之后的广播从缓冲区补发给它；缓冲区已覆盖不到这段区间时返回 False，由调用方改发快照"""
+        conn = self._connections.get(ws)
+        if conn is None:
+            return False
+        history = self._history[conn.stream]
+        current = self._seq[conn.stream]
+        oldest = history[0].seq if history else current + 1
+        if last_seq > current or last_seq < oldest - 1:
+            self.resume_fallbacks += 1
+            return False
+        for item in history:
+            if item.seq > last_seq:
+                # 补发的消息不计入扇出延迟
+                conn.offer(replace(item, published_at=0.0))
+        self.resumes += 1
+        return True
+
+    def record_latency(self, seconds: float) -> None:
+        self._latencies.append(seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        """扇出指标：从发布到写入各连接的延迟（最近 LATENCY_SAMPLES 次）、发送队列深度和慢连接处理次数"""
+        latencies = sorted(self._latencies)
+
+        def pct(q: float) -> float:
+            return latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000 if latencies else 0.0
+
+        depths = [conn.depth for conn in self._connections.values()]
+        return {
+            "connections": {stream: sum(c.stream == stream for c in self._connections.values()) for stream in STREAMS},
+            "seq": dict(self._seq),
+            "published": self.published,
+            "fanout_latency_ms": {"p50": pct(0.5), "p99": pct(0.99), "max": latencies[-1] * 1000 if latencies else 0.0},
+            "queue_depth": {
+                "current_max": max(depths, default=0),
+                "current_total": sum(depths),
+                "peak": self.peak_depth,
+                "limit": self.queue_limit,
+            },
+            "slow_consumer_policy": self.slow_consumer_policy,
+            "dropped_state_messages": self.dropped,
+            "resyncs": self.resyncs,
+            "disconnects": self.disconnects,
+            "resume_buffer": {stream: len(history) for stream, history in self._history.items()},
+            "resumes": self.resumes,
+            "resume_fallbacks": self.resume_fallbacks,
+            "snapshot_cache": {"encodes": self.snapshot_encodes, "hits": self.snapshot_hits},
+            "state_coalescing": {
+                "window_ms": self.coalescer.window * 1000,
+                "state_changes": self.coalescer.requested,
+                "state_publishes": self.coalescer.flushed,
+                "coalesced": self.coalescer.coalesced,
+            },
+        }
@@ -11,6 +11,7 @@ class RoomStatus(str, Enum):
     running = "running"
     finished = "finished"
     error = "error"
+    idle = "idle"  # hero 连续超时未行动，牌局提前结束
 
 
 class PlayerKind(str, Enum):
@@ -29,6 +30,7 @@ class PlayerConfig(BaseModel):
 
 
 ViewMode = Literal["debug", "user"]
+OpponentsMode = Literal["llm", "random_bot"]
 
 
 class StartGameRequest(BaseModel):
@@ -38,24 +40,38 @@ class StartGameRequest(BaseModel):
     small_blind: Optional[int] = None
     big_blind: Optional[int] = None
     num_hands: Optional[int] = None
+    seed: Optional[int] = None
+    opponents: OpponentsMode = "llm"
 
 
 class StartGameResponse(BaseModel):
+    room_id: str
     hero_token: str
     status: RoomStatus
     ws_url: str
 
 
+class RoomInfo(BaseModel):
+    room_id: str
+    hero_name: str
+    status: RoomStatus
+    created_at: float
+    hand_number: int = 0
+
+
 WsType = Literal[
     "STATE_SNAPSHOT",
+    "STATE_DELTA",
     "HAND_START",
     "STREET_DEALT",
     "ACTION_REQUEST",
     "ACTION_TAKEN",
+    "ACTION_TIMEOUT",
     "SHOWDOWN_REVEAL",
     "POT_AWARD",
     "HAND_RESULT",
     "GAME_END",
+    "ROOM_IDLE",
     "STARTED",
     "ACK",
     "PONG",
@@ -70,7 +86,7 @@ class WsEnvelope(BaseModel):
     payload: Dict[str, Any] = Field(default_factory=dict)
 
 
-ClientWsType = Literal["USER_ACTION", "REQUEST_SNAPSHOT", "PING"]
+ClientWsType = Literal["USER_ACTION", "REQUEST_SNAPSHOT", "RESUME", "PING"]
 
 
 class ClientWsEnvelope(BaseModel):
@@ -2,25 +2,48 @@ from __future__ import annotations
 
 import asyncio
 import logging
+import os
 import queue
 import secrets
 import threading
 import time
 import uuid
+from concurrent.futures import Future
 from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Awaitable, Callable, Dict, List, Optional
 
 from engine_info import Action
+from game_events import ActionTakenEvent, HandStartedEvent, PotAwardedEvent, ShowdownEvent, StreetDealtEvent
 from game_info import GameInfoState, GamePlayerAction
 from game_controller import GameController
+from log_writer import get_default_log_writer
 
+from .fanout import DEFAULT_RESUME_BUFFER, DEFAULT_SEND_QUEUE_LIMIT, DEFAULT_STATE_WINDOW, HERO_STREAM, PUBLIC_STREAM, RoomBroadcast
 from .protocol import PlayerConfig, PlayerKind, RoomStatus
-from .web_players import RandomBotPlayer, WebHumanPlayer, parse_user_action
+from .web_players import (
+    DEFAULT_ACTION_TIMEOUT,
+    DEFAULT_MAX_TIMEOUTS,
+    DEFAULT_TIME_BANK,
+    ActionClock,
+    RandomBotPlayer,
+    RoomClosedError,
+    RoomIdleError,
+    WebHumanPlayer,
+    parse_user_action,
+)
 
 logger = logging.getLogger("poker_backend")
 
 
+DEFAULT_MAX_ROOMS = 2000
+FINISHED_ROOM_TTL = 600.0
+
+
+class RoomCapacityError(RuntimeError):
+    """运行中的房间数已达上限，新房间需要稍后重试"""
+
+
 def now_ts() -> float:
     return time.time()
 
@@ -55,37 +78,14 @@ def serialize_table_snapshot(controller: GameController, hero_name: str, reveal_
     }
 
 
-class RoomBroadcast:
-    def __init__(self):
-        self._lock = asyncio.Lock()
-        self._sockets: set[Any] = set()
-        self._hero_sockets: set[Any] = set()
-
-    async def add(self, ws: Any, is_hero: bool = False) -> None:
-        async with self._lock:
-            self._sockets.add(ws)
-            if is_hero:
-                self._hero_sockets.add(ws)
-
-    async def remove(self, ws: Any) -> None:
-        async with self._lock:
-            self._sockets.discard(ws)
-            self._hero_sockets.discard(ws)
-
-    async def broadcast_json(self, data: Dict[str, Any], only_hero: bool = False) -> None:
-        async with self._lock:
-            sockets = list(self._hero_sockets if only_hero else self._sockets)
-        to_remove = []
-        for ws in sockets:
-            try:
-                await ws.send_json(data)
-            except Exception:
-                to_remove.append(ws)
-        if to_remove:
-            async with self._lock:
-                for ws in to_remove:
-                    self._sockets.discard(ws)
-                    self._hero_sockets.discard(ws)
+def with_hero_hand(state: Dict[str, Any], controller: GameController, hero_name: str) -> Dict[str, Any]:
+    """在公开视角的状态上补上 hero 的手牌，得到 hero 视角的状态（不必再序列化一遍整张桌子）"""
+    hero = next((p for p in controller.table.players if p.name == hero_name), None)
+    if not hero or not hero.hand:
+        return state
+    hand = [str(c) for c in hero.hand]
+    players = [{**p, "hand": hand} if p["name"] == hero_name else p for p in state["players"]]
+    return {**state, "players": players}
 
 
 @dataclass
@@ -96,33 +96,105 @@ class Room:
     config: Dict[str, Any]
     status: RoomStatus = RoomStatus.created
     created_at: float = field(default_factory=now_ts)
+    finished_at: Optional[float] = None
     broadcast: RoomBroadcast = field(default_factory=RoomBroadcast)
-    seq: int = 0
     last_error: Optional[str] = None
 
     controller: Optional[GameController] = None
-    engine_thread: Optional[threading.Thread] = None
+    engine_run: Optional[Callable[[], Awaitable[None]]] = None
+    engine_future: Optional[Future] = None
+    action_lock: threading.Lock = field(default_factory=threading.Lock)
     hero_action_queue: "queue.Queue" = field(default_factory=queue.Queue)
     hero_player: Optional[WebHumanPlayer] = None
-    hero_connected: threading.Event = field(default_factory=threading.Event)
     last_action_request: Optional[Dict[str, Any]] = None
+    synced_table_version: int = -1  # 最近一次发布状态时牌桌的 state_version
 
-    def next_seq(self) -> int:
-        self.seq += 1
-        return self.seq
+    @property
+    def engine_running(self) -> bool:
+        return self.engine_future is not None and not self.engine_future.done()
 
 
 class RoomManager:
-    def __init__(self, project_root: Path):
+    """管理多个并发房间；每个运行中的房间是服务事件循环上的一个协程，
+    等待人类动作和 LLM 响应时都不占用线程，运行中的房间数达到上限时拒绝新房间"""
+
+    def __init__(self, project_root: Path, max_rooms: Optional[int] = None, finished_room_ttl: float = FINISHED_ROOM_TTL):
         self._root = project_root
         self._rooms: Dict[str, Room] = {}
+        self._tokens: Dict[str, str] = {}  # hero_token -> room_id
         self._lock = threading.Lock()
         self._loop: Optional[asyncio.AbstractEventLoop] = None
         self._active_room_id: Optional[str] = None
+        self.max_rooms = max_rooms or int(os.getenv("MAX_ACTIVE_ROOMS", str(DEFAULT_MAX_ROOMS)))
+        self.finished_room_ttl = finished_room_ttl
+        self.send_queue_limit = int(os.getenv("WS_SEND_QUEUE_LIMIT", str(DEFAULT_SEND_QUEUE_LIMIT)))
+        self.slow_consumer_policy = os.getenv("WS_SLOW_CONSUMER_POLICY", "drop_state")
+        self.resume_buffer = int(os.getenv("WS_RESUME_BUFFER", str(DEFAULT_RESUME_BUFFER)))
+        self.state_window = float(os.getenv("WS_STATE_COALESCE_MS", str(DEFAULT_STATE_WINDOW * 1000))) / 1000
+        self.action_timeout = float(os.getenv("HUMAN_ACTION_TIMEOUT", str(DEFAULT_ACTION_TIMEOUT)))
+        self.time_bank = float(os.getenv("HUMAN_TIME_BANK", str(DEFAULT_TIME_BANK)))
+        self.max_timeouts = int(os.getenv("HUMAN_MAX_TIMEOUTS", str(DEFAULT_MAX_TIMEOUTS)))
+        # 实时统计流（game_logs/live/，供 /live_stats 使用）默认关闭
+        self.live_stream = os.getenv("LIVE_STATS_STREAM", "0").lower() in {"1", "true", "yes", "on"}
+        self._room_slots = threading.BoundedSemaphore(self.max_rooms)
+        self._rooms_running = 0
+        self._rejected = 0
 
     def set_loop(self, loop: asyncio.AbstractEventLoop) -> None:
         self._loop = loop
 
+    def shutdown(self) -> List[Future]:
+        """关闭所有运行中的房间：等待人类动作的牌局被唤醒后保存已打完的部分并结束，返回这些牌局的 Future"""
+        pending = []
+        for room in self.list_rooms():
+            if room.engine_running:
+                self.close_room(room.room_id)
+                pending.append(room.engine_future)
+        return pending
+
+    def close_room(self, room_id: str) -> None:
+        room = self.get_room(room_id)
+        if not room:
+            raise ValueError("room not found")
+        if room.hero_player:
+            room.hero_player.close()
+        else:
+            room.hero_action_queue.put(None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            statuses: Dict[str, int] = {}
+            for room in self._rooms.values():
+                statuses[room.status.value] = statuses.get(room.status.value, 0) + 1
+            return {
+                "rooms": len(self._rooms),
+                "by_status": statuses,
+                "max_active_rooms": self.max_rooms,
+                "rooms_running": self._rooms_running,
+                "rejected": self._rejected,
+                "ws_connections": sum(r.broadcast.connection_count for r in self._rooms.values()),
+                "ws_dropped_state": sum(r.broadcast.dropped for r in self._rooms.values()),
+                "ws_disconnects": sum(r.broadcast.disconnects for r in self._rooms.values()),
+                "ws_resumes": sum(r.broadcast.resumes for r in self._rooms.values()),
+                "ws_state_coalesced": sum(r.broadcast.coalescer.coalesced for r in self._rooms.values()),
+                "hero_timeouts": sum(r.hero_player.clock.timeouts for r in self._rooms.values() if r.hero_player),
+                "engine_event_errors": sum(r.controller.table.events.errors for r in self._rooms.values() if r.controller),
+            }
+
+    def _prune_finished(self) -> None:
+        """丢弃结束超过 finished_room_ttl 秒的房间"""
+        cutoff = now_ts() - self.finished_room_ttl
+        with self._lock:
+            expired = [
+                rid for rid, room in self._rooms.items()
+                if room.finished_at is not None and room.finished_at < cutoff and rid != self._active_room_id
+            ]
+            for rid in expired:
+                room = self._rooms.pop(rid)
+                self._tokens.pop(room.hero_token, None)
+        if expired:
+            logger.info("rooms_pruned count=%s", len(expired))
+
     def create_room(self, req: Dict[str, Any], players: List[PlayerConfig]) -> Room:
         room_id = str(uuid.uuid4())[:8]
         hero_name = req["hero_name"]
@@ -136,11 +208,14 @@ class RoomManager:
                 "big_blind": req["big_blind"],
                 "initial_chips": req["initial_chips"],
                 "num_hands": req["num_hands"],
+                "seed": req.get("seed"),
                 "players": [p.model_dump(exclude={"api_key"}) for p in players],
             },
+            broadcast=RoomBroadcast(self.send_queue_limit, self.slow_consumer_policy, self.resume_buffer, self.state_window),
         )
         with self._lock:
             self._rooms[room_id] = room
+            self._tokens[hero_token] = room_id
         self._prepare_engine(room, players)
         logger.info("engine_prepared room_id=%s hero=%s", room_id, hero_name)
         return room
@@ -158,51 +233,108 @@ class RoomManager:
             rid = self._active_room_id
         return self.get_room(rid) if rid else None
 
-    def start_single_game(self, req: Dict[str, Any], players: List[PlayerConfig]) -> Room:
+    def find_room_by_token(self, token: str) -> Optional[Room]:
         with self._lock:
-            rid = self._active_room_id
-            active = self._rooms.get(rid) if rid else None
-            if active and active.engine_thread and active.engine_thread.is_alive():
-                raise ValueError("game already running")
+            rid = self._tokens.get(token)
+        return self.get_room(rid) if rid else None
+
+    def start_game(self, req: Dict[str, Any], players: List[PlayerConfig]) -> Room:
+        """创建并启动一个新房间，运行中的房间数已达上限时抛出 RoomCapacityError"""
+        self._prune_finished()
+        if not self._room_slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            raise RoomCapacityError("too many active rooms")
+        try:
+            room = self.create_room(req, players)
+            self._submit_engine(room)
+        except Exception:
+            self._room_slots.release()
+            raise
+        return room
 
-        room = self.create_room(req, players)
+    def start_single_game(self, req: Dict[str, Any], players: List[PlayerConfig]) -> Room:
+        """旧版单房间接口：启动新房间并把它设为不带 room_id/token 的请求默认访问的房间"""
+        room = self.start_game(req, players)
         with self._lock:
             self._active_room_id = room.room_id
-        room.hero_connected.set()
-        self.start_room(room.room_id)
         return room
 
     def validate_token(self, room_id: str, token: str) -> bool:
         room = self.get_room(room_id)
         return bool(room and secrets.compare_digest(room.hero_token, token))
 
-    def submit_hero_action(self, room_id: str, token: str, payload: Dict[str, Any]) -> None:
+    def submit_hero_action(self, room_id: str, token: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """提交 hero 的动作，返回这次决策的用时和剩余的时间银行（放进 ACK）"""
         room = self.get_room(room_id)
         if not room:
             raise ValueError("room not found")
         if not secrets.compare_digest(room.hero_token, token):
             raise ValueError("unauthorized")
-        if not room.hero_player or not room.hero_player.last_request:
-            raise ValueError("not waiting for action")
 
         action = parse_user_action(payload)
-        self._validate_action(room, action)
-        room.hero_action_queue.put(action)
+        # 同一个请求只接受一次动作（WS 和 HTTP 重复提交时，多余的动作不能留到下一次决策）
+        with room.action_lock:
+            if not room.hero_player or not room.hero_player.last_request:
+                raise ValueError("not waiting for action")
+            self._validate_action(room, action)
+            room.last_action_request = None
+            clock = room.hero_player.clock
+            room.hero_player.answer(action)
         logger.info("hero_action_submitted room_id=%s action=%s amount=%s", room_id, action.action, action.amount)
+        if not clock.enabled:
+            return {}
+        return {"clock": {"elapsed": round(clock.last_elapsed, 3), "time_bank": round(clock.bank_left, 3)}}
+
+    def _submit_engine(self, room: Room) -> None:
+        """把房间的牌局协程提交到服务事件循环上运行，调用前必须已占用一个 _room_slots"""
+        run = room.engine_run
+        if not run:
+            raise ValueError("engine not prepared")
+        if not self._loop:
+            raise RuntimeError("event loop not set")
+
+        async def run_in_slot() -> None:
+            with self._lock:
+                self._rooms_running += 1
+            try:
+                await run()
+            finally:
+                room.finished_at = now_ts()
+                with self._lock:
+                    self._rooms_running -= 1
+                self._room_slots.release()
+
+        logger.info("engine_starting room_id=%s", room.room_id)
+        # 路由都在事件循环上调用，脚本等其他线程也可以直接使用 RoomManager，因此统一用 run_coroutine_threadsafe 提交
+        room.engine_future = asyncio.run_coroutine_threadsafe(run_in_slot(), self._loop)
 
     def start_room(self, room_id: str) -> None:
         room = self.get_room(room_id)
         if not room:
             raise ValueError("room not found")
-        if room.status in {RoomStatus.finished, RoomStatus.error}:
+        if room.status in {RoomStatus.finished, RoomStatus.error, RoomStatus.idle}:
             return
-        t = room.engine_thread
-        if not t:
-            raise ValueError("engine not prepared")
-        if t.is_alive():
+        if room.engine_future is not None:
+            return
+        if not self._room_slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            raise RoomCapacityError("too many active rooms")
+        try:
+            self._submit_engine(room)
+        except Exception:
+            self._room_slots.release()
+            raise
+
+    async def _save_played(self, room: Room) -> None:
+        """提前结束的房间也保存已经打完的部分；最终保存要等后台写入器落盘，放到线程中执行"""
+        if not room.controller:
             return
-        logger.info("engine_thread_starting room_id=%s", room_id)
-        t.start()
+        try:
+            await asyncio.to_thread(room.controller.save_final_logs)
+        except Exception:
+            logger.exception("save_logs_failed room_id=%s", room.room_id)
 
     def _validate_action(self, room: Room, action: GamePlayerAction) -> None:
         req = room.hero_player.last_request if room.hero_player else None
@@ -229,14 +361,11 @@ class RoomManager:
             action.amount = req.chips
 
     def _prepare_engine(self, room: Room, players: List[PlayerConfig]) -> None:
-        if room.engine_thread and room.engine_thread.is_alive():
+        if room.engine_running:
             return
 
-        def run() -> None:
+        async def run() -> None:
             try:
-                logger.info("engine_thread_waiting_for_hero room_id=%s", room.room_id)
-                room.hero_connected.wait()
-                logger.info("engine_thread_hero_connected room_id=%s", room.room_id)
                 if room.status == RoomStatus.created:
                     room.status = RoomStatus.running
 
@@ -246,6 +375,9 @@ class RoomManager:
                     initial_chips=room.config["initial_chips"],
                     reveal_hole_cards=False,
                     human_player_name=room.hero_name,
+                    seed=room.config.get("seed"),
+                    log_writer=get_default_log_writer(),
+                    live_stream=self.live_stream,
                 )
                 controller.log_dir = str(self._root / "game_logs")
                 controller.game_logger.log_dir = controller.log_dir
@@ -257,35 +389,23 @@ class RoomManager:
                 def emit(type_: str, payload: Dict[str, Any]) -> None:
                     if not self._loop:
                         return
-                    msg = {
-                        "type": type_,
-                        "seq": room.next_seq(),
-                        "ts": now_ts(),
-                        "payload": payload,
-                    }
-                    asyncio.run_coroutine_threadsafe(room.broadcast.broadcast_json(msg), self._loop)
-
-                def emit_snapshot() -> None:
-                    if not self._loop:
+                    room.broadcast.publish(type_, payload)
+
+                def publish_state() -> None:
+                    """每个视角序列化一次当前桌面，有变化时发布相对上一版本的增量"""
+                    public = serialize_table_snapshot(controller, room.hero_name, reveal_hero_hand=False)
+                    views = {PUBLIC_STREAM: public, HERO_STREAM: with_hero_hand(public, controller, room.hero_name)}
+                    for stream, state in views.items():
+                        update = room.broadcast.views[stream].update(state)
+                        if update:
+                            room.broadcast.publish(update[0], update[1], stream=stream)
+
+                def sync_state() -> None:
+                    """牌桌版本号变化时登记一次状态发布，窗口内的多次变化只序列化、发布最新的一次"""
+                    if not self._loop or controller.table.state_version == room.synced_table_version:
                         return
-
-                    async def _send() -> None:
-                        public_msg = {
-                            "type": "STATE_SNAPSHOT",
-                            "seq": room.next_seq(),
-                            "ts": now_ts(),
-                            "payload": serialize_table_snapshot(controller, room.hero_name, reveal_hero_hand=False),
-                        }
-                        await room.broadcast.broadcast_json(public_msg)
-                        hero_msg = {
-                            "type": "STATE_SNAPSHOT",
-                            "seq": room.next_seq(),
-                            "ts": now_ts(),
-                            "payload": serialize_table_snapshot(controller, room.hero_name, reveal_hero_hand=True),
-                        }
-                        await room.broadcast.broadcast_json(hero_msg, only_hero=True)
-
-                    asyncio.run_coroutine_threadsafe(_send(), self._loop)
+                    room.synced_table_version = controller.table.state_version
+                    room.broadcast.coalescer.request(publish_state)
 
                 def on_action_request(req_obj: Any, game_state: GameInfoState) -> None:
                     payload = {
@@ -304,12 +424,41 @@ class RoomManager:
                             "raise": req_obj.can_raise,
                             "all_in": req_obj.can_all_in,
                         },
+                        "clock": hero.clock.status(),
                     }
                     room.last_action_request = payload
                     emit("ACTION_REQUEST", payload)
-                    emit_snapshot()
+                    sync_state()
+
+                def on_timeout(req_obj: Any, action: GamePlayerAction, idle: bool) -> None:
+                    with room.action_lock:
+                        room.last_action_request = None
+                    logger.info(
+                        "hero_action_timeout room_id=%s hand=%s action=%s timeouts=%s",
+                        room.room_id,
+                        req_obj.hand_number,
+                        action.action.value,
+                        hero.clock.consecutive_timeouts,
+                    )
+                    emit(
+                        "ACTION_TIMEOUT",
+                        {
+                            "hero": room.hero_name,
+                            "hand_number": req_obj.hand_number,
+                            "action": action.action.value,
+                            "timeouts": hero.clock.consecutive_timeouts,
+                            "max_timeouts": hero.clock.max_timeouts,
+                            "idle": idle,
+                        },
+                    )
 
-                hero = WebHumanPlayer(room.hero_name, room.hero_action_queue, on_action_request=on_action_request)
+                hero = WebHumanPlayer(
+                    room.hero_name,
+                    room.hero_action_queue,
+                    on_action_request=on_action_request,
+                    clock=ActionClock(self.action_timeout, self.time_bank, self.max_timeouts),
+                    on_timeout=on_timeout,
+                )
                 room.hero_player = hero
                 controller.add_player(hero)
 
@@ -347,120 +496,104 @@ class RoomManager:
 
                 table = controller.table
 
-                original_start_new_hand = table.start_new_hand
-                original_move_to_next_stage = table.move_to_next_stage
-                original_log_action = table.log_action
-                original_award_pot = table.award_pot
-
-                def start_new_hand_hook() -> None:
-                    original_start_new_hand()
-                    logger.info("hand_start room_id=%s hand=%s", room.room_id, table.hand_number)
-                    logger.info(
-                        "hole_cards room_id=%s hand=%s %s",
-                        room.room_id,
-                        table.hand_number,
-                        " | ".join(f"{p.name}:{','.join(str(c) for c in (p.hand or []))}" for p in table.players),
-                    )
-                    emit(
-                        "HAND_START",
-                        {
-                            "hand_number": table.hand_number,
-                            "dealer_position": table.dealer_position,
-                            "small_blind": table.small_blind,
-                            "big_blind": table.big_blind,
-                        },
-                    )
-                    emit_snapshot()
-
-                def move_to_next_stage_hook() -> None:
-                    prev_stage = table.stage.value
-                    original_move_to_next_stage()
-                    new_stage = table.stage.value
-                    if new_stage != prev_stage:
-                        logger.info("stage_change room_id=%s hand=%s %s->%s", room.room_id, table.hand_number, prev_stage, new_stage)
-                    if new_stage != prev_stage and new_stage in {"flop", "turn", "river"}:
+                def on_table_event(event: Any) -> None:
+                    """牌桌事件的订阅者：写运行日志、转成 WebSocket 消息广播，再同步桌面状态"""
+                    if isinstance(event, HandStartedEvent):
+                        logger.info("hand_start room_id=%s hand=%s", room.room_id, event.hand_number)
+                        logger.info(
+                            "hole_cards room_id=%s hand=%s %s",
+                            room.room_id,
+                            event.hand_number,
+                            " | ".join(f"{p.name}:{','.join(str(c) for c in (p.hand or []))}" for p in table.players),
+                        )
                         emit(
-                            "STREET_DEALT",
+                            "HAND_START",
+                            {
+                                "hand_number": event.hand_number,
+                                "dealer_position": event.dealer,
+                                "small_blind": event.small_blind,
+                                "big_blind": event.big_blind,
+                            },
+                        )
+                    elif isinstance(event, ActionTakenEvent):
+                        logger.info(
+                            "action_taken room_id=%s hand=%s stage=%s player=%s action=%s amount=%s",
+                            room.room_id,
+                            event.hand_number,
+                            event.stage,
+                            event.player_name,
+                            event.action,
+                            event.amount,
+                        )
+                        emit(
+                            "ACTION_TAKEN",
                             {
-                                "hand_number": table.hand_number,
-                                "stage": new_stage,
-                                "community_cards": [str(c) for c in table.community_cards],
+                                "hand_number": event.hand_number,
+                                "stage": event.stage,
+                                "player_name": event.player_name,
+                                "action": event.action,
+                                "amount": event.amount,
+                                "pot": event.pot,
+                                "player_chips": event.player_chips,
+                                "behavior": event.behavior,
                             },
                         )
-                        emit_snapshot()
-                    if new_stage == "showdown":
-                        active = [p for p in table.players if p.is_active and not p.folded]
+                    elif isinstance(event, StreetDealtEvent):
+                        logger.info("stage_change room_id=%s hand=%s stage=%s", room.room_id, event.hand_number, event.stage)
+                        emit(
+                            "STREET_DEALT",
+                            {"hand_number": event.hand_number, "stage": event.stage, "community_cards": event.community_cards},
+                        )
+                    elif isinstance(event, ShowdownEvent):
+                        logger.info("stage_change room_id=%s hand=%s stage=showdown", room.room_id, event.hand_number)
                         emit(
                             "SHOWDOWN_REVEAL",
                             {
-                                "hand_number": table.hand_number,
-                                "community_cards": [str(c) for c in table.community_cards],
+                                "hand_number": event.hand_number,
+                                "community_cards": event.community_cards,
                                 "players": [
-                                    {"name": p.name, "hand": [str(c) for c in p.hand], "chips": p.chips}
-                                    for p in active
+                                    {"name": p["player_name"], "hand": p["hand"], "chips": p["chips"]} for p in event.players
                                 ],
                             },
                         )
+                    elif isinstance(event, PotAwardedEvent):
+                        emit("POT_AWARD", event.to_legacy())
+                    sync_state()
 
-                def log_action_hook(player: Any, action: Action, amount: int = 0, behavior: str = "") -> None:
-                    original_log_action(player, action, amount, behavior)
-                    logger.info(
-                        "action_taken room_id=%s hand=%s stage=%s player=%s action=%s amount=%s",
-                        room.room_id,
-                        table.hand_number,
-                        table.stage.value,
-                        getattr(player, "name", "?"),
-                        action.value,
-                        amount,
-                    )
-                    emit(
-                        "ACTION_TAKEN",
-                        {
-                            "hand_number": table.hand_number,
-                            "stage": table.stage.value,
-                            "player_name": player.name,
-                            "action": action.value,
-                            "amount": amount,
-                            "pot": table.pot,
-                            "player_chips": player.chips,
-                            "behavior": behavior,
-                        },
-                    )
-                    emit_snapshot()
-
-                def award_pot_hook(winners: Any) -> None:
-                    original_award_pot(winners)
-                    record = table.game_log[-1] if table.game_log else None
-                    if record and record.get("type") == 5:
-                        emit("POT_AWARD", record)
-                        emit_snapshot()
-
-                table.start_new_hand = start_new_hand_hook
-                table.move_to_next_stage = move_to_next_stage_hook
-                table.log_action = log_action_hook
-                table.award_pot = award_pot_hook
-                emit_snapshot()
-
-                controller.run_tournament(num_hands=room.config["num_hands"], verbose=False)
-                enhanced_path = controller.save_enhanced_log()
+                table.events.subscribe(
+                    on_table_event, HandStartedEvent, ActionTakenEvent, StreetDealtEvent, ShowdownEvent, PotAwardedEvent
+                )
+                sync_state()
+
+                # 结束时已保存最终日志，返回增强日志的路径
+                enhanced_path = await controller.run_tournament_async(num_hands=room.config["num_hands"], verbose=False)
                 room.status = RoomStatus.finished
                 logger.info("game_finished room_id=%s game_id=%s", room.room_id, controller.game_id)
                 emit("GAME_END", {"game_id": controller.game_id, "enhanced_log": enhanced_path})
+            except RoomIdleError as e:
+                # 无人值守：保存已打完的部分后结束牌局释放房间名额，通知客户端后关闭连接，房间随后和已结束的房间一样被清理
+                room.status = RoomStatus.idle
+                room.last_error = str(e)
+                logger.info("room_idle room_id=%s reason=%s", room.room_id, room.last_error)
+                await self._save_played(room)
+                room.broadcast.publish("ROOM_IDLE", {"reason": room.last_error})
+                room.broadcast.coalescer.cancel()
+                room.broadcast.close_all()
+            except RoomClosedError:
+                room.broadcast.coalescer.cancel()
+                room.status = RoomStatus.finished
+                room.last_error = "room closed"
+                logger.info("room_closed room_id=%s", room.room_id)
+                await self._save_played(room)
             except Exception as e:
+                room.broadcast.coalescer.cancel()
                 room.status = RoomStatus.error
                 room.last_error = str(e)
                 logger.exception("engine_error room_id=%s err=%s", room.room_id, room.last_error)
                 if self._loop:
-                    msg = {
-                        "type": "ERROR",
-                        "seq": room.next_seq(),
-                        "ts": now_ts(),
-                        "payload": {"error": room.last_error},
-                    }
-                    asyncio.run_coroutine_threadsafe(room.broadcast.broadcast_json(msg), self._loop)
+                    room.broadcast.publish("ERROR", {"error": room.last_error})
 
-        t = threading.Thread(target=run, daemon=True, name=f"room-{room.room_id}")
-        room.engine_thread = t
+        room.engine_run = run
 
 
 def default_players(hero_name: str) -> List[PlayerConfig]:
@@ -0,0 +1,51 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+
+def diff_state(old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
+    """比较两个桌面状态，返回变化的字段：顶层字段放在 changes，玩家按座位号放在 seats；座位数变化时整体替换 players"""
+    changes = {k: v for k, v in new.items() if k != "players" and old.get(k) != v}
+    delta: Dict[str, Any] = {}
+    old_players: List[Dict[str, Any]] = old.get("players", [])
+    new_players: List[Dict[str, Any]] = new.get("players", [])
+    if len(old_players) != len(new_players):
+        changes["players"] = new_players
+    else:
+        seats = []
+        for seat, (prev, cur) in enumerate(zip(old_players, new_players)):
+            changed = {k: v for k, v in cur.items() if prev.get(k) != v}
+            if changed:
+                seats.append({"seat": seat, **changed})
+        if seats:
+            delta["seats"] = seats
+    if changes:
+        delta["changes"] = changes
+    return delta
+
+
+@dataclass
+class ViewState:
+    """某个视角（公开 / hero）最近一次发布的桌面状态及其版本号
+
+    状态变化时只发送相对上一个版本的增量（STATE_DELTA，带 base_version），
+    完整快照只在连接建立或客户端请求时发送，快照和增量的版本号来自同一个计数器
+    """
+    version: int = 0
+    state: Optional[Dict[str, Any]] = None
+
+    def update(self, new_state: Dict[str, Any]) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """记录新状态，返回需要发布的 (消息类型, payload)；状态没有变化时返回 None"""
+        if self.state is None:
+            self.state, self.version = new_state, 1
+            return "STATE_SNAPSHOT", self.snapshot()
+        delta = diff_state(self.state, new_state)
+        if not delta:
+            return None
+        base_version = self.version
+        self.state, self.version = new_state, self.version + 1
+        return "STATE_DELTA", {"base_version": base_version, "version": self.version, **delta}
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {**(self.state or {}), "version": self.version}
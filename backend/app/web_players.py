@@ -1,9 +1,10 @@
 from __future__ import annotations
 
+import asyncio
 import queue
 import random
 import time
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import Any, Callable, Dict, Optional
 
 from ai_player import AIPlayer
@@ -11,6 +12,80 @@ from engine_info import Action, Player
 from game_info import GameInfoState, GamePlayerAction, GameResult
 
 
+DEFAULT_ACTION_TIMEOUT = 30.0
+DEFAULT_TIME_BANK = 60.0
+DEFAULT_MAX_TIMEOUTS = 3
+
+
+class RoomClosedError(RuntimeError):
+    """房间被关闭，等待中的人类玩家不会再有动作"""
+
+
+class RoomIdleError(RoomClosedError):
+    """人类玩家连续多次超时未行动，房间视为无人值守而结束"""
+
+
+@dataclass
+class ActionClock:
+    """人类玩家的行动计时：每次决策有 action_timeout 秒，超出的部分从整局共用的 time_bank 中扣除，
+    两者都用完时由系统代为行动；action_timeout 为 0 表示不限时"""
+    action_timeout: float = DEFAULT_ACTION_TIMEOUT
+    time_bank: float = DEFAULT_TIME_BANK
+    max_timeouts: int = DEFAULT_MAX_TIMEOUTS  # 连续超时达到这个次数后房间进入 idle，0 表示不限
+    bank_left: float = field(init=False)
+    started_at: Optional[float] = None
+    last_elapsed: float = 0.0
+    timeouts: int = 0
+    consecutive_timeouts: int = 0
+
+    def __post_init__(self) -> None:
+        self.bank_left = self.time_bank
+
+    @property
+    def enabled(self) -> bool:
+        return self.action_timeout > 0
+
+    def start(self) -> None:
+        self.started_at = time.time()
+
+    def remaining(self) -> Optional[float]:
+        """本次决策还剩的秒数（含时间银行），不限时或没有在计时时返回 None"""
+        if not self.enabled or self.started_at is None:
+            return None
+        return max(0.0, self.started_at + self.action_timeout + self.bank_left - time.time())
+
+    def status(self) -> Dict[str, Any]:
+        """倒计时信息，随 ACTION_REQUEST 下发：deadline 为截止时间戳，remaining 为发送时的剩余秒数"""
+        if not self.enabled:
+            return {}
+        started_at = self.started_at if self.started_at is not None else time.time()
+        return {
+            "action_timeout": self.action_timeout,
+            "time_bank": round(self.bank_left, 3),
+            "deadline": round(started_at + self.action_timeout + self.bank_left, 3),
+            "remaining": round(self.remaining() or 0.0, 3),
+        }
+
+    def stop(self) -> None:
+        """按时行动：超出 action_timeout 的部分从时间银行扣除，连续超时计数清零"""
+        if self.started_at is None:
+            return
+        self.last_elapsed = time.time() - self.started_at
+        self.bank_left = max(0.0, self.bank_left - max(0.0, self.last_elapsed - self.action_timeout))
+        self.started_at = None
+        self.consecutive_timeouts = 0
+
+    def expire(self) -> bool:
+        """超时：时间银行耗尽，返回是否已连续超时 max_timeouts 次"""
+        if self.started_at is not None:
+            self.last_elapsed = time.time() - self.started_at
+        self.bank_left = 0.0
+        self.started_at = None
+        self.timeouts += 1
+        self.consecutive_timeouts += 1
+        return self.max_timeouts > 0 and self.consecutive_timeouts >= self.max_timeouts
+
+
 @dataclass
 class ActionRequest:
     hand_number: int
@@ -53,30 +128,113 @@ class WebHumanPlayer(AIPlayer):
         name: str,
         action_queue: "queue.Queue[GamePlayerAction]",
         on_action_request: Optional[Callable[[ActionRequest, GameInfoState], None]] = None,
+        clock: Optional[ActionClock] = None,
+        on_timeout: Optional[Callable[[ActionRequest, GamePlayerAction, bool], None]] = None,
     ):
         super().__init__(Player(name=name))
         self._action_queue = action_queue
         self._on_action_request = on_action_request
+        self._on_timeout = on_timeout
+        self.clock = clock or ActionClock(action_timeout=0)
         self._last_request: Optional[ActionRequest] = None
         self._waiting_since: Optional[float] = None
+        self._pending: Optional["asyncio.Future[Optional[GamePlayerAction]]"] = None
+        self._closed = False
 
     @property
     def last_request(self) -> Optional[ActionRequest]:
         return self._last_request
 
+    def answer(self, action: Optional[GamePlayerAction]) -> None:
+        """提交当前请求的动作；提交后立即不再等待，重复提交不会把多余的动作留在队列里
+
+        异步牌局循环在 Future 上等待，可以从任意线程调用；同步的 make_decision 仍然从队列中取动作
+        """
+        if action is not None and self._last_request is not None:
+            self.clock.stop()
+        self._last_request = None
+        fut, self._pending = self._pending, None
+        if fut is None:
+            self._action_queue.put(action)
+            return
+
+        def resolve() -> None:
+            if not fut.done():
+                fut.set_result(action)
+
+        fut.get_loop().call_soon_threadsafe(resolve)
+
+    def _timed_out(self, req: ActionRequest) -> GamePlayerAction:
+        """时间用完：能过牌就过牌，否则弃牌；连续超时达到上限时抛出 RoomIdleError"""
+        self._last_request = None
+        self._pending = None
+        idle = self.clock.expire()
+        action = GamePlayerAction(
+            action=Action.CHECK if req.can_check else Action.FOLD, amount=0, play_reason="", behavior="timeout"
+        )
+        if self._on_timeout:
+            self._on_timeout(req, action, idle)
+        if idle:
+            raise RoomIdleError(f"{self.clock.consecutive_timeouts} consecutive action timeouts")
+        return action
+
     def make_decision(self, game_state: GameInfoState) -> GamePlayerAction:
         req = build_action_request(game_state, self.player)
+        # 超时后才到的动作可能还留在队列里，不能算作这次决策的
+        while not self._action_queue.empty():
+            self._action_queue.get_nowait()
+        if self._closed:
+            raise RoomClosedError("room closed")
+        self._last_request = req
+        self._waiting_since = time.time()
+        self.clock.start()
+        if self._on_action_request:
+            self._on_action_request(req, game_state)
+        try:
+            action = self._action_queue.get(timeout=self.clock.remaining())
+        except queue.Empty:
+            return self._timed_out(req)
+        finally:
+            self._waiting_since = None
+        if action is None:
+            raise RoomClosedError("room closed")
+        return action
+
+    async def make_decision_async(self, game_state: GameInfoState) -> GamePlayerAction:
+        req = build_action_request(game_state, self.player)
+        self._pending = asyncio.get_running_loop().create_future()
+        fut = self._pending
+        if self._closed:
+            raise RoomClosedError("room closed")
         self._last_request = req
         self._waiting_since = time.time()
+        self.clock.start()
         if self._on_action_request:
             self._on_action_request(req, game_state)
-        action = self._action_queue.get()
-        self._waiting_since = None
+        try:
+            done, _ = await asyncio.wait({fut}, timeout=self.clock.remaining())
+            if not done:
+                return self._timed_out(req)
+            action = fut.result()
+        finally:
+            self._waiting_since = None
+            if self._pending is fut:
+                self._pending = None
+        if action is None:
+            raise RoomClosedError("room closed")
         return action
 
+    def close(self) -> None:
+        """唤醒等待中的牌局并结束对局，之后的决策请求直接失败"""
+        self._closed = True
+        self.answer(None)
+
     def reflect_on_game(self, game_state: GameInfoState, game_result: GameResult):
         return
 
+    async def reflect_on_game_async(self, game_state: GameInfoState, game_result: GameResult):
+        return
+
 
 class RandomBotPlayer(AIPlayer):
     def __init__(self, name: str, seed: Optional[int] = None):
@@ -111,9 +269,16 @@ class RandomBotPlayer(AIPlayer):
             return GamePlayerAction(action=Action.CHECK, amount=0, play_reason="", behavior="")
         return GamePlayerAction(action=Action.FOLD, amount=0, play_reason="", behavior="")
 
+    async def make_decision_async(self, game_state: GameInfoState) -> GamePlayerAction:
+        # 决策不需要等待，直接在事件循环上计算，不必切到线程
+        return self.make_decision(game_state)
+
     def reflect_on_game(self, game_state: GameInfoState, game_result: GameResult):
         return
 
+    async def reflect_on_game_async(self, game_state: GameInfoState, game_result: GameResult):
+        return
+
 
 def parse_user_action(payload: Dict[str, Any]) -> GamePlayerAction:
     raw_action = str(payload.get("action", "")).lower().strip()
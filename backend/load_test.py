@@ -0,0 +1,342 @@
+"""多房间负载测试：并发创建随机机器人房间，作为人类玩家通过 WebSocket 打完每一局，
+统计每秒完成的房间数、准入拒绝（503）次数、每个动作的延迟和收到的消息量。
+客户端按前端的方式用 STATE_DELTA 维护桌面状态，结束时与服务端快照比对。
+--spectators 为每个房间额外挂上若干只读观众连接，用来压测广播扇出。
+
+    python -m uvicorn backend.app:app --port 8000
+    python -m backend.load_test --rooms 200 --concurrency 100 --hands 3
+    python -m backend.load_test --rooms 20 --concurrency 20 --spectators 50
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+import websockets
+
+
+@dataclass
+class RoomResult:
+    room_id: str = ""
+    created: bool = False
+    finished: bool = False
+    rejected: int = 0
+    create_latency: float = 0.0
+    messages: int = 0
+    bytes: int = 0
+    by_type: Dict[str, int] = field(default_factory=dict)
+    seq_gaps: int = 0
+    resyncs: int = 0
+    state_ok: Optional[bool] = None
+    spectator_messages: int = 0
+    spectator_gaps: int = 0
+    spectator_resyncs: int = 0
+    spectator_mismatches: int = 0
+    spectator_errors: int = 0
+    actions: int = 0
+    ack_latencies: List[float] = field(default_factory=list)
+    applied_latencies: List[float] = field(default_factory=list)
+    error: Optional[str] = None
+
+
+@dataclass
+class StreamTracker:
+    """按前端的方式跟踪一条流：检测 seq 跳号，用 STATE_SNAPSHOT / STATE_DELTA 维护桌面状态"""
+    state: Optional[Dict[str, Any]] = None
+    last_seq: int = 0
+    gaps: int = 0
+    resyncs: int = 0
+
+    def feed(self, msg: Dict[str, Any]) -> bool:
+        """处理一条消息，返回 True 表示增量接不上，需要请求快照"""
+        kind, seq, payload = msg.get("type"), msg.get("seq", 0), msg.get("payload") or {}
+        if kind == "STATE_SNAPSHOT":
+            self.state, self.last_seq = payload, seq
+            return False
+        if seq > self.last_seq:
+            if self.last_seq and seq > self.last_seq + 1:
+                self.gaps += 1
+            self.last_seq = seq
+        if kind != "STATE_DELTA":
+            return False
+        if self.state is None or self.state.get("version") != payload.get("base_version"):
+            self.resyncs += 1
+            self.state = None
+            return True
+        self.state = apply_delta(self.state, payload)
+        return False
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _post_json(url: str, body: Dict[str, Any], timeout: float) -> tuple[int, Dict[str, Any], Dict[str, str]]:
+    req = urllib.request.Request(
+        url, data=json.dumps(body).encode("utf-8"), headers={"Content-Type": "application/json"}, method="POST"
+    )
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            return resp.status, json.loads(resp.read()), dict(resp.headers)
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read() or b"{}"), dict(e.headers)
+
+
+def _get_json(url: str, timeout: float) -> Dict[str, Any]:
+    with urllib.request.urlopen(url, timeout=timeout) as resp:
+        return json.loads(resp.read())
+
+
+def apply_delta(state: Dict[str, Any], delta: Dict[str, Any]) -> Dict[str, Any]:
+    """与前端 applyStateDelta 相同的合并逻辑"""
+    changes = delta.get("changes", {})
+    players = [dict(p) for p in changes.get("players", state.get("players", []))]
+    for seat in delta.get("seats", []):
+        players[seat["seat"]].update({k: v for k, v in seat.items() if k != "seat"})
+    return {**state, **changes, "players": players, "version": delta["version"]}
+
+
+def choose_action(request: Dict[str, Any]) -> Dict[str, Any]:
+    legal = request.get("legal_actions", {})
+    if legal.get("check"):
+        return {"action": "check"}
+    if legal.get("call"):
+        return {"action": "call"}
+    return {"action": "fold"}
+
+
+async def play_room(
+    base_url: str,
+    hands: int,
+    deadline: float,
+    room_timeout: float,
+    http_pool: ThreadPoolExecutor,
+    spectators: int = 0,
+) -> RoomResult:
+    result = RoomResult()
+    body = {"human_name": "Load", "opponents": "random_bot", "num_hands": hands}
+    start = time.perf_counter()
+    while True:
+        status, data, headers = await asyncio.get_running_loop().run_in_executor(
+            http_pool, _post_json, f"{base_url}/rooms", body, 30.0
+        )
+        if status == 200:
+            break
+        if status != 503 or time.time() > deadline:
+            result.error = f"create failed: {status} {data.get('detail')}"
+            return result
+        result.rejected += 1
+        await asyncio.sleep(float(headers.get("Retry-After", 1)))
+    result.created = True
+    result.create_latency = time.perf_counter() - start
+    result.room_id = data["room_id"]
+
+    ws_url = base_url.replace("http://", "ws://").replace("https://", "wss://") + data["ws_url"]
+
+    async def consume(ws: Any) -> None:
+        sent_at: Optional[float] = None
+        tracker = StreamTracker()
+        try:
+            async for raw in ws:
+                msg = json.loads(raw)
+                result.messages += 1
+                result.bytes += len(raw)
+                kind = msg.get("type")
+                result.by_type[kind] = result.by_type.get(kind, 0) + 1
+                payload = msg.get("payload") or {}
+                if tracker.feed(msg):
+                    await ws.send(json.dumps({"type": "REQUEST_SNAPSHOT", "payload": {}}))
+                if kind == "ACTION_REQUEST" and sent_at is None:
+                    sent_at = time.perf_counter()
+                    await ws.send(json.dumps({"type": "USER_ACTION", "payload": choose_action(payload)}))
+                    result.actions += 1
+                elif kind == "ACK" and sent_at is not None:
+                    result.ack_latencies.append(time.perf_counter() - sent_at)
+                elif kind == "ACTION_TAKEN" and payload.get("player_name") == "Load" and sent_at is not None:
+                    result.applied_latencies.append(time.perf_counter() - sent_at)
+                    sent_at = None
+                elif kind == "ERROR":
+                    if payload.get("error") == "not waiting for action":
+                        sent_at = None
+                        continue
+                    result.error = payload.get("error")
+                    return
+                elif kind == "GAME_END":
+                    result.finished = True
+                    # GAME_END 之后不会再有状态变化，用 delta 维护的状态应与服务端快照完全一致
+                    server = await asyncio.get_running_loop().run_in_executor(
+                        http_pool, _get_json, f"{base_url}/rooms/{result.room_id}/snapshot?token={data['hero_token']}", 30.0
+                    )
+                    result.state_ok = tracker.state == server["payload"]
+                    return
+        finally:
+            result.seq_gaps += tracker.gaps
+            result.resyncs += tracker.resyncs
+
+    async def spectate() -> None:
+        tracker = StreamTracker()
+        try:
+            async with websockets.connect(
+                ws_url.split("?", 1)[0], max_size=None, open_timeout=room_timeout
+            ) as ws:
+                while True:
+                    try:
+                        raw = await asyncio.wait_for(ws.recv(), 2.0)
+                    except asyncio.TimeoutError:
+                        # 房间在观众连上之前就结束了：只会收到快照，没有 GAME_END
+                        room = await asyncio.get_running_loop().run_in_executor(
+                            http_pool, _get_json, f"{base_url}/rooms/{result.room_id}", 30.0
+                        )
+                        if room["status"] in ("finished", "error", "idle"):
+                            break
+                        continue
+                    msg = json.loads(raw)
+                    result.spectator_messages += 1
+                    if tracker.feed(msg):
+                        await ws.send(json.dumps({"type": "REQUEST_SNAPSHOT", "payload": {}}))
+                    if msg.get("type") == "GAME_END":
+                        break
+                server = await asyncio.get_running_loop().run_in_executor(
+                    http_pool, _get_json, f"{base_url}/rooms/{result.room_id}/snapshot", 30.0
+                )
+                result.spectator_mismatches += tracker.state != server["payload"]
+        except (OSError, websockets.WebSocketException):
+            result.spectator_errors += 1
+        finally:
+            result.spectator_gaps += tracker.gaps
+            result.spectator_resyncs += tracker.resyncs
+
+    watchers = [asyncio.ensure_future(spectate()) for _ in range(spectators)]
+    try:
+        async with websockets.connect(ws_url, max_size=None, open_timeout=room_timeout) as ws:
+            await asyncio.wait_for(consume(ws), room_timeout)
+        if watchers:
+            await asyncio.wait_for(asyncio.gather(*watchers), room_timeout)
+    except (OSError, asyncio.TimeoutError, websockets.WebSocketException) as e:
+        result.error = f"{type(e).__name__}: {e}"
+    finally:
+        for task in watchers:
+            task.cancel()
+    return result
+
+
+async def run_load_test(
+    base_url: str, rooms: int, concurrency: int, hands: int, room_timeout: float, spectators: int = 0
+) -> Dict[str, Any]:
+    semaphore = asyncio.Semaphore(concurrency)
+    deadline = time.time() + room_timeout * 4
+    # 创建房间的 HTTP 请求是阻塞调用，线程数与并发数一致，避免客户端自己成为瓶颈
+    http_pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="load-http")
+
+    async def one() -> RoomResult:
+        async with semaphore:
+            return await play_room(base_url, hands, deadline, room_timeout, http_pool, spectators)
+
+    start = time.perf_counter()
+    try:
+        results = await asyncio.gather(*(one() for _ in range(rooms)))
+    finally:
+        http_pool.shutdown(wait=False)
+    elapsed = time.perf_counter() - start
+
+    finished = [r for r in results if r.finished]
+    ack = [x for r in results for x in r.ack_latencies]
+    applied = [x for r in results for x in r.applied_latencies]
+    errors: Dict[str, int] = {}
+    by_type: Dict[str, int] = {}
+    for r in results:
+        for kind, count in r.by_type.items():
+            by_type[kind] = by_type.get(kind, 0) + count
+        if r.error:
+            errors[r.error] = errors.get(r.error, 0) + 1
+
+    def latency_summary(values: List[float]) -> Dict[str, float]:
+        return {
+            "count": len(values),
+            "p50_ms": percentile(values, 0.5) * 1000,
+            "p95_ms": percentile(values, 0.95) * 1000,
+            "p99_ms": percentile(values, 0.99) * 1000,
+            "max_ms": max(values, default=0.0) * 1000,
+        }
+
+    return {
+        "rooms": rooms,
+        "concurrency": concurrency,
+        "elapsed_s": elapsed,
+        "created": sum(r.created for r in results),
+        "finished": len(finished),
+        "rooms_per_s": len(finished) / elapsed if elapsed > 0 else 0.0,
+        "rejected_503": sum(r.rejected for r in results),
+        "create_latency": latency_summary([r.create_latency for r in results if r.created]),
+        "messages_per_room": sum(r.messages for r in results) / max(len(results), 1),
+        "bytes_per_room": sum(r.bytes for r in results) / max(len(results), 1),
+        "messages_by_type": by_type,
+        "seq_gaps": sum(r.seq_gaps for r in results),
+        "resyncs": sum(r.resyncs for r in results),
+        "state_mismatches": sum(r.state_ok is False for r in results),
+        "spectators_per_room": spectators,
+        "spectator_messages": sum(r.spectator_messages for r in results),
+        "spectator_seq_gaps": sum(r.spectator_gaps for r in results),
+        "spectator_resyncs": sum(r.spectator_resyncs for r in results),
+        "spectator_state_mismatches": sum(r.spectator_mismatches for r in results),
+        "spectator_errors": sum(r.spectator_errors for r in results),
+        "actions": sum(r.actions for r in results),
+        "ack_latency": latency_summary(ack),
+        "applied_latency": latency_summary(applied),
+        "errors": errors,
+    }
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(
+        f"房间: {report['finished']}/{report['rooms']} 完成（并发 {report['concurrency']}），"
+        f"用时 {report['elapsed_s']:.1f}s，{report['rooms_per_s']:.2f} rooms/s"
+    )
+    print(f"准入拒绝(503): {report['rejected_503']} 次，动作 {report['actions']} 个")
+    print(
+        f"平均每房间消息 {report['messages_per_room']:.0f} 条 / {report['bytes_per_room'] / 1024:.1f} KB，"
+        f"seq 跳号 {report['seq_gaps']} 次，重新同步 {report['resyncs']} 次，结束时状态不一致 {report['state_mismatches']} 个房间"
+    )
+    if report["spectators_per_room"]:
+        print(
+            f"观众: 每房间 {report['spectators_per_room']} 个，共收到 {report['spectator_messages']} 条消息，"
+            f"seq 跳号 {report['spectator_seq_gaps']} 次，重新同步 {report['spectator_resyncs']} 次，"
+            f"状态不一致 {report['spectator_state_mismatches']} 个，连接错误 {report['spectator_errors']} 个"
+        )
+    print("消息类型: " + ", ".join(f"{k} {v}" for k, v in sorted(report["messages_by_type"].items(), key=lambda kv: -kv[1])))
+    for key, label in (("create_latency", "创建房间"), ("ack_latency", "动作 ACK"), ("applied_latency", "动作生效")):
+        s = report[key]
+        print(f"{label:<10} n={s['count']:<6} p50 {s['p50_ms']:.1f}ms  p95 {s['p95_ms']:.1f}ms  p99 {s['p99_ms']:.1f}ms  max {s['max_ms']:.1f}ms")
+    for error, count in report["errors"].items():
+        print(f"错误: {error} x{count}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="多房间后端负载测试")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--rooms", type=int, default=100, help="总共创建的房间数")
+    parser.add_argument("--concurrency", type=int, default=50, help="同时进行的房间数")
+    parser.add_argument("--hands", type=int, default=3, help="每个房间的手牌数")
+    parser.add_argument("--spectators", type=int, default=0, help="每个房间额外连接的观众数")
+    parser.add_argument("--room-timeout", type=float, default=120.0, help="单个房间的超时时间（秒）")
+    parser.add_argument("--json", action="store_true", help="以JSON格式输出")
+    args = parser.parse_args()
+
+    report = asyncio.run(run_load_test(
+        args.url.rstrip("/"), args.rooms, args.concurrency, args.hands, args.room_timeout, args.spectators
+    ))
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print_report(report)
@@ -0,0 +1,57 @@
+# bounded_history.py
+# 有界内存模式的辅助工具：窗口之外的旧记录按 JSON Lines 追加到磁盘，结束时再拼成完整的 JSON 数组文件
+
+import json
+import os
+from typing import Dict, List, Any, Optional, Iterable, Iterator
+
+
+class JsonlSpill:
+    """按顺序把记录追加到 JSON Lines 文件，传入 writer（LogWriter）时由后台线程写盘"""
+
+    def __init__(self, path: str, writer: Optional[Any] = None):
+        self.path = path
+        self.writer = writer
+        self.count = 0  # 已追加的记录数
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # 新的一局从空文件开始
+        with open(path, 'wb'):
+            pass
+
+    def append(self, records: List[Dict[str, Any]]):
+        if not records:
+            return
+        data = b"".join(json.dumps(r, ensure_ascii=False).encode("utf-8") + b"\n" for r in records)
+        if self.writer is not None:
+            self.writer.append_bytes(self.path, data)
+        else:
+            with open(self.path, 'ab') as f:
+                f.write(data)
+        self.count += len(records)
+
+    def flush(self):
+        if self.writer is not None:
+            self.writer.flush()
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        self.flush()
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def write_json_array(filename: str, records: Iterable[Dict[str, Any]], indent: int = 2):
+    """逐条写出 JSON 数组，输出与 json.dump(list, indent=indent) 相同，但不需要把所有记录读入内存"""
+    pad = " " * indent
+    tmp_file = filename + ".tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        first = True
+        for record in records:
+            f.write("[\n" if first else ",\n")
+            f.write(pad + json.dumps(record, ensure_ascii=False, indent=indent).replace("\n", "\n" + pad))
+            first = False
+        f.write("[]" if first else "\n]")
+    os.replace(tmp_file, filename)
@@ -0,0 +1,361 @@
+# columnar_log.py
+# 增强日志的列式压缩存储：数值字段按列保存为 NumPy 数组，大文本字段单独压缩并按需加载
+
+import argparse
+import json
+import os
+import zlib
+from datetime import datetime
+from typing import Dict, List, Any, Optional
+
+import numpy as np
+
+from analyze_logs import LogAnalyzer, normalize_action, list_log_sources, load_log_source
+from game_logger import resolve_prompt
+
+COLUMNAR_DIR = "columnar"
+FORMAT_VERSION = 1
+
+# 决策中单独存放、按需加载的大文本字段
+PROMPT_FIELDS = ["prompt", "prompt_template_id", "prompt_vars", "prompt_hash"]
+DECISION_TEXT_FIELDS = PROMPT_FIELDS + ["game_state", "raw_response", "reasoning_content", "play_reason", "behavior", "error"]
+REFLECTION_TEXT_FIELDS = PROMPT_FIELDS + ["game_result", "raw_response", "updated_opinions"]
+
+
+def _parse_timestamp(value: str) -> float:
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class _Vocab:
+    """字符串到整数编码的词表"""
+
+    def __init__(self):
+        self.values: List[str] = []
+        self._codes: Dict[str, int] = {}
+
+    def code(self, value: str) -> int:
+        if value not in self._codes:
+            self._codes[value] = len(self.values)
+            self.values.append(value)
+        return self._codes[value]
+
+
+def _write_texts(filename: str, rows: List[Dict[str, Any]]) -> np.ndarray:
+    """逐行压缩写入文本字段，返回每行的起始偏移（长度为行数+1）"""
+    offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+    with open(filename, 'wb') as f:
+        for i, row in enumerate(rows):
+            data = zlib.compress(json.dumps(row, ensure_ascii=False).encode("utf-8"))
+            f.write(data)
+            offsets[i + 1] = offsets[i] + len(data)
+    return offsets
+
+
+def get_columnar_path(log_dir: str, game_id: str) -> str:
+    return os.path.join(log_dir, COLUMNAR_DIR, game_id)
+
+
+def export_columnar(log: Dict[str, Any], out_dir: str) -> str:
+    """将增强日志转换为列式存储，写入 out_dir 目录"""
+    os.makedirs(out_dir, exist_ok=True)
+    stages, players, models, actions = _Vocab(), _Vocab(), _Vocab(), _Vocab()
+    for p in log.get("players", []):
+        players.code(p["name"])
+        models.code(p.get("model_name", "unknown"))
+
+    decisions = log.get("llm_decisions", [])
+    n = len(decisions)
+    columns = {
+        "hand_number": np.zeros(n, dtype=np.int32),
+        "stage": np.zeros(n, dtype=np.int8),
+        "player": np.zeros(n, dtype=np.int16),
+        "model": np.zeros(n, dtype=np.int16),
+        "action": np.zeros(n, dtype=np.int8),
+        "amount": np.zeros(n, dtype=np.int64),
+        "pot": np.zeros(n, dtype=np.int64),
+        "current_bet": np.zeros(n, dtype=np.int64),
+        "response_time": np.zeros(n, dtype=np.float32),
+        "timestamp": np.zeros(n, dtype=np.float64),
+        "has_error": np.zeros(n, dtype=np.bool_),
+    }
+    texts = []
+    for i, d in enumerate(decisions):
+        game_state = d.get("game_state") or {}
+        columns["hand_number"][i] = d["hand_number"]
+        columns["stage"][i] = stages.code(d["stage"])
+        columns["player"][i] = players.code(d["player_name"])
+        columns["model"][i] = models.code(d["model_name"])
+        columns["action"][i] = actions.code(normalize_action(d.get("parsed_action", "")))
+        columns["amount"][i] = d.get("action_amount", 0)
+        columns["pot"][i] = game_state.get("pot", 0)
+        columns["current_bet"][i] = game_state.get("current_bet", 0)
+        columns["response_time"][i] = d.get("response_time", 0.0)
+        columns["timestamp"][i] = _parse_timestamp(d.get("timestamp", ""))
+        columns["has_error"][i] = bool(d.get("error"))
+        texts.append({key: d.get(key) for key in DECISION_TEXT_FIELDS})
+    columns["text_offsets"] = _write_texts(os.path.join(out_dir, "decision_texts.bin"), texts)
+    np.savez_compressed(os.path.join(out_dir, "decisions.npz"), **columns)
+
+    reflections = log.get("llm_reflections", [])
+    m = len(reflections)
+    reflection_columns = {
+        "hand_number": np.array([r["hand_number"] for r in reflections], dtype=np.int32),
+        "player": np.array([players.code(r["player_name"]) for r in reflections], dtype=np.int16),
+        "model": np.array([models.code(r["model_name"]) for r in reflections], dtype=np.int16),
+        "timestamp": np.array([_parse_timestamp(r.get("timestamp", "")) for r in reflections], dtype=np.float64),
+    }
+    reflection_columns["text_offsets"] = _write_texts(
+        os.path.join(out_dir, "reflection_texts.bin"),
+        [{key: r.get(key) for key in REFLECTION_TEXT_FIELDS} for r in reflections]
+    )
+    np.savez_compressed(os.path.join(out_dir, "reflections.npz"), **reflection_columns)
+
+    events = log.get("events", [])
+    np.savez_compressed(
+        os.path.join(out_dir, "events.npz"),
+        type=np.array([e.get("type", 0) for e in events], dtype=np.int8),
+        hand_number=np.array([e.get("hand_number", 0) for e in events], dtype=np.int32),
+        pot=np.array([e.get("pot", 0) for e in events], dtype=np.int64),
+        text_offsets=_write_texts(os.path.join(out_dir, "event_texts.bin"), events),
+    )
+
+    meta = {
+        "format_version": FORMAT_VERSION,
+        "game_id": log.get("game_id", ""),
+        "start_time": log.get("start_time", ""),
+        "end_time": log.get("end_time", ""),
+        "initial_chips": log.get("initial_chips", 0),
+        "small_blind": log.get("small_blind", 0),
+        "big_blind": log.get("big_blind", 0),
+        "seed": log.get("seed"),
+        "players": log.get("players", []),
+        "final_rankings": log.get("final_rankings", []),
+        "total_decisions": n,
+        "total_reflections": m,
+        "total_hands": int(max([e.get("hand_number", 0) for e in events], default=0)),
+        "vocab": {
+            "stage": stages.values,
+            "player": players.values,
+            "model": models.values,
+            "action": actions.values,
+        }
+    }
+    with open(os.path.join(out_dir, "prompt_store.json"), 'w', encoding='utf-8') as f:
+        json.dump({
+            "prompt_templates": log.get("prompt_templates", {}),
+            "prompt_blobs": log.get("prompt_blobs", {})
+        }, f, ensure_ascii=False)
+    with open(os.path.join(out_dir, "meta.json"), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    return out_dir
+
+
+class ColumnarLog:
+    """列式存储的只读视图，数值列一次性载入，文本字段按行按需解压"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        self.vocab: Dict[str, List[str]] = self.meta["vocab"]
+        with np.load(os.path.join(path, "decisions.npz")) as data:
+            self.decisions: Dict[str, np.ndarray] = {key: data[key] for key in data.files}
+        self._reflections: Optional[Dict[str, np.ndarray]] = None
+        self._events: Optional[Dict[str, np.ndarray]] = None
+        self._prompt_store: Optional[Dict[str, Dict[str, str]]] = None
+
+    @property
+    def prompt_store(self) -> Dict[str, Dict[str, str]]:
+        if self._prompt_store is None:
+            filename = os.path.join(self.path, "prompt_store.json")
+            if os.path.exists(filename):
+                with open(filename, 'r', encoding='utf-8') as f:
+                    self._prompt_store = json.load(f)
+            else:
+                self._prompt_store = {"prompt_templates": {}, "prompt_blobs": {}}
+        return self._prompt_store
+
+    def resolve_prompt(self, texts: Dict[str, Any]) -> str:
+        """还原去重存储的完整prompt"""
+        return resolve_prompt(texts, self.prompt_store["prompt_templates"], self.prompt_store["prompt_blobs"])
+
+    @property
+    def reflections(self) -> Dict[str, np.ndarray]:
+        if self._reflections is None:
+            with np.load(os.path.join(self.path, "reflections.npz")) as data:
+                self._reflections = {key: data[key] for key in data.files}
+        return self._reflections
+
+    @property
+    def events(self) -> Dict[str, np.ndarray]:
+        if self._events is None:
+            with np.load(os.path.join(self.path, "events.npz")) as data:
+                self._events = {key: data[key] for key in data.files}
+        return self._events
+
+    def code_of(self, column: str, value: str) -> int:
+        """获取字符串在词表中的编码，不存在时返回 -1"""
+        values = self.vocab[column]
+        return values.index(value) if value in values else -1
+
+    def _read_text(self, filename: str, offsets: np.ndarray, index: int) -> Dict[str, Any]:
+        start, end = int(offsets[index]), int(offsets[index + 1])
+        with open(os.path.join(self.path, filename), 'rb') as f:
+            f.seek(start)
+            return json.loads(zlib.decompress(f.read(end - start)).decode("utf-8"))
+
+    def decision_texts(self, index: int) -> Dict[str, Any]:
+        """按需加载第 index 个决策的大文本字段"""
+        texts = self._read_text("decision_texts.bin", self.decisions["text_offsets"], index)
+        texts["prompt"] = self.resolve_prompt(texts)
+        return texts
+
+    def reflection_texts(self, index: int) -> Dict[str, Any]:
+        texts = self._read_text("reflection_texts.bin", self.reflections["text_offsets"], index)
+        texts["prompt"] = self.resolve_prompt(texts)
+        return texts
+
+    def event(self, index: int) -> Dict[str, Any]:
+        return self._read_text("event_texts.bin", self.events["text_offsets"], index)
+
+    def decision(self, index: int, with_texts: bool = True) -> Dict[str, Any]:
+        """还原第 index 个决策的字典形式（与增强日志中的 llm_decisions 条目一致）"""
+        cols = self.decisions
+        record = {
+            "player_name": self.vocab["player"][cols["player"][index]],
+            "model_name": self.vocab["model"][cols["model"][index]],
+            "hand_number": int(cols["hand_number"][index]),
+            "stage": self.vocab["stage"][cols["stage"][index]],
+            "timestamp": datetime.fromtimestamp(float(cols["timestamp"][index])).isoformat(),
+            "parsed_action": self.vocab["action"][cols["action"][index]],
+            "action_amount": int(cols["amount"][index]),
+            "response_time": float(cols["response_time"][index]),
+        }
+        if with_texts:
+            record.update(self.decision_texts(index))
+        return record
+
+
+def ingest_log_dir(log_dir: str = "game_logs", force: bool = False) -> List[str]:
+    """将 log_dir 下的增强日志转换为列式存储，已是最新的跳过，返回本次转换的游戏ID"""
+    converted = []
+    for filename, game_id in list_log_sources(log_dir):
+        out_dir = get_columnar_path(log_dir, game_id)
+        meta_file = os.path.join(out_dir, "meta.json")
+        if not force and os.path.exists(meta_file) and os.path.getmtime(meta_file) >= os.path.getmtime(filename):
+            continue
+        export_columnar(load_log_source(filename), out_dir)
+        converted.append(game_id)
+    return converted
+
+
+class ColumnarLogAnalyzer(LogAnalyzer):
+    """在列式存储上用 NumPy 完成聚合的日志分析器，没有列式数据的对局回退到 JSON 日志"""
+
+    def __init__(self, log_dir: str = "game_logs", **kwargs):
+        super().__init__(log_dir, **kwargs)
+        self._columnar: Dict[str, ColumnarLog] = {}
+
+    def load_columnar(self, game_id: str) -> Optional[ColumnarLog]:
+        path = get_columnar_path(self.log_dir, game_id)
+        if game_id not in self._columnar:
+            if not os.path.exists(os.path.join(path, "meta.json")):
+                return None
+            self._columnar[game_id] = ColumnarLog(path)
+        return self._columnar[game_id]
+
+    def get_game_summary(self, game_id: str) -> Dict[str, Any]:
+        col = self.load_columnar(game_id)
+        if col is None:
+            return super().get_game_summary(game_id)
+        meta = col.meta
+        return {
+            "game_id": meta["game_id"],
+            "start_time": meta["start_time"],
+            "end_time": meta["end_time"],
+            "players": meta["players"],
+            "total_decisions": meta["total_decisions"],
+            "total_reflections": meta["total_reflections"],
+            "final_rankings": meta["final_rankings"],
+            "total_hands": meta["total_hands"]
+        }
+
+    def get_player_decisions(self, game_id: str, player_name: str) -> List[Dict[str, Any]]:
+        col = self.load_columnar(game_id)
+        if col is None:
+            return super().get_player_decisions(game_id, player_name)
+        rows = np.flatnonzero(col.decisions["player"] == col.code_of("player", player_name))
+        return [col.decision(int(i)) for i in rows]
+
+    def _action_counts(self, col: ColumnarLog, mask: np.ndarray) -> Dict[str, int]:
+        counts = np.bincount(col.decisions["action"][mask], minlength=len(col.vocab["action"]))
+        return {col.vocab["action"][code]: int(count) for code, count in enumerate(counts) if count > 0}
+
+    def analyze_decision_patterns(self, game_id: str, player_name: str) -> Dict[str, Any]:
+        col = self.load_columnar(game_id)
+        if col is None:
+            return super().analyze_decision_patterns(game_id, player_name)
+
+        cols = col.decisions
+        mask = cols["player"] == col.code_of("player", player_name)
+        total_decisions = int(mask.sum())
+        action_distribution = self._action_counts(col, mask)
+
+        stage_action_distribution = {}
+        for code in np.unique(cols["stage"][mask]):
+            stage_action_distribution[col.vocab["stage"][code]] = self._action_counts(col, mask & (cols["stage"] == code))
+
+        def rate(*actions: str) -> float:
+            count = sum(action_distribution.get(a, 0) for a in actions)
+            return count / total_decisions if total_decisions > 0 else 0
+
+        return {
+            "player_name": player_name,
+            "total_decisions": total_decisions,
+            "action_distribution": action_distribution,
+            "stage_action_distribution": stage_action_distribution,
+            "avg_response_time": float(cols["response_time"][mask].astype(np.float64).mean()) if total_decisions > 0 else 0,
+            "aggression_score": rate("raise", "all-in"),
+            "fold_rate": rate("fold"),
+            "call_rate": rate("call")
+        }
+
+    def compare_models(self, game_id: str) -> Dict[str, Any]:
+        col = self.load_columnar(game_id)
+        if col is None:
+            return super().compare_models(game_id)
+
+        cols = col.decisions
+        num_models = len(col.vocab["model"])
+        decisions = np.bincount(cols["model"], minlength=num_models)
+        response_time = np.bincount(cols["model"], weights=cols["response_time"], minlength=num_models)
+
+        def action_count(action: str) -> np.ndarray:
+            return np.bincount(cols["model"], weights=cols["action"] == col.code_of("action", action), minlength=num_models)
+
+        fold_count, raise_count, call_count = action_count("fold"), action_count("raise"), action_count("call")
+
+        comparison = {}
+        for code in np.flatnonzero(decisions):
+            n = int(decisions[code])
+            comparison[col.vocab["model"][code]] = {
+                "total_decisions": n,
+                "avg_response_time": float(response_time[code] / n),
+                "aggression_rate": float(raise_count[code] / n),
+                "fold_rate": float(fold_count[code] / n),
+                "call_rate": float(call_count[code] / n)
+            }
+        return comparison
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="将增强日志转换为列式压缩存储")
+    parser.add_argument("--log-dir", default="game_logs")
+    parser.add_argument("--force", action="store_true", help="重新转换所有日志")
+    args = parser.parse_args()
+
+    converted = ingest_log_dir(args.log_dir, force=args.force)
+    print(f"已转换 {len(converted)} 个日志到 {os.path.join(args.log_dir, COLUMNAR_DIR)}")
@@ -0,0 +1,365 @@
+# decision_quality.py
+# 决策质量分析：对增强日志中每条 llm_decisions 的 game_state 计算胜率、底池赔率和各合法行动的期望值（EV），
+# 按模型汇总实际选择相对最优行动损失的 EV，得到 EV 损失排行榜
+
+import argparse
+import json
+import os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Any, Optional, Tuple
+
+from analyze_logs import normalize_action, list_log_sources, load_log_source
+from equity import parse_cards, equity, stable_seed
+
+DEFAULT_TRIALS = 1000
+RANGE_MODES = ("random", "known")
+
+
+def raise_ev(equity_value: float, context: Dict[str, Any], amount: int) -> float:
+    """加注 amount（本次投入的筹码）的期望值
+
+    简化模型：不计弃牌率，假设只有一名对手跟注到相同金额（不超过对手最多的筹码），之后直接摊牌，
+    对手跟不上的部分退回。这是加注期望值的下限。
+    """
+    amount = min(amount, context["chips"])
+    raise_to = context["bet_in_round"] + amount
+    called = min(max(0, raise_to - context["current_bet"]), context["max_opponent_chips"])
+    uncalled = max(0, raise_to - context["current_bet"]) - called
+    invested = amount - uncalled
+    return equity_value * (context["pot"] + invested + called) - invested
+
+
+def action_evs(equity_value: float, context: Dict[str, Any]) -> Dict[str, float]:
+    """各合法行动的期望值（筹码），以弃牌为0，之前已投入底池的筹码视为沉没成本"""
+    pot, to_call, chips = context["pot"], context["to_call"], context["chips"]
+    evs = {"fold": 0.0}
+    if to_call == 0:
+        evs["check"] = equity_value * pot
+    elif chips > 0:
+        call_amount = min(to_call, chips)
+        evs["call"] = equity_value * (pot + call_amount) - call_amount
+    if chips >= context["min_raise"]:
+        evs["raise"] = raise_ev(equity_value, context, context["min_raise"])
+    if chips > 0:
+        evs["all-in"] = raise_ev(equity_value, context, chips)
+    return evs
+
+
+def evaluate_context(context: Dict[str, Any]) -> Dict[str, Any]:
+    """计算一个局面的胜率、底池赔率和各行动期望值（在子进程中执行）"""
+    # 种子只取决于牌面，同一手牌在不同下注局面下得到一致的胜率
+    card_key = f"{context['hand']}|{context['board']}|{context['opponents']}|{context['known']}"
+    equity_value = equity(
+        parse_cards(context["hand"]),
+        parse_cards(context["board"]),
+        context["opponents"],
+        [parse_cards(h) for h in context["known"]],
+        trials=context["trials"],
+        seed=stable_seed(card_key)
+    )
+    to_call = context["to_call"]
+    return {
+        "equity": equity_value,
+        "pot_odds": to_call / (context["pot"] + to_call) if to_call > 0 else 0.0,
+        "evs": action_evs(equity_value, context)
+    }
+
+
+def context_key(context: Dict[str, Any]) -> str:
+    """局面缓存键：手牌、公共牌、对手（含已知底牌）和下注局面"""
+    return "|".join(str(context[k]) for k in (
+        "hand", "board", "opponents", "known", "pot", "to_call", "current_bet",
+        "bet_in_round", "chips", "min_raise", "max_opponent_chips", "trials"
+    ))
+
+
+def collect_known_hands(log: Dict[str, Any]) -> Dict[int, Dict[str, List[str]]]:
+    """从决策记录和结算事件中收集每手牌各玩家的底牌：hand_number -> {player_name: hand}"""
+    known: Dict[int, Dict[str, List[str]]] = defaultdict(dict)
+    for decision in log.get("llm_decisions", []):
+        hand = (decision.get("game_state") or {}).get("hand") or []
+        if len(hand) == 2:
+            known[decision["hand_number"]][decision["player_name"]] = hand
+    for event in log.get("events", []):
+        if event.get("type") != 6:
+            continue
+        for player in event.get("players", []):
+            if len(player.get("hand") or []) == 2:
+                known[event["hand_number"]].setdefault(player["name"], player["hand"])
+    return known
+
+
+def decision_context(
+    decision: Dict[str, Any],
+    trials: int = DEFAULT_TRIALS,
+    known_hands: Optional[Dict[str, List[str]]] = None
+) -> Optional[Dict[str, Any]]:
+    """从决策记录的 game_state 构建局面，信息不全或已无对手时返回 None
+
+    known_hands 为这手牌中已知的对手底牌（player_name -> hand），未给出的对手视为随机手牌
+    """
+    state = decision.get("game_state") or {}
+    hand = state.get("hand") or []
+    if len(hand) != 2:
+        return None
+    players = state.get("players_info") or []
+    hero = next((p for p in players if p["name"] == decision["player_name"]), None)
+    if hero is None:
+        return None
+    opponents = [p for p in players if p["name"] != hero["name"] and p.get("is_active", True) and not p.get("folded")]
+    if not opponents:
+        return None
+
+    known = []
+    if known_hands:
+        known = sorted(sorted(known_hands[p["name"]]) for p in opponents if p["name"] in known_hands)
+    current_bet = state.get("current_bet", 0)
+    bet_in_round = hero.get("bet_in_round", 0)
+    return {
+        "hand": sorted(hand),
+        "board": sorted(state.get("community_cards") or []),
+        "opponents": len(opponents),
+        "known": known,
+        "pot": state.get("pot", 0),
+        "to_call": max(0, current_bet - bet_in_round),
+        "current_bet": current_bet,
+        "bet_in_round": bet_in_round,
+        "chips": hero.get("chips", 0),
+        "min_raise": state.get("min_raise", 0),
+        # 对手在当前最高下注之上最多还能跟多少
+        "max_opponent_chips": max(0, max(p.get("chips", 0) + p.get("bet_in_round", 0) for p in opponents) - current_bet),
+        "big_blind": state.get("big_blind", 0),
+        "trials": trials
+    }
+
+
+def chosen_action_ev(decision: Dict[str, Any], context: Dict[str, Any], result: Dict[str, Any]) -> Tuple[str, Optional[float]]:
+    """实际选择的行动及其期望值，引擎会拒绝的行动（如面对下注时过牌）返回 None"""
+    action = normalize_action(decision.get("parsed_action", ""))
+    evs = result["evs"]
+    if action == "raise":
+        amount = decision.get("action_amount", 0) or context["min_raise"]
+        if context["min_raise"] <= amount <= context["chips"]:
+            return action, raise_ev(result["equity"], context, amount)
+        return action, None
+    return action, evs.get(action)
+
+
+class DecisionQualityAnalyzer:
+    """批量评估所有对局中 LLM 决策的质量
+
+    每个不同的局面（手牌、公共牌、下注局面）只计算一次：结果按局面缓存到 cache_file，
+    未缓存的局面用进程池并行计算。ranges 为 "random" 时对手视为随机手牌，
+    为 "known" 时使用日志中对手的真实底牌（事后视角）。
+    """
+
+    CACHE_VERSION = 1
+
+    def __init__(
+        self,
+        log_dir: str = "game_logs",
+        cache_file: Optional[str] = None,
+        max_workers: Optional[int] = None,
+        trials: int = DEFAULT_TRIALS,
+        ranges: str = "random",
+        mistake_bb: float = 1.0
+    ):
+        if ranges not in RANGE_MODES:
+            raise ValueError(f"ranges 只能是 {RANGE_MODES}")
+        self.log_dir = log_dir
+        self.cache_file = cache_file or os.path.join(log_dir, ".decision_quality_cache.json")
+        self.max_workers = max_workers
+        self.trials = trials
+        self.ranges = ranges
+        self.mistake_bb = mistake_bb  # EV 损失超过多少个大盲注算作失误
+        self.last_computed = 0  # 最近一次评估中新计算的局面数
+
+    def _load_cache(self) -> Dict[str, Any]:
+        if not os.path.exists(self.cache_file):
+            return {}
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if cache.get("version") != self.CACHE_VERSION:
+            return {}
+        return cache.get("contexts", {})
+
+    def _save_cache(self, contexts: Dict[str, Any]):
+        tmp_file = self.cache_file + ".tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump({"version": self.CACHE_VERSION, "contexts": contexts}, f, ensure_ascii=False)
+        os.replace(tmp_file, self.cache_file)
+
+    def collect_decisions(self) -> List[Dict[str, Any]]:
+        """读取所有对局日志（包括只有分段存储的对局），返回 [{game_id, model_name, decision, context}]"""
+        items = []
+        for filename, _ in list_log_sources(self.log_dir):
+            log = load_log_source(filename)
+            player_models = {p["name"]: p.get("model_name", "unknown") for p in log.get("players", [])}
+            known_by_hand = collect_known_hands(log) if self.ranges == "known" else {}
+            for decision in log.get("llm_decisions", []):
+                known_hands = None
+                if known_by_hand:
+                    known_hands = known_by_hand.get(decision["hand_number"], {})
+                items.append({
+                    "game_id": log.get("game_id", ""),
+                    "model_name": decision.get("model_name") or player_models.get(decision["player_name"], "unknown"),
+                    "decision": decision,
+                    "context": decision_context(decision, self.trials, known_hands)
+                })
+        return items
+
+    def evaluate_contexts(self, contexts: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """计算所有局面（按键去重、优先使用缓存），返回 key -> 结果"""
+        cached = self._load_cache()
+        unique: Dict[str, Dict[str, Any]] = {}
+        for context in contexts:
+            unique.setdefault(context_key(context), context)
+
+        pending = [(key, context) for key, context in unique.items() if key not in cached]
+        if pending:
+            pending_contexts = [context for _, context in pending]
+            if len(pending) == 1 or self.max_workers == 1:
+                results = [evaluate_context(context) for context in pending_contexts]
+            else:
+                with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+                    chunksize = max(1, len(pending) // ((self.max_workers or os.cpu_count() or 1) * 4))
+                    results = list(executor.map(evaluate_context, pending_contexts, chunksize=chunksize))
+            for (key, _), result in zip(pending, results):
+                cached[key] = result
+            self._save_cache(cached)
+        self.last_computed = len(pending)
+        return {key: cached[key] for key in unique}
+
+    def score_decisions(self) -> List[Dict[str, Any]]:
+        """评估每条决策，返回胜率、底池赔率、各行动期望值、最优行动和 EV 损失"""
+        items = self.collect_decisions()
+        results = self.evaluate_contexts([item["context"] for item in items if item["context"]])
+
+        scored = []
+        for item in items:
+            decision, context = item["decision"], item["context"]
+            entry = {
+                "game_id": item["game_id"],
+                "model_name": item["model_name"],
+                "player_name": decision["player_name"],
+                "hand_number": decision["hand_number"],
+                "stage": decision.get("stage", ""),
+                "action": normalize_action(decision.get("parsed_action", "")),
+                "scored": False
+            }
+            if context:
+                result = results[context_key(context)]
+                action, chosen_ev = chosen_action_ev(decision, context, result)
+                evs = result["evs"]
+                best_action = max(evs, key=evs.get)
+                entry.update({
+                    "equity": result["equity"],
+                    "pot_odds": result["pot_odds"],
+                    "evs": evs,
+                    "best_action": best_action,
+                    "chosen_ev": chosen_ev,
+                    "big_blind": context["big_blind"]
+                })
+                if chosen_ev is not None:
+                    ev_loss = max(0.0, evs[best_action] - chosen_ev)
+                    entry.update({
+                        "scored": True,
+                        "ev_loss": ev_loss,
+                        "ev_loss_bb": ev_loss / context["big_blind"] if context["big_blind"] else 0.0
+                    })
+                else:
+                    entry["invalid"] = True
+            scored.append(entry)
+        return scored
+
+    def leaderboard(self) -> Dict[str, Any]:
+        """按模型汇总 EV 损失，平均每次决策损失的大盲注数越少排名越靠前"""
+        scored = self.score_decisions()
+        models: Dict[str, Dict[str, Any]] = {}
+        for entry in scored:
+            stats = models.setdefault(entry["model_name"], {
+                "decisions": 0, "scored": 0, "invalid": 0, "mistakes": 0, "best_actions": 0,
+                "total_ev_loss": 0.0, "total_ev_loss_bb": 0.0, "equity_sum": 0.0,
+                "stage_loss_bb": defaultdict(float), "stage_scored": defaultdict(int)
+            })
+            stats["decisions"] += 1
+            if entry.get("invalid"):
+                stats["invalid"] += 1
+            if not entry["scored"]:
+                continue
+            stats["scored"] += 1
+            stats["total_ev_loss"] += entry["ev_loss"]
+            stats["total_ev_loss_bb"] += entry["ev_loss_bb"]
+            stats["equity_sum"] += entry["equity"]
+            stats["stage_loss_bb"][entry["stage"]] += entry["ev_loss_bb"]
+            stats["stage_scored"][entry["stage"]] += 1
+            if entry["ev_loss_bb"] > self.mistake_bb:
+                stats["mistakes"] += 1
+            if entry["ev_loss"] <= 1e-9:
+                stats["best_actions"] += 1
+
+        board = []
+        for model_name, stats in models.items():
+            n = stats["scored"]
+            board.append({
+                "model_name": model_name,
+                "decisions": stats["decisions"],
+                "scored_decisions": n,
+                "invalid_actions": stats["invalid"],
+                "total_ev_loss": stats["total_ev_loss"],
+                "avg_ev_loss_bb": stats["total_ev_loss_bb"] / n if n else 0.0,
+                "mistake_rate": stats["mistakes"] / n if n else 0.0,
+                "best_action_rate": stats["best_actions"] / n if n else 0.0,
+                "avg_equity": stats["equity_sum"] / n if n else 0.0,
+                "stage_avg_ev_loss_bb": {
+                    stage: loss / stats["stage_scored"][stage] for stage, loss in stats["stage_loss_bb"].items()
+                }
+            })
+        board.sort(key=lambda m: (m["scored_decisions"] == 0, m["avg_ev_loss_bb"]))
+        return {
+            "ranges": self.ranges,
+            "trials": self.trials,
+            "total_decisions": len(scored),
+            "computed_contexts": self.last_computed,
+            "leaderboard": board
+        }
+
+
+def print_leaderboard(result: Dict[str, Any]):
+    """打印 EV 损失排行榜"""
+    print(f"共 {result['total_decisions']} 条决策，本次新计算 {result['computed_contexts']} 个局面"
+          f"（对手范围: {result['ranges']}，模拟次数: {result['trials']}）")
+    print("=" * 96)
+    print(f"{'排名':<6}{'模型':<24}{'评估决策':>10}{'平均损失(BB)':>14}{'失误率':>10}{'最优率':>10}{'平均胜率':>10}{'无效行动':>10}")
+    for i, m in enumerate(result["leaderboard"], 1):
+        print(
+            f"{i:<6}{m['model_name']:<24}{m['scored_decisions']:>10}{m['avg_ev_loss_bb']:>14.3f}"
+            f"{m['mistake_rate']:>10.1%}{m['best_action_rate']:>10.1%}{m['avg_equity']:>10.1%}{m['invalid_actions']:>10}"
+        )
+    for m in result["leaderboard"]:
+        stages = ", ".join(f"{stage}: {loss:.3f}" for stage, loss in sorted(m["stage_avg_ev_loss_bb"].items()))
+        print(f"  {m['model_name']} 各阶段平均损失(BB): {stages}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="计算 LLM 决策的胜率与期望值，生成各模型的 EV 损失排行榜")
+    parser.add_argument("--log-dir", default="game_logs")
+    parser.add_argument("--workers", type=int, default=None, help="进程数，默认使用全部CPU")
+    parser.add_argument("--trials", type=int, default=DEFAULT_TRIALS, help="每个局面的蒙特卡洛模拟次数")
+    parser.add_argument("--ranges", choices=RANGE_MODES, default="random", help="对手范围：随机手牌或日志中的真实底牌")
+    parser.add_argument("--mistake-bb", type=float, default=1.0, help="EV 损失超过多少个大盲注算作失误")
+    parser.add_argument("--json", action="store_true", help="以JSON格式输出")
+    args = parser.parse_args()
+
+    analyzer = DecisionQualityAnalyzer(
+        args.log_dir, max_workers=args.workers, trials=args.trials, ranges=args.ranges, mistake_bb=args.mistake_bb
+    )
+    result = analyzer.leaderboard()
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+    else:
+        print_leaderboard(result)
@@ -0,0 +1,238 @@
+# early_stopping.py
+# 序贯提前停止：每手牌结束后用运气调整后的盈亏更新每一对玩家的统计量，
+# 一旦所有玩家之间的比较都已有结论（某一方明显更强，或差距明显小于关心的最小效应）就停止对局或整批对局
+#
+# 两种规则（d 为同一手牌中两名玩家盈亏之差，以大盲注计，δ 为最小效应）：
+#   sprt  Wald 序贯概率比检验，对每一对玩家同时做 μ=0 对 μ=+δ 和 μ=0 对 μ=-δ 两个单侧检验：
+#         任一侧接受 H1 判定胜负，两侧都接受 H0 判定差距小于 δ
+#   ci    任意时刻有效的置信序列（正态混合边界），每手都检查也不会放大第一类错误：
+#         区间不含 0 判定胜负，区间落在 (-δ, δ) 内判定差距小于 δ
+# 每手牌的开销为一次 adjust_hand（estimator 为 realised 时几乎为零）加上 O(玩家数²) 的累加
+
+import math
+import threading
+from dataclasses import dataclass, field, asdict
+from itertools import combinations
+from typing import Dict, List, Any, Optional, Tuple
+
+from game_events import PotAwardedEvent, TableEvent
+from luck_adjust import ESTIMATORS, adjust_hand, hand_results
+
+STOP_RULES = ("sprt", "ci")
+
+
+@dataclass
+class PairStats:
+    """一对玩家每手盈亏之差（first - second，以大盲注计）的累加值"""
+    first: str
+    second: str
+    n: int = 0
+    total: float = 0.0
+    total_sq: float = 0.0
+    verdict: Optional[str] = None  # 胜者的名字，或 "too_close"
+    decided_at: int = 0
+
+    def add(self, diff: float):
+        self.n += 1
+        self.total += diff
+        self.total_sq += diff * diff
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.n if self.n else 0.0
+
+    @property
+    def variance(self) -> float:
+        if self.n < 2:
+            return 0.0
+        return max((self.total_sq - self.total * self.total / self.n) / (self.n - 1), 0.0)
+
+
+@dataclass
+class StopDecision:
+    """提前停止的结论"""
+    rule: str
+    hands: int
+    message: str
+    pairs: List[Dict[str, Any]] = field(default_factory=list)
+
+
+class EarlyStopping:
+    """序贯停止规则，可以被一场对局使用，也可以由一批对局（如复式赛的各张牌桌）共享
+
+    min_effect_bb100: 关心的最小效应（BB/100），差距小于它的比较视为“太接近、不值得继续打”
+    alpha / beta: 第一类、第二类错误率，alpha 在所有玩家对之间平均分配
+    estimator: 使用的每手盈亏估计（realised / allin / aivat，见 luck_adjust.py）
+    min_hands: 每一对玩家至少同时打这么多手牌才开始判断（方差估计需要一定样本）
+    """
+
+    def __init__(
+        self,
+        rule: str = "sprt",
+        min_effect_bb100: float = 50.0,
+        alpha: float = 0.05,
+        beta: float = 0.2,
+        estimator: str = "aivat",
+        trials: int = 200,
+        min_hands: int = 30
+    ):
+        if rule not in STOP_RULES:
+            raise ValueError(f"未知的停止规则: {rule}")
+        if estimator not in ESTIMATORS:
+            raise ValueError(f"未知的估计方法: {estimator}")
+        self.rule = rule
+        self.delta = min_effect_bb100 / 100
+        self.alpha = alpha
+        self.beta = beta
+        self.estimator = estimator
+        self.trials = trials
+        self.min_hands = min_hands
+        self.hands = 0
+        self.pairs: Dict[Tuple[str, str], PairStats] = {}
+        self.decision: Optional[StopDecision] = None
+        self._last_players: List[str] = []
+        self._lock = threading.Lock()
+
+    @property
+    def stopped(self) -> bool:
+        return self.decision is not None
+
+    def attach(self, table: Any, game_id: str = "") -> "HandResultSink":
+        """订阅牌桌事件，每手牌结束时自动调用 add_hand"""
+        sink = HandResultSink(self, game_id)
+        table.events.subscribe(sink)
+        return sink
+
+    def add_hand(self, results: Dict[str, float], big_blind: int) -> Optional[StopDecision]:
+        """加入一手牌的盈亏（筹码），满足停止条件时返回结论"""
+        if big_blind <= 0 or len(results) < 2:
+            return self.decision
+        with self._lock:
+            self.hands += 1
+            names = sorted(results)
+            self._last_players = names
+            for first, second in combinations(names, 2):
+                pair = self.pairs.get((first, second))
+                if pair is None:
+                    pair = self.pairs[(first, second)] = PairStats(first, second)
+                if pair.verdict is None:
+                    pair.add((results[first] - results[second]) / big_blind)
+                    pair.verdict = self._judge(pair)
+                    if pair.verdict:
+                        pair.decided_at = self.hands
+            if self.decision is None and self._all_resolved():
+                self.decision = self._make_decision()
+            return self.decision
+
+    def _pair_alpha(self) -> float:
+        return self.alpha / max(len(self.pairs), 1)
+
+    def _judge(self, pair: PairStats) -> Optional[str]:
+        if pair.n < self.min_hands or pair.variance <= 0:
+            return None
+        if self.rule == "sprt":
+            return self._judge_sprt(pair)
+        return self._judge_ci(pair)
+
+    def _judge_sprt(self, pair: PairStats) -> Optional[str]:
+        # 正态近似下 μ=0 对 μ=±δ 的对数似然比，方差用样本方差代替
+        alpha = self._pair_alpha() / 2
+        upper = math.log((1 - self.beta) / alpha)
+        lower = math.log(self.beta / (1 - alpha))
+        scale = self.delta / pair.variance
+        llr_first = scale * (pair.total - pair.n * self.delta / 2)
+        llr_second = scale * (-pair.total - pair.n * self.delta / 2)
+        if llr_first >= upper:
+            return pair.first
+        if llr_second >= upper:
+            return pair.second
+        if llr_first <= lower and llr_second <= lower:
+            return "too_close"
+        return None
+
+    def confidence_halfwidth(self, pair: PairStats) -> float:
+        """置信序列在当前样本量下的半宽（大盲注/手），min_hands 附近最紧"""
+        n, m = pair.n, self.min_hands
+        sigma = math.sqrt(pair.variance)
+        return sigma * math.sqrt(2 * (n + m) * math.log(math.sqrt((n + m) / m) * 2 / self._pair_alpha())) / n
+
+    def _judge_ci(self, pair: PairStats) -> Optional[str]:
+        half = self.confidence_halfwidth(pair)
+        low, high = pair.mean - half, pair.mean + half
+        if low > 0:
+            return pair.first
+        if high < 0:
+            return pair.second
+        if -self.delta < low and high < self.delta:
+            return "too_close"
+        return None
+
+    def _all_resolved(self) -> bool:
+        # 只看最近一手牌中仍在桌上的玩家，已经出局的玩家不会再有新数据
+        current = [self.pairs[p] for p in combinations(self._last_players, 2)]
+        return bool(current) and all(pair.verdict for pair in current)
+
+    def _pair_summary(self, pair: PairStats) -> Dict[str, Any]:
+        summary = {
+            "pair": [pair.first, pair.second],
+            "hands": pair.n,
+            "mean_diff_bb_per_100": pair.mean * 100,
+            "std_bb": math.sqrt(pair.variance),
+            "verdict": pair.verdict,
+            "decided_at": pair.decided_at
+        }
+        if self.rule == "ci" and pair.n:
+            half = self.confidence_halfwidth(pair) * 100
+            summary["cs_bb_per_100"] = [pair.mean * 100 - half, pair.mean * 100 + half]
+        return summary
+
+    def _make_decision(self) -> StopDecision:
+        pairs = [self._pair_summary(self.pairs[p]) for p in combinations(self._last_players, 2)]
+        parts = []
+        for pair in pairs:
+            first, second = pair["pair"]
+            if pair["verdict"] == "too_close":
+                parts.append(f"{first} 与 {second} 差距小于 {self.delta * 100:g} BB/100")
+            else:
+                loser = second if pair["verdict"] == first else first
+                parts.append(f"{pair['verdict']} 强于 {loser}")
+        message = f"{self.rule.upper()} 在第 {self.hands} 手得出结论: " + "；".join(parts)
+        return StopDecision(rule=self.rule, hands=self.hands, message=message, pairs=pairs)
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "rule": self.rule,
+                "estimator": self.estimator,
+                "min_effect_bb100": self.delta * 100,
+                "alpha": self.alpha,
+                "beta": self.beta,
+                "hands": self.hands,
+                "stopped": self.decision is not None,
+                "decision": asdict(self.decision) if self.decision else None,
+                "pairs": [self._pair_summary(pair) for pair in self.pairs.values()]
+            }
+
+
+class HandResultSink:
+    """牌桌事件总线的 sink：收集一手牌的旧版记录，结算后计算每名玩家的盈亏交给 EarlyStopping"""
+
+    def __init__(self, stopper: EarlyStopping, game_id: str = ""):
+        self.stopper = stopper
+        self.game_id = game_id
+        self._records: List[Dict[str, Any]] = []  # 盲注记录在 HandStartedEvent 之前，因此从上一次结算后开始收集
+
+    def __call__(self, event: TableEvent):
+        self._records.append(event.to_legacy())
+        if not isinstance(event, PotAwardedEvent):
+            return
+        records, self._records = self._records, []
+        if self.stopper.estimator == "realised":
+            hands = hand_results(records)
+            if hands:
+                self.stopper.add_hand(hands[0]["players"], hands[0]["big_blind"])
+            return
+        adjusted = adjust_hand(records, self.stopper.trials, seed_key=f"{self.game_id}:{event.hand_number}")
+        if adjusted:
+            results = {name: values[self.stopper.estimator] for name, values in adjusted["players"].items()}
+            self.stopper.add_hand(results, adjusted["big_blind"])
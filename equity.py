@@ -0,0 +1,173 @@
+# equity.py
+# 胜率（equity）计算：把日志中的牌面字符串（如 "♠A"、"♥10"）解析为整数编码，
+# 用快速的7张牌评估函数做蒙特卡洛模拟或穷举，供决策质量分析和运气调整使用
+
+import hashlib
+import random
+from itertools import combinations
+from math import comb
+from typing import List, Tuple, Optional, Sequence
+
+SUITS = "♠♥♣♦"
+VALUE_NAMES = {"J": 11, "Q": 12, "K": 13, "A": 14}
+
+# 牌型类别，数值越大越强（与 HandRank 一致，皇家同花顺归入同花顺）
+HIGH_CARD, ONE_PAIR, TWO_PAIR, THREE_OF_A_KIND, STRAIGHT, FLUSH, FULL_HOUSE, FOUR_OF_A_KIND, STRAIGHT_FLUSH = range(9)
+
+FULL_DECK = [value * 4 + suit for value in range(2, 15) for suit in range(4)]
+
+
+def parse_card(text: str) -> int:
+    """把 "♠A"、"♥10" 这样的牌面字符串转换为整数编码 value * 4 + suit"""
+    text = text.strip()
+    suit = SUITS.index(text[0])
+    value_str = text[1:].upper()
+    value = VALUE_NAMES.get(value_str) or int(value_str)
+    if not 2 <= value <= 14:
+        raise ValueError(f"无效的牌面: {text}")
+    return value * 4 + suit
+
+
+def parse_cards(texts: Sequence[str]) -> List[int]:
+    return [parse_card(t) for t in texts]
+
+
+def card_str(card: int) -> str:
+    value = card >> 2
+    names = {11: 'J', 12: 'Q', 13: 'K', 14: 'A'}
+    return f"{SUITS[card & 3]}{names.get(value, str(value))}"
+
+
+def _straight_high(mask: int) -> int:
+    """mask 的第 v 位表示有点数 v 的牌，返回最大顺子的最高点数，没有顺子返回0"""
+    if mask & (1 << 14):
+        mask |= 1 << 1  # A 也可以当作 1
+    for high in range(14, 4, -1):
+        if (mask >> (high - 4)) & 0b11111 == 0b11111:
+            return high
+    return 0
+
+
+def evaluate(cards: Sequence[int]) -> Tuple[int, ...]:
+    """评估5-7张牌的最佳牌型，返回可直接比较大小的元组 (类别, 关键点数...)"""
+    suit_counts = [0, 0, 0, 0]
+    counts = {}
+    mask = 0
+    for card in cards:
+        value = card >> 2
+        suit_counts[card & 3] += 1
+        counts[value] = counts.get(value, 0) + 1
+        mask |= 1 << value
+
+    flush_values = None
+    for suit in range(4):
+        if suit_counts[suit] >= 5:
+            flush_values = sorted((c >> 2 for c in cards if c & 3 == suit), reverse=True)
+            flush_mask = 0
+            for value in flush_values:
+                flush_mask |= 1 << value
+            high = _straight_high(flush_mask)
+            if high:
+                return (STRAIGHT_FLUSH, high)
+            break
+
+    groups = sorted(((count, value) for value, count in counts.items()), reverse=True)
+    top_count, top_value = groups[0]
+
+    if top_count == 4:
+        return (FOUR_OF_A_KIND, top_value, max(v for v in counts if v != top_value))
+    if top_count == 3 and len(groups) > 1 and groups[1][0] >= 2:
+        return (FULL_HOUSE, top_value, groups[1][1])
+    if flush_values:
+        return (FLUSH,) + tuple(flush_values[:5])
+    high = _straight_high(mask)
+    if high:
+        return (STRAIGHT, high)
+    if top_count == 3:
+        kickers = sorted((v for v in counts if v != top_value), reverse=True)[:2]
+        return (THREE_OF_A_KIND, top_value) + tuple(kickers)
+    if top_count == 2 and groups[1][0] == 2:
+        second = groups[1][1]
+        kicker = max((v for v in counts if v != top_value and v != second), default=0)
+        return (TWO_PAIR, top_value, second, kicker)
+    if top_count == 2:
+        kickers = sorted((v for v in counts if v != top_value), reverse=True)[:3]
+        return (ONE_PAIR, top_value) + tuple(kickers)
+    return (HIGH_CARD,) + tuple(sorted(counts, reverse=True)[:5])
+
+
+def stable_seed(key: str) -> int:
+    """由字符串得到稳定的随机种子，同一局面在不同进程、不同次运行中得到相同的模拟结果"""
+    return int(hashlib.md5(key.encode("utf-8")).hexdigest()[:8], 16)
+
+
+def _showdown_shares(hands: List[List[int]], board: List[int]) -> List[float]:
+    """一次摊牌中每手牌分得的份额（平局均分）"""
+    ranks = [evaluate(hand + board) for hand in hands]
+    best = max(ranks)
+    winners = [i for i, rank in enumerate(ranks) if rank == best]
+    share = 1.0 / len(winners)
+    result = [0.0] * len(hands)
+    for i in winners:
+        result[i] = share
+    return result
+
+
+def hand_equities(
+    hands: List[List[int]],
+    board: List[int],
+    random_opponents: int = 0,
+    trials: int = 1000,
+    seed: Optional[int] = None
+) -> List[float]:
+    """计算每手已知底牌的胜率（平局按份额计），random_opponents 为底牌未知（随机）的对手数
+
+    没有随机对手且剩余公共牌的组合数不超过 trials 时穷举，否则做 trials 次蒙特卡洛模拟。
+    """
+    if not hands:
+        return []
+    dead = set(board)
+    for hand in hands:
+        dead.update(hand)
+    if len(dead) != len(board) + sum(len(h) for h in hands):
+        raise ValueError("牌面中有重复的牌")
+    deck = [card for card in FULL_DECK if card not in dead]
+    missing = 5 - len(board)
+    totals = [0.0] * len(hands)
+
+    if random_opponents == 0 and comb(len(deck), missing) <= trials:
+        runs = 0
+        for runout in combinations(deck, missing):
+            full_board = board + list(runout)
+            for i, share in enumerate(_showdown_shares(hands, full_board)):
+                totals[i] += share
+            runs += 1
+        return [total / runs for total in totals]
+
+    rng = random.Random(seed)
+    need = missing + 2 * random_opponents
+    fixed = len(hands)
+    for _ in range(trials):
+        sample = rng.sample(deck, need)
+        full_board = board + sample[:missing]
+        all_hands = list(hands)
+        for j in range(random_opponents):
+            start = missing + 2 * j
+            all_hands.append(sample[start:start + 2])
+        shares = _showdown_shares(all_hands, full_board)
+        for i in range(fixed):
+            totals[i] += shares[i]
+    return [total / trials for total in totals]
+
+
+def equity(
+    hand: List[int],
+    board: List[int],
+    opponents: int = 1,
+    known_opponents: Optional[List[List[int]]] = None,
+    trials: int = 1000,
+    seed: Optional[int] = None
+) -> float:
+    """hand 对抗 opponents 个对手的胜率，其中 known_opponents 的底牌已知，其余对手视为随机手牌"""
+    known = [list(h) for h in (known_opponents or [])][:opponents]
+    return hand_equities([list(hand)] + known, list(board), opponents - len(known), trials, seed)[0]
@@ -15,6 +15,7 @@ export const useLiveGameStore = defineStore('liveGame', () => {
   const apiBase = ref(getDefaultApiBase())
 
   const heroToken = ref('')
+  const roomId = ref('')
 
   const connected = ref(false)
   const connecting = ref(false)
@@ -22,21 +23,27 @@ export const useLiveGameStore = defineStore('liveGame', () => {
 
   const ws = ref(null)
   const lastError = ref('')
+  let reconnectAttempts = 0
 
   const snapshot = ref(null)
+  const lastSeq = ref(0)
   const status = ref('created')
   const actionRequest = ref(null)
+  // 本地时钟上的行动截止时间（毫秒），按服务端下发的剩余秒数换算，避免两端时钟不一致
+  const actionDeadline = ref(null)
   const eventLog = ref([])
 
   function resetRuntimeState() {
     snapshot.value = null
+    lastSeq.value = 0
     actionRequest.value = null
+    actionDeadline.value = null
     eventLog.value = []
     lastError.value = ''
   }
 
   async function startGame(payload = {}) {
-    const res = await fetch(`${apiBase.value}/start`, {
+    const res = await fetch(`${apiBase.value}/rooms`, {
       method: 'POST',
       headers: { 'Content-Type': 'application/json' },
       body: JSON.stringify(payload || {}),
@@ -47,6 +54,7 @@ export const useLiveGameStore = defineStore('liveGame', () => {
     }
     const data = await res.json()
     heroToken.value = data.hero_token || ''
+    roomId.value = data.room_id || ''
     status.value = data.status || 'created'
     return data
   }
@@ -56,15 +64,51 @@ export const useLiveGameStore = defineStore('liveGame', () => {
     if (eventLog.value.length > 200) eventLog.value.length = 200
   }
 
+  function applyStateDelta(delta) {
+    const s = snapshot.value
+    // 基准版本对不上（中间丢了消息或还没收到快照）时丢弃增量，重新请求完整快照
+    if (!s || s.version !== delta.base_version) {
+      requestSnapshot()
+      return
+    }
+    const players = (delta.changes && delta.changes.players) || s.players.map((p) => ({ ...p }))
+    for (const seat of delta.seats || []) {
+      const { seat: idx, ...fields } = seat
+      players[idx] = { ...players[idx], ...fields }
+    }
+    snapshot.value = { ...s, ...(delta.changes || {}), players, version: delta.version }
+  }
+
   function applyServerMessage(msg) {
     if (!msg || typeof msg !== 'object') return
 
     const type = msg.type
     const payload = msg.payload || {}
     if (type === 'STATE_SNAPSHOT') {
+      // 快照的 seq 是服务端流的当前位置，之后的消息从它的下一个开始
       snapshot.value = payload
+      lastSeq.value = msg.seq || 0
+      pushEvent({ ts: msg.ts, seq: msg.seq, type, payload })
+      return
+    }
+    if (typeof msg.seq === 'number' && msg.seq > lastSeq.value) {
+      if (lastSeq.value && msg.seq > lastSeq.value + 1) requestSnapshot()
+      lastSeq.value = msg.seq
+    }
+    if (type === 'STATE_DELTA') {
+      applyStateDelta(payload)
+      return
     } else if (type === 'ACTION_REQUEST') {
       actionRequest.value = payload
+      const remaining = payload.clock?.remaining
+      actionDeadline.value = typeof remaining === 'number' ? Date.now() + remaining * 1000 : null
+    } else if (type === 'ACTION_TIMEOUT') {
+      actionRequest.value = null
+      actionDeadline.value = null
+      lastError.value = `行动超时，已自动${payload.action === 'check' ? '过牌' : '弃牌'}（连续 ${payload.timeouts} 次）`
+    } else if (type === 'ROOM_IDLE') {
+      status.value = 'idle'
+      lastError.value = '连续超时未行动，房间已结束'
     } else if (type === 'ERROR') {
       lastError.value = payload.error || '未知错误'
     } else if (type === 'STARTED') {
@@ -81,20 +125,29 @@ export const useLiveGameStore = defineStore('liveGame', () => {
     })
   }
 
-  async function connectGameWs({ token } = {}) {
+  function roomPath(path) {
+    return roomId.value ? `/rooms/${encodeURIComponent(roomId.value)}${path}` : path
+  }
+
+  async function connectGameWs({ token, room, resume = false } = {}) {
     if (connecting.value) return
 
     if (token !== undefined) heroToken.value = token
+    if (room !== undefined) roomId.value = room
+
+    // 断线重连时保留本地状态，带上最后收到的 seq，服务端只补发错过的消息
+    const resumeFrom = resume && snapshot.value ? lastSeq.value : null
 
     disconnectWs()
-    resetRuntimeState()
+    if (resumeFrom === null) resetRuntimeState()
 
     connecting.value = true
     lastError.value = ''
 
     const baseWs = httpUrlToWsUrl(apiBase.value)
-    const url = new URL(`${baseWs}/ws`)
+    const url = new URL(`${baseWs}${roomPath('/ws')}`)
     if (heroToken.value) url.searchParams.set('token', heroToken.value)
+    if (resumeFrom !== null) url.searchParams.set('last_seq', String(resumeFrom))
 
     const socket = new WebSocket(url.toString())
     ws.value = socket
@@ -102,6 +155,7 @@ export const useLiveGameStore = defineStore('liveGame', () => {
     socket.onopen = () => {
       connected.value = true
       connecting.value = false
+      reconnectAttempts = 0
     }
 
     socket.onmessage = (evt) => {
@@ -117,12 +171,24 @@ export const useLiveGameStore = defineStore('liveGame', () => {
       lastError.value = 'WebSocket 错误'
     }
 
-    socket.onclose = () => {
+    socket.onclose = (evt) => {
       connected.value = false
       connecting.value = false
+      // 非主动断开（网络抖动，或 1013：服务端因为发送队列积压断开了慢连接）时退避重连并续传
+      if (ws.value !== socket || status.value === 'finished' || status.value === 'idle' || evt.code === 1008) return
+      const delay = Math.min(1000 * 2 ** reconnectAttempts, 10000)
+      reconnectAttempts += 1
+      setTimeout(() => {
+        if (ws.value === socket) connectGameWs({ resume: true })
+      }, delay)
     }
   }
 
+  function resumeStream() {
+    if (!ws.value || !connected.value) return
+    ws.value.send(JSON.stringify({ type: 'RESUME', payload: { last_seq: lastSeq.value } }))
+  }
+
   function disconnectWs() {
     if (ws.value) {
       try {
@@ -148,7 +214,7 @@ export const useLiveGameStore = defineStore('liveGame', () => {
 
     if (!heroToken.value) throw new Error('token 不能为空')
 
-    const res = await fetch(`${apiBase.value}/actions?token=${encodeURIComponent(heroToken.value)}`, {
+    const res = await fetch(`${apiBase.value}${roomPath('/actions')}?token=${encodeURIComponent(heroToken.value)}`, {
       method: 'POST',
       headers: { 'Content-Type': 'application/json' },
       body: JSON.stringify(actionPayload),
@@ -175,6 +241,7 @@ export const useLiveGameStore = defineStore('liveGame', () => {
   return {
     apiBase,
     heroToken,
+    roomId,
     connected,
     connecting,
     heroAuthed,
@@ -183,11 +250,13 @@ export const useLiveGameStore = defineStore('liveGame', () => {
     tableInfo,
     status,
     actionRequest,
+    actionDeadline,
     eventLog,
     startGame,
     connectGameWs,
     disconnectWs,
     requestSnapshot,
+    resumeStream,
     submitAction,
   }
 })
@@ -60,6 +60,27 @@ export const useGameStore = defineStore('game', () => {
     return fullGameLog.value.llm_reflections || []
   })
 
+  // 还原决策/反思的完整 prompt（日志中可能以模板ID+变量或内容哈希的形式去重存储）
+  // 模板填充规则与 Python 的 str.format 一致：{name} 替换为变量，{{ 和 }} 转义为单个花括号
+  function resolvePrompt(record) {
+    if (!record) return ''
+    if (record.prompt) return record.prompt
+    const log = fullGameLog.value || {}
+    const template = record.prompt_template_id && (log.prompt_templates || {})[record.prompt_template_id]
+    if (template) {
+      const vars = record.prompt_vars || {}
+      return template.replace(/\{\{|\}\}|\{(\w+)\}/g, (match, name) => {
+        if (match === '{{') return '{'
+        if (match === '}}') return '}'
+        return vars[name] ?? ''
+      })
+    }
+    if (record.prompt_hash) {
+      return (log.prompt_blobs || {})[record.prompt_hash] || ''
+    }
+    return ''
+  }
+
   // 游戏事件列表
   const gameEvents = computed(() => {
     if (!fullGameLog.value) return []
@@ -407,6 +428,7 @@ export const useGameStore = defineStore('game', () => {
     reflectionsByHand,
     eventsByHand,
     getHandResult,
+    resolvePrompt,
     setGameData,
     nextDecision,
     prevDecision,
@@ -1,14 +1,21 @@
 # game_controller.py
 # 德州扑克游戏控制器，用于管理多个AI玩家之间的对战
 
+import asyncio
+import json
 import os
+import random
 import time
 import uuid
-from typing import List, Dict, Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Callable
 from poker_engine import PokerTable, Player, GameStage, Action
-from ai_player import AIPlayer, LLMPlayer
+from ai_player import AIPlayer, LLMPlayer, LLMResponseCache
 from game_info import GameInfoState
-from game_logger import GameLogger, PlayerActionLog
+from game_logger import GameLogger
+from log_writer import LogWriter
+from luck_adjust import hand_results, mean_interval
+from early_stopping import EarlyStopping
 
 
 class GameController:
@@ -20,23 +27,42 @@ class GameController:
         big_blind: int = 10,
         initial_chips: int = 1000,
         reveal_hole_cards: bool = True,
-        human_player_name: Optional[str] = None
+        human_player_name: Optional[str] = None,
+        seed: Optional[int] = None,
+        log_writer: Optional[LogWriter] = None,
+        log_segment_hands: int = 10,
+        bounded_history_hands: int = 0,
+        live_stream: bool = False
     ):
-        self.table = PokerTable(small_blind=small_blind, big_blind=big_blind)
+        self.table = PokerTable(small_blind=small_blind, big_blind=big_blind, seed=seed)
+        self.seed = self.table.seed  # 对局种子，每手牌的洗牌种子由它和手牌编号推导
         self.ai_players: List[AIPlayer] = []
+        self.stop_decision = None  # 序贯停止规则提前结束对局时的结论
         self.initial_chips = initial_chips
         self.reveal_hole_cards = reveal_hole_cards
         self.human_player_name = human_player_name
         self.game_id = str(uuid.uuid4())[:8]  # 生成一个唯一的游戏ID
         self.log_dir = "game_logs"
+        self.log_writer = log_writer  # 设置后日志由后台线程写入，不阻塞游戏线程
 
         # 创建日志目录
         if not os.path.exists(self.log_dir):
             os.makedirs(self.log_dir)
 
         # 初始化增强的日志记录器
-        self.game_logger = GameLogger(game_id=self.game_id, log_dir=self.log_dir)
-        self.game_logger.set_game_config(initial_chips, small_blind, big_blind)
+        # log_segment_hands 大于0时增强日志每隔这么多手牌写出一个压缩分段，进程中途退出也不会丢失已完成的手牌
+        # bounded_history_hands 大于0时开启有界内存模式：牌桌历史和增强日志都只在内存中保留最近的部分，其余写入磁盘
+        self.bounded_history_hands = bounded_history_hands
+        if bounded_history_hands and not log_segment_hands:
+            log_segment_hands = 10
+        self.game_logger = GameLogger(
+            game_id=self.game_id, log_dir=self.log_dir, writer=log_writer, segment_hands=log_segment_hands,
+            keep_written_segments=not bounded_history_hands,
+            live_stream=live_stream  # 为 True 时决策等记录实时追加到 game_logs/live/，可用 live_stats.py 查看
+        )
+        self.game_logger.set_game_config(initial_chips, small_blind, big_blind, seed=self.seed)
+        # 增强日志作为牌桌事件总线的 sink，公共牌、摊牌、结算事件由牌桌统一发出
+        self.table.events.subscribe(self.game_logger.handle_event)
 
     def add_player(self, ai_player: AIPlayer) -> bool:
         """添加AI玩家到游戏"""
@@ -93,7 +119,31 @@ class GameController:
         return game_state
 
     def run_hand(self, verbose: bool = True):
+        """运行一手牌（同步接口，内部运行 run_hand_async）"""
+        asyncio.run(self.run_hand_async(verbose))
+
+    def run_betting_round(self, verbose: bool = True):
+        """运行一轮下注（同步接口，内部运行 run_betting_round_async）"""
+        asyncio.run(self.run_betting_round_async(verbose))
+
+    def run_tournament(self, num_hands: int = 100, verbose: bool = True,
+                       stopper: Optional[EarlyStopping] = None) -> Optional[str]:
+        """运行一场锦标赛（同步接口，内部运行 run_tournament_async），返回增强日志的路径
+
+        stopper 不为空时每手牌结束后更新序贯停止统计，得出结论后提前结束（多场对局共享同一个 stopper 时整批一起停止）
+        """
+        return asyncio.run(self.run_tournament_async(num_hands, verbose, stopper))
+
+    async def run_hand_async(self, verbose: bool = True):
         """运行一手牌"""
+        # log_dir 可能在创建后被修改（如web后端），因此在第一手牌开始时才确定 spill 文件位置
+        if self.bounded_history_hands and self.table.game_log_spill is None:
+            self.table.enable_bounded_history(
+                self.bounded_history_hands,
+                os.path.join(self.log_dir, f"poker_game_{self.game_id}.jsonl"),
+                writer=self.log_writer
+            )
+
         # 开始新的一手牌
         self.table.start_new_hand()
 
@@ -109,81 +159,50 @@ class GameController:
                 print(f"{player.name}:\n 手牌:{hand_str}, 筹码:{player.chips}")
 
         # 进行翻牌前的下注
-        self.run_betting_round(verbose)
+        await self.run_betting_round_async(verbose)
 
         # 如果只剩一个玩家，直接结束
         active_players = [p for p in self.table.players if p.is_active and not p.folded]
         if len(active_players) <= 1:
             self.table.award_pot(active_players)
-            # 记录手牌结算
-            self._log_hand_result()
             return
 
         # 进行翻牌
         self.table.move_to_next_stage()  # 进入翻牌阶段
-        # 记录翻牌事件
-        self.game_logger.log_community_cards(
-            self.table.hand_number,
-            "flop",
-            self.table.community_cards
-        )
         if verbose:
             print(f"在场玩家：{', '.join(f'{p.name}, 筹码:{p.chips}' for p in active_players)}")
             print(f"\n翻牌: {', '.join(str(card) for card in self.table.community_cards)}")
-        self.run_betting_round(verbose)
+        await self.run_betting_round_async(verbose)
 
         # 如果只剩一个玩家，直接结束
         active_players = [p for p in self.table.players if p.is_active and not p.folded]
         if len(active_players) <= 1:
             self.table.award_pot(active_players)
-            # 记录手牌结算
-            self._log_hand_result()
             return
 
         # 进行转牌
         self.table.move_to_next_stage()  # 进入转牌阶段
-        # 记录转牌事件
-        self.game_logger.log_community_cards(
-            self.table.hand_number,
-            "turn",
-            self.table.community_cards
-        )
         if verbose:
             print(f"在场玩家：{', '.join(f'{p.name}, 筹码:{p.chips}' for p in active_players)}")
             print(f"\n转牌: {', '.join(str(card) for card in self.table.community_cards)}")
-        self.run_betting_round(verbose)
+        await self.run_betting_round_async(verbose)
 
         # 如果只剩一个玩家，直接结束
         active_players = [p for p in self.table.players if p.is_active and not p.folded]
         if len(active_players) <= 1:
             self.table.award_pot(active_players)
-            # 记录手牌结算
-            self._log_hand_result()
             return
 
         # 进行河牌
         self.table.move_to_next_stage()  # 进入河牌阶段
-        # 记录河牌事件
-        self.game_logger.log_community_cards(
-            self.table.hand_number,
-            "river",
-            self.table.community_cards
-        )
         if verbose:
             print(f"在场玩家：{', '.join(f'{p.name}, 筹码:{p.chips}' for p in active_players)}")
             print(f"\n河牌: {', '.join(str(card) for card in self.table.community_cards)}")
-        self.run_betting_round(verbose)
+        await self.run_betting_round_async(verbose)
 
         # 进行摊牌
         self.table.move_to_next_stage()  # 进入摊牌阶段
 
-        # 记录摊牌事件
-        self.game_logger.log_showdown(
-            self.table.hand_number,
-            self.table.community_cards,
-            self.table.players
-        )
-
         # 显示摊牌结果
         if verbose:
             active_players = [p for p in self.table.players if p.is_active and not p.folded]
@@ -193,30 +212,8 @@ class GameController:
                 print(f"  {player.name}: {', '.join(str(card) for card in player.hand)}\n")
             print(f"公共牌: {', '.join(str(card) for card in self.table.community_cards)}")
 
-        # 记录手牌结算
-        self._log_hand_result()
-
-    def _log_hand_result(self):
-        """记录一手牌的结算结果"""
-        # 从 game_result_log 中获取赢家信息
-        game_result = self.table.game_result_log.get(self.table.hand_number)
-        if game_result:
-            # 获取所有赢家的 Player 对象
-            winner_names = [w.player_name for w in game_result.winners]
-            winners = [p for p in self.table.players if p.name in winner_names]
-
-            # 记录结算结果
-            self.game_logger.log_hand_result(
-                hand_number=self.table.hand_number,
-                pot=game_result.pot,
-                stage=game_result.stage.value,
-                community_cards=game_result.community_cards,
-                all_players=self.table.players,
-                winners=winners
-            )
-
-    def run_betting_round(self, verbose: bool = True):
-        """运行一轮下注"""
+    async def run_betting_round_async(self, verbose: bool = True):
+        """运行一轮下注，玩家决策以 await 等待（LLM 请求、Web 玩家的动作都不占用线程）"""
         # 如果只有一个或没有玩家，直接结束
         active_players = [p for p in self.table.players if p.is_active and not p.folded and not p.all_in]
         if len(active_players) <= 1:
@@ -255,7 +252,7 @@ class GameController:
             game_state = self.prepare_game_state(current_player)
 
             # 获取AI决策
-            playerAction = ai_player.make_decision(game_state)
+            playerAction = await ai_player.make_decision_async(game_state)
 
             # 处理玩家行动
             success = self.table.process_action(current_player, playerAction.action, playerAction.amount,
@@ -272,11 +269,16 @@ class GameController:
                     print(f'理由是：{playerAction.play_reason}')
                 print(f"  底池: {self.table.pot}")
 
-    def run_tournament(self, num_hands: int = 100, verbose: bool = True):
-        """运行一场锦标赛"""
+            # 让出事件循环，同一循环上的其他牌局（如 Web 后端的其他房间）不会被不需要等待的玩家长时间占住
+            await asyncio.sleep(0)
+
+    async def run_tournament_async(self, num_hands: int = 100, verbose: bool = True,
+                                   stopper: Optional[EarlyStopping] = None) -> Optional[str]:
+        """运行一场锦标赛（异步版本），参数同 run_tournament；结束时已保存最终日志，返回增强日志的路径"""
         if len(self.ai_players) < 2:
             print("至少需要2名玩家才能开始游戏")
-            return
+            return None
+        stop_sink = stopper.attach(self.table, self.game_id) if stopper is not None else None
 
         # 为玩家设置相同的初始筹码，并注入game_logger
         for p in self.ai_players:
@@ -284,6 +286,7 @@ class GameController:
             p.game_logger = self.game_logger  # 注入日志记录器
             p.reveal_hand_in_stdout = self.reveal_hole_cards
             p.show_llm_stdout = self.reveal_hole_cards
+        self.table.mark_changed()
 
         start_time = time.time()
 
@@ -292,6 +295,7 @@ class GameController:
             print(f"参赛玩家: {', '.join(ai.name for ai in self.ai_players)}")
             print(f"初始筹码: {self.initial_chips}")
             print(f"盲注结构: 小盲 {self.table.small_blind}, 大盲 {self.table.big_blind}")
+            print(f"随机种子: {self.seed}")
             print(f"计划进行 {num_hands} 手牌\n")
 
         # 运行指定数量的牌局
@@ -305,23 +309,31 @@ class GameController:
                     else:
                         print("\n游戏结束! 没有玩家剩余。")
                 break
+            if stopper is not None and stopper.stopped:
+                self.stop_decision = stopper.decision
+                if verbose:
+                    print(f"\n提前停止: {stopper.decision.message}")
+                break
 
             # 运行一手牌
-            self.run_hand(verbose)
+            await self.run_hand_async(verbose)
             # 添加当局游戏结果汇报
             if verbose:
                 print(f"\n第 {i + 1} 手牌结束")
-                game_result = self.table.game_result_log.get(i + 1)
+                game_result = self.table.get_game_result(i + 1)
                 print(game_result.get_result_info())
 
             # 按照上一局的运行结果各个active_players进行反思
-            self.handle_reflection()
+            await self.handle_reflection_async()
             # 每10手牌保存一次日志
             if i % 10 == 0:
-                self.save_game_log()
+                self.save_game_log(final=False)
 
-        # 保存最终游戏日志
-        self.save_game_log()
+        if stop_sink is not None:
+            self.table.events.unsubscribe(stop_sink)
+
+        # 保存最终游戏日志：要等后台写入器落盘，放到线程中执行，不阻塞同一事件循环上的其他牌局
+        enhanced_file = await asyncio.to_thread(self.save_final_logs)
 
         # 显示最终结果
         if verbose:
@@ -333,15 +345,94 @@ class GameController:
 
             print(f"\n游戏用时: {time.time() - start_time:.2f} 秒")
             print(f"游戏日志已保存到: {self.get_log_filename()}")
-            print(f"增强日志已保存到: {self.save_enhanced_log()}")
+            print(f"增强日志已保存到: {enhanced_file}")
+        return enhanced_file
+
+    @classmethod
+    def run_duplicate(
+        cls,
+        player_factories: List[Callable[[], AIPlayer]],
+        num_hands: int = 100,
+        seed: Optional[int] = None,
+        rotations: Optional[int] = None,
+        max_workers: Optional[int] = None,
+        response_cache: Optional[LLMResponseCache] = None,
+        stopper: Optional[EarlyStopping] = None,
+        verbose: bool = False,
+        **controller_kwargs
+    ) -> Dict[str, Any]:
+        """复式赛：同一个种子（相同的发牌序列）在多张镜像牌桌上各打一遍
+
+        第 r 张牌桌的座位轮转 r 位，默认牌桌数等于玩家数，每个参赛者在每个座位上都拿到过同一手牌。
+        player_factories 每次调用返回一个新的玩家（各牌桌的玩家互不共享状态，名称应保持一致）。
+        各牌桌在线程池中并发运行，LLM 玩家共享 response_cache，局面相同时复用已有的响应。
+        stopper 由所有牌桌共享，得出结论后各牌桌在下一手牌开始前一起停止。
+        返回按手牌配对汇总的复式成绩，同时写入 log_dir/duplicate_<id>.json。
+        """
+        if len(player_factories) < 2:
+            raise ValueError("复式赛至少需要2名玩家")
+        if seed is None:
+            seed = random.SystemRandom().randrange(2 ** 63)
+        seats = len(player_factories)
+        rotations = rotations or seats
+        cache = response_cache if response_cache is not None else LLMResponseCache()
+
+        controllers = []
+        for r in range(rotations):
+            controller = cls(seed=seed, **controller_kwargs)
+            players = [factory() for factory in player_factories]
+            shift = r % seats
+            for player in players[shift:] + players[:shift]:
+                if isinstance(player, LLMPlayer):
+                    player.response_cache = cache
+                controller.add_player(player)
+            controllers.append(controller)
+
+        with ThreadPoolExecutor(max_workers=max_workers or rotations, thread_name_prefix="duplicate-table") as executor:
+            list(executor.map(lambda c: c.run_tournament(num_hands=num_hands, verbose=verbose, stopper=stopper), controllers))
+
+        tables = []
+        for controller in controllers:
+            if controller.log_writer is not None:
+                controller.log_writer.flush()
+            with open(controller.get_log_filename(), 'r', encoding='utf-8') as f:
+                game_log = json.load(f)
+            tables.append({
+                "game_id": controller.game_id,
+                "seats": [p.name for p in controller.ai_players],
+                "final_chips": {p.name: p.player.chips for p in controller.ai_players},
+                "hands": hand_results(game_log)
+            })
+
+        summary = summarize_duplicate(tables, controllers[0].initial_chips)
+        summary.update({
+            "duplicate_id": str(uuid.uuid4())[:8],
+            "seed": seed,
+            "num_hands": num_hands,
+            "response_cache": cache.stats()
+        })
+        if stopper is not None:
+            summary["early_stopping"] = stopper.status()
+        filename = os.path.join(controllers[0].log_dir, f"duplicate_{summary['duplicate_id']}.json")
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        return summary
 
     def get_log_filename(self) -> str:
         """获取日志文件名"""
         return os.path.join(self.log_dir, f"poker_game_{self.game_id}.json")
 
-    def save_game_log(self):
-        """保存游戏日志"""
-        self.table.save_game_log(self.get_log_filename())
+    def save_game_log(self, final: bool = True):
+        """保存游戏日志，有界内存模式下中途保存只把新记录追加到 spill 文件，final 时才生成完整日志"""
+        if not final and self.table.game_log_spill is not None:
+            self.table.checkpoint_game_log()
+            return
+        self.table.save_game_log(self.get_log_filename(), writer=self.log_writer)
+
+    def save_final_logs(self) -> str:
+        """保存最终的游戏日志和增强日志，返回增强日志的路径；会等待后台写入完成，不要在事件循环上直接调用"""
+        self.save_game_log()
+        return self.save_enhanced_log()
 
     def save_enhanced_log(self) -> str:
         """保存增强的游戏日志"""
@@ -350,7 +441,9 @@ class GameController:
         # 标记游戏结束
         self.game_logger.finish_game()
         # 保存日志
-        return self.game_logger.save()
+        filename = self.game_logger.save()
+        self.game_logger.flush()
+        return filename
 
     def replay_game(self, game_id: Optional[str] = None):
         """重放游戏"""
@@ -370,7 +463,88 @@ class GameController:
         self.table.replay_game()
 
     def handle_reflection(self):
-        game_result = self.table.game_result_log[self.table.hand_number]
+        asyncio.run(self.handle_reflection_async())
+
+    async def handle_reflection_async(self):
+        game_result = self.table.get_game_result(self.table.hand_number)
         for p in self.ai_players:
             if p.player.is_active:
-                p.reflect_on_game(self.prepare_game_state(p.player), game_result)
+                await p.reflect_on_game_async(self.prepare_game_state(p.player), game_result)
+
+
+def summarize_duplicate(tables: List[Dict[str, Any]], initial_chips: int) -> Dict[str, Any]:
+    """汇总复式赛各牌桌的结果
+
+    duplicate 把各牌桌同一手牌的盈亏取平均后作为一个样本，同一手牌的发牌运气在轮转座位后基本抵消；
+    只有所有牌桌都打过的手牌才算配对样本（有玩家出局或提前停止后各牌桌打到的手数不同，
+    只在部分牌桌上打过的手牌运气没有对冲），排除的手数记在 excluded_hands。
+    pooled 把每张牌桌的每一手都当作独立样本，作为不配对时的对照。单位为 BB/100。
+    """
+    entrants = tables[0]["seats"]
+    played = [{hand["hand_number"] for hand in table["hands"]} for table in tables]
+    all_hands = set().union(*played)
+    hand_numbers = sorted(set.intersection(*played))
+    position = {number: i for i, number in enumerate(hand_numbers)}
+    duplicate = {name: [0.0] * len(hand_numbers) for name in entrants}
+    pooled = {name: [] for name in entrants}
+    for table in tables:
+        for hand in table["hands"]:
+            big_blind = hand["big_blind"] or 1
+            for name, net in hand["players"].items():
+                if hand["hand_number"] in position:
+                    duplicate[name][position[hand["hand_number"]]] += net / big_blind / len(tables)
+                pooled[name].append(net / big_blind)
+
+    def bb_per_100(samples: List[float]) -> Dict[str, Any]:
+        stats = mean_interval(samples)
+        return {
+            "bb_per_100": stats["mean"] * 100,
+            "ci95_bb_per_100": [stats["ci_low"] * 100, stats["ci_high"] * 100],
+            "samples": len(samples)
+        }
+
+    return {
+        "tables": [{
+            "game_id": table["game_id"],
+            "seats": table["seats"],
+            "final_chips": table["final_chips"],
+            "hands_played": len(table["hands"])
+        } for table in tables],
+        "duplicate_hands": len(hand_numbers),
+        "excluded_hands": len(all_hands) - len(hand_numbers),
+        "entrants": {
+            name: {
+                "total_chip_delta": sum(table["final_chips"][name] - initial_chips for table in tables),
+                "seat_results": [{
+                    "game_id": table["game_id"],
+                    "seat": table["seats"].index(name),
+                    "chip_delta": table["final_chips"][name] - initial_chips
+                } for table in tables],
+                "duplicate": bb_per_100(duplicate[name]),
+                "pooled": bb_per_100(pooled[name])
+            }
+            for name in entrants
+        }
+    }
+
+
+def print_duplicate_summary(summary: Dict[str, Any]):
+    """打印复式赛结果"""
+    print(f"复式赛 {summary['duplicate_id']}（种子 {summary['seed']}，{len(summary['tables'])} 张牌桌）")
+    for table in summary["tables"]:
+        print(f"  牌桌 {table['game_id']}: 座位 {' / '.join(table['seats'])}，共 {table['hands_played']} 手")
+    if summary.get("excluded_hands"):
+        print(f"  复式样本 {summary['duplicate_hands']} 手，{summary['excluded_hands']} 手只在部分牌桌上打过，未计入复式成绩")
+    print(f"{'参赛者':<20}{'筹码变化':>10}  {'复式 BB/100 (95% CI)':<30}{'不配对 BB/100 (95% CI)':<30}")
+    for name, entrant in sorted(summary["entrants"].items(), key=lambda item: -item[1]["duplicate"]["bb_per_100"]):
+        cells = []
+        for key in ("duplicate", "pooled"):
+            low, high = entrant[key]["ci95_bb_per_100"]
+            cells.append(f"{entrant[key]['bb_per_100']:+.1f} [{low:+.1f}, {high:+.1f}]")
+        print(f"{name:<20}{entrant['total_chip_delta']:>10}  {cells[0]:<30}{cells[1]:<30}")
+    stopping = summary.get("early_stopping")
+    if stopping:
+        decision = stopping["decision"]
+        print(f"提前停止: {decision['message']}" if decision else f"未提前停止（已检查 {stopping['hands']} 手）")
+    cache = summary["response_cache"]
+    print(f"LLM 响应缓存: 命中 {cache['hits']} 次，请求 {cache['misses']} 次（命中率 {cache['hit_rate']:.1%}）")
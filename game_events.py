@@ -0,0 +1,182 @@
+# game_events.py
+# 牌桌事件总线：PokerTable 每个事件只构建一次，旧版 game_log 和增强日志都作为订阅者（sink）生成各自的格式
+
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Callable, Optional, Tuple
+
+
+@dataclass
+class HandStartedEvent:
+    """一手牌开始（盲注已下、底牌已发）"""
+    hand_number: int
+    dealer: int
+    small_blind: int
+    big_blind: int
+    deck_seed: int
+    players: List[Dict[str, Any]] = field(default_factory=list)
+
+    def to_legacy(self) -> Dict[str, Any]:
+        return {
+            "type": 1,
+            "hand_number": self.hand_number,
+            "dealer": self.dealer,
+            "small_blind": self.small_blind,
+            "big_blind": self.big_blind,
+            "deck_seed": self.deck_seed,
+            "players": self.players
+        }
+
+
+@dataclass
+class StreetDealtEvent:
+    """发出公共牌（翻牌、转牌、河牌）"""
+    hand_number: int
+    stage: str
+    community_cards: List[str] = field(default_factory=list)
+
+    def to_legacy(self) -> Dict[str, Any]:
+        # 旧版格式不带手牌编号
+        return {
+            "type": 2,
+            "stage": self.stage,
+            "community_cards": self.community_cards
+        }
+
+
+@dataclass
+class ActionTakenEvent:
+    """玩家行动（包括大小盲注）"""
+    hand_number: int
+    stage: str
+    player_name: str
+    action: str
+    amount: int
+    pot: int
+    player_chips: int
+    behavior: str = ""
+
+    def to_legacy(self) -> Dict[str, Any]:
+        return {
+            "type": 3,
+            "hand_number": self.hand_number,
+            "stage": self.stage,
+            "player_name": self.player_name,
+            "action": self.action,
+            "amount": self.amount,
+            "pot": self.pot,
+            "player_chips": self.player_chips,
+            "behavior": self.behavior
+        }
+
+
+@dataclass
+class ShowdownEvent:
+    """摊牌，players 中每项包含 player_name、hand、hand_rank、is_winner、chips（分池前筹码）"""
+    hand_number: int
+    community_cards: List[str] = field(default_factory=list)
+    players: List[Dict[str, Any]] = field(default_factory=list)
+
+    def to_legacy(self) -> Dict[str, Any]:
+        return {
+            "type": 4,
+            "hand_number": self.hand_number,
+            "community_cards": self.community_cards,
+            "players": [{
+                "player_name": p["player_name"],
+                "hand": p["hand"],
+                "hand_rank": p["hand_rank"],
+                "is_winner": p["is_winner"]
+            } for p in self.players]
+        }
+
+
+@dataclass
+class PotAwardedEvent:
+    """奖池分配完成
+
+    winners 中每项包含 player_name、hand、amount；
+    players 为所有未弃牌玩家的结算：name、hand、chips_before、chips_after、total_bet、net_result
+    """
+    hand_number: int
+    pot: int
+    stage: str
+    community_cards: List[str] = field(default_factory=list)
+    side_pots: List[Dict[str, Any]] = field(default_factory=list)
+    winners: List[Dict[str, Any]] = field(default_factory=list)
+    players: List[Dict[str, Any]] = field(default_factory=list)
+
+    def to_legacy(self) -> Dict[str, Any]:
+        return {
+            "type": 5,
+            "hand_number": self.hand_number,
+            "pot": self.pot,
+            "side_pots": self.side_pots,
+            "winners": [{
+                "player_name": w["player_name"],
+                "amount": w["amount"]
+            } for w in self.winners]
+        }
+
+
+TableEvent = Any  # 上面任意一种事件
+EventSink = Callable[[TableEvent], None]
+
+
+class EventBus:
+    """按订阅顺序把事件分发给各个 sink
+
+    sink 可以只订阅部分事件类型；没有 sink 关心的事件类型，发出方可以用 wants() 判断后直接跳过构建。
+    某个 sink 抛出异常时只记录错误并继续分发，不会影响其他 sink，也不会打断牌局。
+    事件发出后各 sink 共享同一个对象（包括其中的列表），sink 不应修改事件内容
+    """
+
+    def __init__(self):
+        self._sinks: List[Tuple[EventSink, Optional[Tuple[type, ...]]]] = []
+        self._dispatch: Dict[type, List[EventSink]] = {}  # 事件类型 -> 订阅了它的 sink，订阅变化时重建
+        self.errors = 0
+        self.last_error: Optional[str] = None
+
+    def subscribe(self, sink: EventSink, *event_types: type) -> EventSink:
+        """订阅事件，指定 event_types 时只接收这些类型，否则接收全部事件"""
+        if all(s is not sink for s, _ in self._sinks):
+            self._sinks.append((sink, event_types or None))
+            self._dispatch.clear()
+        return sink
+
+    def unsubscribe(self, sink: EventSink):
+        self._sinks = [(s, types) for s, types in self._sinks if s is not sink]
+        self._dispatch.clear()
+
+    @property
+    def sinks(self) -> List[EventSink]:
+        return [sink for sink, _ in self._sinks]
+
+    def _sinks_for(self, event_type: type) -> List[EventSink]:
+        sinks = self._dispatch.get(event_type)
+        if sinks is None:
+            sinks = [s for s, types in self._sinks if types is None or issubclass(event_type, types)]
+            self._dispatch[event_type] = sinks
+        return sinks
+
+    def wants(self, event_type: type) -> bool:
+        """是否有 sink 订阅了这种事件"""
+        return bool(self._sinks_for(event_type))
+
+    def emit(self, event: TableEvent):
+        for sink in self._sinks_for(type(event)):
+            try:
+                sink(event)
+            except Exception as e:
+                self.errors += 1
+                self.last_error = f"{getattr(sink, '__qualname__', type(sink).__name__)}: {e!r}"
+                print(f"事件订阅者处理 {type(event).__name__} 失败，已跳过: {self.last_error}")
+
+
+class LegacyLogSink:
+    """把事件转换为旧版 type 1-5 记录，追加到 PokerTable.game_log"""
+
+    def __init__(self, table: Any):
+        self.table = table
+
+    def __call__(self, event: TableEvent):
+        self.table.game_log.append(event.to_legacy())
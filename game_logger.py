@@ -1,12 +1,21 @@
 # game_logger.py
 # 增强的游戏日志系统，用于支持web端对局复现和展示模型思考过程
 
+import hashlib
 import json
 import os
 from datetime import datetime
 from typing import Dict, List, Any, Optional
-from dataclasses import dataclass, field, asdict
+from dataclasses import dataclass, field, asdict, fields
 from engine_info import Card, Action, GameStage
+from game_events import HandStartedEvent, StreetDealtEvent, ShowdownEvent, PotAwardedEvent
+from segmented_log import SegmentedLogStore, RECORD_FIELDS, META_FIELDS, INDEX_FILE, get_segment_path
+
+LIVE_DIR = "live"  # 实时流文件所在的子目录
+# 实时流只写 live_stats.py 汇总用到的字段，完整记录（prompt、game_state 等）只在增强日志中保存一份
+LIVE_DECISION_FIELDS = ["player_name", "model_name", "hand_number", "stage", "parsed_action", "action_amount",
+                        "response_time", "error"]
+LIVE_REFLECTION_FIELDS = ["player_name", "model_name", "hand_number"]
 
 
 @dataclass
@@ -33,7 +42,7 @@ class LLMDecisionLog:
     timestamp: str
 
     # 输入信息
-    prompt: str  # 发送给LLM的完整prompt
+    prompt: str  # 发送给LLM的完整prompt（启用去重时为空，通过模板或哈希还原）
     game_state: Dict[str, Any]  # 当时的游戏状态
 
     # 输出信息
@@ -48,6 +57,11 @@ class LLMDecisionLog:
     response_time: float = 0.0  # 响应时间（秒）
     error: str = ""  # 错误信息（如果有）
 
+    # prompt去重存储
+    prompt_template_id: str = ""  # 模板ID，对应 prompt_templates
+    prompt_vars: Dict[str, str] = field(default_factory=dict)  # 填入模板的变量
+    prompt_hash: str = ""  # 完整prompt的哈希，对应 prompt_blobs
+
 
 @dataclass
 class LLMReflectionLog:
@@ -65,6 +79,11 @@ class LLMReflectionLog:
     raw_response: str  # LLM的原始响应
     updated_opinions: Dict[str, str] = field(default_factory=dict)  # 更新后的对其他玩家的评估
 
+    # prompt去重存储
+    prompt_template_id: str = ""
+    prompt_vars: Dict[str, str] = field(default_factory=dict)
+    prompt_hash: str = ""
+
 
 @dataclass
 class GameEventLog:
@@ -88,6 +107,7 @@ class HandStartLog:
     dealer: int = 0
     small_blind: int = 0
     big_blind: int = 0
+    deck_seed: int = 0  # 洗牌种子，可据此复现本手牌的发牌
     players: List[Dict[str, Any]] = field(default_factory=list)
 
 
@@ -166,6 +186,7 @@ class EnhancedGameLog:
     initial_chips: int = 0
     small_blind: int = 0
     big_blind: int = 0
+    seed: Optional[int] = None  # 对局随机种子
 
     # 玩家信息
     players: List[Dict[str, Any]] = field(default_factory=list)
@@ -182,27 +203,72 @@ class EnhancedGameLog:
     # 最终结果
     final_rankings: List[Dict[str, Any]] = field(default_factory=list)
 
+    # prompt去重存储：模板ID -> 模板文本，哈希 -> 完整prompt
+    prompt_templates: Dict[str, str] = field(default_factory=dict)
+    prompt_blobs: Dict[str, str] = field(default_factory=dict)
+
+
+def content_hash(text: str) -> str:
+    """计算文本的内容哈希，用作模板ID和prompt哈希"""
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+def render_prompt(template: str, prompt_vars: Dict[str, str]) -> str:
+    """用变量填充prompt模板，与 str.format 的结果完全一致"""
+    return template.format(**prompt_vars)
+
+
+def resolve_prompt(record: Dict[str, Any], templates: Dict[str, str], blobs: Dict[str, str]) -> str:
+    """还原决策/反思记录中的完整prompt，兼容未去重的旧日志"""
+    if record.get("prompt"):
+        return record["prompt"]
+    template_id = record.get("prompt_template_id")
+    if template_id and template_id in templates:
+        return render_prompt(templates[template_id], record.get("prompt_vars") or {})
+    prompt_hash = record.get("prompt_hash")
+    if prompt_hash:
+        return blobs.get(prompt_hash, "")
+    return ""
+
 
 class GameLogger:
     """增强的游戏日志记录器"""
 
-    def __init__(self, game_id: str, log_dir: str = "game_logs"):
+    def __init__(self, game_id: str, log_dir: str = "game_logs", dedupe_prompts: bool = True,
+                 writer: Optional[Any] = None, segment_hands: int = 0, keep_written_segments: bool = True,
+                 live_stream: bool = False):
         self.game_id = game_id
         self.log_dir = log_dir
+        self.dedupe_prompts = dedupe_prompts  # 为 True 时prompt以模板+变量或哈希的形式存储
+        self.writer = writer  # LogWriter，设置后 save() 只入队，由后台线程写盘
         self.log_data = EnhancedGameLog(
             game_id=game_id,
             start_time=datetime.now().isoformat()
         )
 
+        # 分段存储：大于0时每 segment_hands 手牌写出一个压缩分段，见 segmented_log.py
+        self.segment_hands = segment_hands
+        self._segment_store: Optional[SegmentedLogStore] = None
+        self._segment_seq = 0
+        self._segment_first_hand = 1
+        self._segment_cursor = {name: 0 for name in RECORD_FIELDS}
+        # 为 False 时（有界内存模式）已写出分段的记录从内存中移除，save() 不再生成单文件日志
+        self.keep_written_segments = keep_written_segments
+        self._dropped_counts = {name: 0 for name in RECORD_FIELDS}
+
+        # 实时流：为 True 时每条决策、反思和结算记录写入后立即追加到 live/<game_id>.jsonl，供 live_stats.py 跟踪
+        self.live_stream = live_stream
+
         # 创建日志目录
         if not os.path.exists(log_dir):
             os.makedirs(log_dir)
 
-    def set_game_config(self, initial_chips: int, small_blind: int, big_blind: int):
+    def set_game_config(self, initial_chips: int, small_blind: int, big_blind: int, seed: Optional[int] = None):
         """设置游戏配置"""
         self.log_data.initial_chips = initial_chips
         self.log_data.small_blind = small_blind
         self.log_data.big_blind = big_blind
+        self.log_data.seed = seed
 
     def set_players(self, players: List[Any]):
         """设置玩家信息"""
@@ -214,6 +280,7 @@ class GameLogger:
                 "initial_chips": player.player.chips if hasattr(player, 'player') else player.chips
             }
             self.log_data.players.append(player_info)
+        self._stream("players", {"players": self.log_data.players})
 
     def log_event(self, event: Any):
         """记录游戏事件（保持向后兼容）"""
@@ -222,6 +289,43 @@ class GameLogger:
         else:
             self.log_data.events.append(event)
 
+    def _store_prompt(
+        self,
+        prompt: str,
+        prompt_template: Optional[str],
+        prompt_vars: Optional[Dict[str, str]]
+    ) -> Dict[str, Any]:
+        """按去重方式存储prompt，返回需要写入记录的prompt相关字段"""
+        if not self.dedupe_prompts or not prompt:
+            return {"prompt": prompt}
+        if prompt_template is not None and prompt_vars is not None:
+            template_id = content_hash(prompt_template)
+            self.log_data.prompt_templates.setdefault(template_id, prompt_template)
+            return {"prompt": "", "prompt_template_id": template_id, "prompt_vars": dict(prompt_vars)}
+        prompt_hash = content_hash(prompt)
+        self.log_data.prompt_blobs.setdefault(prompt_hash, prompt)
+        return {"prompt": "", "prompt_hash": prompt_hash}
+
+    def get_live_stream_path(self) -> str:
+        return os.path.join(self.log_dir, LIVE_DIR, f"{self.game_id}.jsonl")
+
+    def _stream(self, kind: str, record: Dict[str, Any]):
+        """把一条记录追加到实时流文件"""
+        if not self.live_stream:
+            return
+        line = {"kind": kind, "game_id": self.game_id, "record": record}
+        path = self.get_live_stream_path()
+        if self.writer is not None:
+            self.writer.append_json_line(path, line)
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(line, ensure_ascii=False) + "\n")
+
+    def resolve_prompt(self, record: Dict[str, Any]) -> str:
+        """还原记录中的完整prompt"""
+        return resolve_prompt(record, self.log_data.prompt_templates, self.log_data.prompt_blobs)
+
     def log_llm_decision(
         self,
         player_name: str,
@@ -237,16 +341,21 @@ class GameLogger:
         behavior: str,
         reasoning_content: str = "",
         response_time: float = 0.0,
-        error: str = ""
+        error: str = "",
+        prompt_template: Optional[str] = None,
+        prompt_vars: Optional[Dict[str, str]] = None
     ):
-        """记录LLM决策过程"""
+        """记录LLM决策过程
+
+        传入 prompt_template 和 prompt_vars 时，prompt 以模板ID+变量的形式存储，模板只保存一份
+        """
         decision_log = LLMDecisionLog(
             player_name=player_name,
             model_name=model_name,
             hand_number=hand_number,
             stage=stage.value,
             timestamp=datetime.now().isoformat(),
-            prompt=prompt,
+            **self._store_prompt(prompt, prompt_template, prompt_vars),
             game_state=game_state,
             raw_response=raw_response,
             reasoning_content=reasoning_content,
@@ -257,7 +366,10 @@ class GameLogger:
             response_time=response_time,
             error=error
         )
-        self.log_data.llm_decisions.append(asdict(decision_log))
+        record = asdict(decision_log)
+        self.log_data.llm_decisions.append(record)
+        if self.live_stream:
+            self._stream("decision", {name: record[name] for name in LIVE_DECISION_FIELDS})
 
     def log_llm_reflection(
         self,
@@ -267,7 +379,9 @@ class GameLogger:
         prompt: str,
         game_result: str,
         raw_response: str,
-        updated_opinions: Dict[str, str]
+        updated_opinions: Dict[str, str],
+        prompt_template: Optional[str] = None,
+        prompt_vars: Optional[Dict[str, str]] = None
     ):
         """记录LLM反思过程"""
         reflection_log = LLMReflectionLog(
@@ -275,89 +389,93 @@ class GameLogger:
             model_name=model_name,
             hand_number=hand_number,
             timestamp=datetime.now().isoformat(),
-            prompt=prompt,
+            **self._store_prompt(prompt, prompt_template, prompt_vars),
             game_result=game_result,
             raw_response=raw_response,
             updated_opinions=updated_opinions
         )
-        self.log_data.llm_reflections.append(asdict(reflection_log))
-
-    def log_community_cards(self, hand_number: int, stage: str, community_cards: List[Any]):
-        """记录公共牌出现"""
-        cards_log = CommunityCardsLog(
-            type=2,
-            hand_number=hand_number,
-            stage=stage,
-            community_cards=[str(card) for card in community_cards]
-        )
-        self.log_data.events.append(asdict(cards_log))
-
-    def log_showdown(self, hand_number: int, community_cards: List[Any], players: List[Any]):
-        """记录摊牌"""
-        showdown_log = ShowdownLog(
-            type=4,
-            hand_number=hand_number,
-            community_cards=[str(card) for card in community_cards],
-            players=[
-                {
-                    "name": p.name,
-                    "hand": [str(card) for card in p.hand],
-                    "chips": p.chips,
-                    "folded": p.folded
-                }
-                for p in players if not p.folded
-            ]
-        )
-        self.log_data.events.append(asdict(showdown_log))
-
-    def log_hand_result(
-        self,
-        hand_number: int,
-        pot: int,
-        stage: str,
-        community_cards: List[Any],
-        all_players: List[Any],
-        winners: List[Any],
-        side_pots: List[Any] = None
-    ):
-        """记录一手牌的结算结果"""
-        # 记录所有未弃牌玩家的信息
-        active_players = []
-        for player in all_players:
-            if not player.folded:
-                player_info = {
-                    "name": player.name,
-                    "hand": [str(card) for card in player.hand],
-                    "chips_before": player.chips + player.total_bet,  # 结束前的筹码
-                    "chips_after": player.chips,  # 结束后的筹码
-                    "total_bet": player.total_bet,  # 本局下注总额
-                    "net_result": player.chips - (player.chips + player.total_bet)  # 净赢/输
-                }
-                active_players.append(player_info)
-
-        # 记录赢家详情
-        winners_info = []
-        for winner in winners:
-            winner_info = {
-                "name": winner.name,
-                "hand": [str(card) for card in winner.hand],
-                "amount": 0  # 将在后面计算
+        record = asdict(reflection_log)
+        self.log_data.llm_reflections.append(record)
+        if self.live_stream:
+            self._stream("reflection", {name: record[name] for name in LIVE_REFLECTION_FIELDS})
+
+    def handle_event(self, event: Any):
+        """牌桌事件总线的 sink：把公共牌、摊牌、奖池分配事件记录为增强日志事件（type 2/4/6）
+
+        事件中的牌面字符串等列表直接复用，不再重复转换和深拷贝；开启分段存储时，
+        新一手牌开始意味着之前的手牌（包括反思）都已记录完毕，满 segment_hands 手即写出分段
+        """
+        if isinstance(event, HandStartedEvent):
+            if self.segment_hands and event.hand_number - self._segment_first_hand >= self.segment_hands:
+                self._write_segment(close=True)
+                self._segment_first_hand = event.hand_number
+        elif isinstance(event, StreetDealtEvent):
+            self.log_data.events.append({
+                "type": 2,
+                "hand_number": event.hand_number,
+                "stage": event.stage,
+                "community_cards": event.community_cards
+            })
+        elif isinstance(event, ShowdownEvent):
+            self.log_data.events.append({
+                "type": 4,
+                "hand_number": event.hand_number,
+                "community_cards": event.community_cards,
+                "players": [{
+                    "name": p["player_name"],
+                    "hand": p["hand"],
+                    "chips": p["chips"],
+                    "folded": False
+                } for p in event.players]
+            })
+        elif isinstance(event, PotAwardedEvent):
+            record = {
+                "type": 6,
+                "hand_number": event.hand_number,
+                "pot": event.pot,
+                "stage": event.stage,
+                "community_cards": event.community_cards,
+                "players": event.players,
+                "winners": [{
+                    "name": w["player_name"],
+                    "hand": w["hand"],
+                    "amount": w["amount"]
+                } for w in event.winners],
+                "side_pots": event.side_pots,
+                "timestamp": datetime.now().isoformat()
             }
-            # 计算实际赢得的金额（需要从side_pots或总池中获取）
-            winners_info.append(winner_info)
-
-        result_log = HandResultLog(
-            type=6,
-            hand_number=hand_number,
-            pot=pot,
-            stage=stage,
-            community_cards=[str(card) for card in community_cards],
-            players=active_players,
-            winners=winners_info,
-            side_pots=side_pots or [],
-            timestamp=datetime.now().isoformat()
-        )
-        self.log_data.events.append(asdict(result_log))
+            self.log_data.events.append(record)
+            if self.live_stream:
+                self._stream("hand_result", {
+                    "hand_number": event.hand_number,
+                    "pot": event.pot,
+                    "winners": [{"name": w["name"], "amount": w["amount"]} for w in record["winners"]]
+                })
+
+    def _write_segment(self, close: bool):
+        """把上一个分段之后的记录写为当前分段并更新索引，close 为 True 时该分段不再改写"""
+        if self._segment_store is None:
+            self._segment_store = SegmentedLogStore(get_segment_path(self.log_dir, self.game_id), writer=self.writer)
+        records = {
+            name: getattr(self.log_data, name)[self._segment_cursor[name]:] for name in RECORD_FIELDS
+        }
+        self._segment_store.write_segment(self._segment_seq, records, self.log_data.prompt_blobs, close=close)
+        # 索引只用到对局级元信息，不必复制越来越长的记录列表
+        self._segment_store.write_index(self.snapshot(META_FIELDS))
+        if close:
+            for name in RECORD_FIELDS:
+                self._segment_cursor[name] += len(records[name])
+            self._segment_seq += 1
+            if not self.keep_written_segments:
+                self._drop_written_records()
+
+    def _drop_written_records(self):
+        """移除已写入分段的记录，分段中已保存它们引用的完整prompt，prompt_blobs 也可以清空"""
+        for name in RECORD_FIELDS:
+            del getattr(self.log_data, name)[:self._segment_cursor[name]]
+            self._dropped_counts[name] += self._segment_cursor[name]
+            self._segment_cursor[name] = 0
+        self.log_data.prompt_blobs.clear()
 
     def set_final_rankings(self, players: List[Any]):
         """设置最终排名"""
@@ -377,12 +495,38 @@ class GameLogger:
             })
 
     def finish_game(self):
-        """结束游戏记录"""
+        """结束游戏记录；后台写入器的 flush 留给 save() 之后统一做一次，覆盖最终日志的写入"""
         self.log_data.end_time = datetime.now().isoformat()
+        self._stream("game_end", {"end_time": self.log_data.end_time, "final_rankings": self.log_data.final_rankings})
+
+    def flush(self):
+        """等待后台写入线程写完已提交的日志"""
+        if self.writer is not None:
+            self.writer.flush()
+
+    def snapshot(self, names: Optional[List[str]] = None) -> Dict[str, Any]:
+        """获取日志数据的浅拷贝快照，列表中的记录追加后不会再被修改，可交给其他线程序列化；names 为空时包含全部字段"""
+        data = {}
+        for name in names if names is not None else [f.name for f in fields(self.log_data)]:
+            value = getattr(self.log_data, name)
+            if isinstance(value, list):
+                value = list(value)
+            elif isinstance(value, dict):
+                value = dict(value)
+            data[name] = value
+        return data
 
     def save(self) -> str:
-        """保存日志到文件"""
+        """保存日志到文件，开启分段存储时同时写出最后一个未满的分段和索引，返回日志文件路径"""
+        if self.segment_hands:
+            self._write_segment(close=False)
+            if not self.keep_written_segments:
+                # 内存中只有最近的记录，完整日志即分段存储本身
+                return os.path.join(get_segment_path(self.log_dir, self.game_id), INDEX_FILE)
         filename = os.path.join(self.log_dir, f"enhanced_poker_game_{self.game_id}.json")
+        if self.writer is not None:
+            self.writer.write_json(filename, self.snapshot())
+            return filename
         with open(filename, 'w', encoding='utf-8') as f:
             json.dump(asdict(self.log_data), f, ensure_ascii=False, indent=2)
         return filename
@@ -397,8 +541,8 @@ class GameLogger:
                 [e.get("hand_number", 0) for e in self.log_data.events],
                 default=0
             ),
-            "total_decisions": len(self.log_data.llm_decisions),
-            "total_reflections": len(self.log_data.llm_reflections),
+            "total_decisions": len(self.log_data.llm_decisions) + self._dropped_counts["llm_decisions"],
+            "total_reflections": len(self.log_data.llm_reflections) + self._dropped_counts["llm_reflections"],
             "players": self.log_data.players,
             "final_rankings": self.log_data.final_rankings
         }
@@ -0,0 +1,297 @@
+# live_stats.py
+# 实时统计：跟踪 GameLogger 写出的 live/<game_id>.jsonl，每条新记录 O(1) 更新各模型/玩家的运行统计，
+# 通过命令行视图或 JSON 接口查看进行中的对局
+
+import argparse
+import json
+import os
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Any, Optional
+
+from analyze_logs import normalize_action
+from game_logger import LIVE_DIR
+
+
+class RunningStats:
+    """一个模型或玩家的运行统计，只保存计数和累加值"""
+
+    def __init__(self):
+        self.decisions = 0
+        self.action_counts: Dict[str, int] = {}
+        self.total_response_time = 0.0
+        self.errors = 0
+        self.hands_played = 0
+        self.hands_won = 0
+        self.reflections = 0
+        self._last_hand: Dict[str, Dict[str, int]] = {}  # 每局每个玩家最近一次决策所在的手牌（game_id -> player -> hand）
+
+    def add_decision(self, record: Dict[str, Any], game_id: str):
+        self.decisions += 1
+        action = normalize_action(record.get("parsed_action", ""))
+        self.action_counts[action] = self.action_counts.get(action, 0) + 1
+        self.total_response_time += record.get("response_time", 0.0) or 0.0
+        if record.get("error"):
+            self.errors += 1
+        hand_number = record.get("hand_number", 0)
+        last_hand = self._last_hand.setdefault(game_id, {})
+        if last_hand.get(record["player_name"]) != hand_number:
+            last_hand[record["player_name"]] = hand_number
+            self.hands_played += 1
+
+    def forget_game(self, game_id: str):
+        """对局结束后不会再有它的决策，丢掉按局记录的状态"""
+        self._last_hand.pop(game_id, None)
+
+    def rate(self, *actions: str) -> float:
+        count = sum(self.action_counts.get(a, 0) for a in actions)
+        return count / self.decisions if self.decisions > 0 else 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "total_decisions": self.decisions,
+            "action_distribution": dict(self.action_counts),
+            "aggression_rate": self.rate("raise", "all-in"),
+            "fold_rate": self.rate("fold"),
+            "call_rate": self.rate("call"),
+            "avg_response_time": self.total_response_time / self.decisions if self.decisions > 0 else 0,
+            "error_rate": self.errors / self.decisions if self.decisions > 0 else 0,
+            "hands_played": self.hands_played,
+            "hands_won": self.hands_won,
+            "reflections": self.reflections
+        }
+
+
+class LiveAggregator:
+    """按模型和玩家汇总实时流记录，keep_finished 不为空时只保留最近结束的这么多局的对局信息"""
+
+    def __init__(self, keep_finished: Optional[int] = None):
+        self.keep_finished = keep_finished
+        self._finished: deque = deque()
+        self.by_model: Dict[str, RunningStats] = {}
+        self.by_player: Dict[str, RunningStats] = {}
+        self.player_models: Dict[str, str] = {}
+        self.games: Dict[str, Dict[str, Any]] = {}  # game_id -> {"last_hand", "finished"}
+        self.records = 0
+        self.updated_at = 0.0
+
+    def _stats(self, table: Dict[str, RunningStats], key: str) -> RunningStats:
+        if key not in table:
+            table[key] = RunningStats()
+        return table[key]
+
+    def add(self, line: Dict[str, Any]):
+        kind = line.get("kind")
+        game_id = line.get("game_id", "")
+        record = line.get("record") or {}
+        game = self.games.setdefault(game_id, {"last_hand": 0, "finished": False})
+        self.records += 1
+        self.updated_at = time.time()
+
+        if kind == "players":
+            for player in record.get("players", []):
+                self.player_models[player["name"]] = player.get("model_name", "unknown")
+        elif kind == "decision":
+            player_name = record["player_name"]
+            model_name = record.get("model_name") or self.player_models.get(player_name, "unknown")
+            self.player_models.setdefault(player_name, model_name)
+            self._stats(self.by_model, model_name).add_decision(record, game_id)
+            self._stats(self.by_player, player_name).add_decision(record, game_id)
+            game["last_hand"] = max(game["last_hand"], record.get("hand_number", 0))
+        elif kind == "reflection":
+            player_name = record["player_name"]
+            self._stats(self.by_model, record.get("model_name") or self.player_models.get(player_name, "unknown")).reflections += 1
+            self._stats(self.by_player, player_name).reflections += 1
+        elif kind == "hand_result":
+            for winner in record.get("winners", []):
+                name = winner.get("name")
+                self._stats(self.by_model, self.player_models.get(name, "unknown")).hands_won += 1
+                self._stats(self.by_player, name).hands_won += 1
+            game["last_hand"] = max(game["last_hand"], record.get("hand_number", 0))
+        elif kind == "game_end":
+            game["finished"] = True
+            for stats in list(self.by_model.values()) + list(self.by_player.values()):
+                stats.forget_game(game_id)
+            self._finished.append(game_id)
+            if self.keep_finished is not None:
+                while len(self._finished) > self.keep_finished:
+                    self.games.pop(self._finished.popleft(), None)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "records": self.records,
+            "updated_at": self.updated_at,
+            "games": {game_id: dict(info) for game_id, info in self.games.items()},
+            "models": {name: stats.to_dict() for name, stats in self.by_model.items()},
+            "players": {
+                name: {"model_name": self.player_models.get(name, "unknown"), **stats.to_dict()}
+                for name, stats in self.by_player.items()
+            }
+        }
+
+
+class JsonlTailer:
+    """从上次读到的位置继续读取追加到 JSON Lines 文件的新记录，不完整的最后一行留到下次"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.offset = 0
+        self._partial = b""
+
+    def read_new(self) -> List[Dict[str, Any]]:
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            return []
+        if size < self.offset:
+            # 文件被重写，从头开始
+            self.offset, self._partial = 0, b""
+        if size == self.offset:
+            return []
+        with open(self.path, 'rb') as f:
+            f.seek(self.offset)
+            data = f.read(size - self.offset)
+        self.offset += len(data)
+
+        lines = (self._partial + data).split(b"\n")
+        self._partial = lines.pop()
+        records = []
+        for line in lines:
+            if line.strip():
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+        return records
+
+
+class LiveWatcher:
+    """跟踪 log_dir/live 下的实时流文件（指定 game_id 时只跟踪这一局）
+
+    读到 game_end 的对局不再跟踪；prune_finished 为 True 时同时删除它的实时流文件（统计已累加，
+    完整记录在增强日志中），长期运行的服务不会因为历史对局越积越多
+    """
+
+    def __init__(self, log_dir: str = "game_logs", game_id: Optional[str] = None,
+                 prune_finished: bool = False, keep_finished: Optional[int] = None):
+        self.live_dir = os.path.join(log_dir, LIVE_DIR)
+        self.game_id = game_id
+        self.prune_finished = prune_finished
+        self.aggregator = LiveAggregator(keep_finished)
+        self._tailers: Dict[str, JsonlTailer] = {}
+        self._done: set = set()  # 已结束、但文件还在的实时流，不再重新跟踪
+        self._lock = threading.Lock()
+
+    def _discover(self):
+        if not os.path.isdir(self.live_dir):
+            return
+        for name in os.listdir(self.live_dir):
+            if not name.endswith(".jsonl"):
+                continue
+            if self.game_id and name != f"{self.game_id}.jsonl":
+                continue
+            path = os.path.join(self.live_dir, name)
+            if path not in self._tailers and path not in self._done:
+                self._tailers[path] = JsonlTailer(path)
+
+    def _finish(self, path: str):
+        del self._tailers[path]
+        if self.prune_finished:
+            try:
+                os.remove(path)
+                return
+            except OSError:
+                pass
+        self._done.add(path)
+
+    def poll(self) -> int:
+        """读取所有新记录并更新统计，返回本次处理的记录数"""
+        with self._lock:
+            self._discover()
+            count = 0
+            for path, tailer in list(self._tailers.items()):
+                ended = False
+                for line in tailer.read_new():
+                    self.aggregator.add(line)
+                    count += 1
+                    ended = ended or line.get("kind") == "game_end"
+                if ended:
+                    self._finish(path)
+            return count
+
+    def snapshot(self) -> Dict[str, Any]:
+        self.poll()
+        with self._lock:
+            return self.aggregator.snapshot()
+
+
+def format_stats(snapshot: Dict[str, Any]) -> str:
+    """命令行视图"""
+    lines = []
+    games = snapshot["games"]
+    running = [game_id for game_id, info in games.items() if not info["finished"]]
+    lines.append(f"对局数: {len(games)}（进行中 {len(running)}）  已处理记录: {snapshot['records']}")
+    for game_id, info in games.items():
+        lines.append(f"  {game_id}: 第 {info['last_hand']} 手{'（已结束）' if info['finished'] else ''}")
+    lines.append("")
+    lines.append(f"{'模型':<24}{'决策数':>8}{'激进度':>8}{'弃牌率':>8}{'跟注率':>8}{'平均响应(s)':>12}{'胜手':>6}")
+    for model_name, stats in sorted(snapshot["models"].items()):
+        lines.append(
+            f"{model_name:<24}{stats['total_decisions']:>8}{stats['aggression_rate']:>8.1%}"
+            f"{stats['fold_rate']:>8.1%}{stats['call_rate']:>8.1%}{stats['avg_response_time']:>12.2f}"
+            f"{stats['hands_won']:>6}"
+        )
+    return "\n".join(lines)
+
+
+def serve(watcher: LiveWatcher, host: str = "127.0.0.1", port: int = 8765) -> ThreadingHTTPServer:
+    """在后台线程中提供 JSON 接口：GET /stats"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip("/") not in ("", "/stats"):
+                self.send_error(404)
+                return
+            body = json.dumps(watcher.snapshot(), ensure_ascii=False).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True, name="live-stats-http").start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="实时查看进行中对局的模型统计")
+    parser.add_argument("game_id", nargs="?", default=None, help="只跟踪指定对局，默认跟踪所有实时流")
+    parser.add_argument("--log-dir", default="game_logs")
+    parser.add_argument("--interval", type=float, default=2.0, help="刷新间隔（秒）")
+    parser.add_argument("--once", action="store_true", help="只输出一次当前统计")
+    parser.add_argument("--json", action="store_true", help="以JSON格式输出")
+    parser.add_argument("--port", type=int, default=None, help="同时在该端口提供 JSON 接口 /stats")
+    args = parser.parse_args()
+
+    watcher = LiveWatcher(args.log_dir, args.game_id)
+    if args.port:
+        serve(watcher, port=args.port)
+        print(f"JSON 接口: http://127.0.0.1:{args.port}/stats")
+
+    try:
+        while True:
+            snapshot = watcher.snapshot()
+            output = json.dumps(snapshot, ensure_ascii=False, indent=2) if args.json else format_stats(snapshot)
+            if args.once:
+                print(output)
+                break
+            print("\033[2J\033[H" + output, flush=True)
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        pass
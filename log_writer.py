@@ -0,0 +1,263 @@
+# log_writer.py
+# 后台异步日志写入线程：游戏线程只负责入队，序列化和磁盘写入在独立线程中批量完成
+
+import asyncio
+import atexit
+import gzip
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, List, Optional, Callable
+
+
+@dataclass
+class _WriteJob:
+    """一条写入任务：整文件覆盖（replace）或追加（append）"""
+    path: str
+    mode: str  # "replace" 或 "append"
+    data: Any  # 待序列化的对象或已序列化的 bytes
+    serializer: Optional[Callable[[Any], bytes]] = None
+
+
+def dump_json_bytes(obj: Any, indent: Optional[int] = 2) -> bytes:
+    """与日志文件原有格式一致的JSON序列化"""
+    return json.dumps(obj, ensure_ascii=False, indent=indent).encode("utf-8")
+
+
+class LogWriter:
+    """后台日志写入器
+
+    - 写入请求进入有界队列，队列满时 submit 会阻塞调用方（背压），避免内存无限增长
+    - 在事件循环线程上提交时不阻塞（否则同一循环上的其他牌局都会停住）：队列满时改放进溢出区，
+      由写入线程按顺序补回队列；写入任务从不丢弃，溢出区的当前和峰值深度见 stats()
+    - 写入线程每次取出一批任务：同一文件的多次整文件覆盖只落盘最后一次，追加合并为一次写入
+    - flush() 等待队列中已有的任务全部落盘，close() 在 flush 后停止线程
+    """
+
+    def __init__(self, max_queue: int = 1024, max_batch: int = 64, name: str = "log-writer"):
+        self._queue: "queue.Queue[Optional[_WriteJob]]" = queue.Queue(maxsize=max_queue)
+        self._max_batch = max_batch
+        self._overflow: Deque[_WriteJob] = deque()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._stats = {
+            "jobs_submitted": 0,
+            "jobs_written": 0,
+            "batches": 0,
+            "bytes_written": 0,
+            "errors": 0,
+            "last_write_ms": 0.0,
+            "max_write_ms": 0.0,
+            "total_write_ms": 0.0,
+            "backpressure_waits": 0,
+            "overflowed": 0,
+            "max_overflow_depth": 0,
+        }
+        self.last_error: Optional[str] = None
+        self._thread = threading.Thread(target=self._run, daemon=True, name=name)
+        self._thread.start()
+
+    # ---- 提交接口（游戏线程调用） ----
+
+    def submit(self, job: _WriteJob, timeout: Optional[float] = None):
+        """提交一条写入任务；写入器已关闭或写入线程已退出时抛出 RuntimeError，任务不会被悄悄丢弃"""
+        if self._closed:
+            raise RuntimeError("log writer is closed")
+        if not self._thread.is_alive():
+            raise RuntimeError("log writer thread is not running")
+        if _on_event_loop():
+            self._submit_nowait(job)
+            return
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                self._stats["backpressure_waits"] += 1
+            self._queue.put(job, timeout=timeout)
+        with self._lock:
+            self._stats["jobs_submitted"] += 1
+
+    def _submit_nowait(self, job: _WriteJob):
+        """不阻塞的提交：溢出区非空时新任务也排在溢出区后面，保证同一文件的写入顺序"""
+        with self._lock:
+            if not self._overflow:
+                try:
+                    self._queue.put_nowait(job)
+                    self._stats["jobs_submitted"] += 1
+                    return
+                except queue.Full:
+                    pass
+            self._overflow.append(job)
+            self._stats["overflowed"] += 1
+            self._stats["max_overflow_depth"] = max(self._stats["max_overflow_depth"], len(self._overflow))
+            self._stats["jobs_submitted"] += 1
+
+    def _refill(self):
+        """写入线程把溢出区的任务按顺序补回队列"""
+        with self._lock:
+            while self._overflow:
+                try:
+                    self._queue.put_nowait(self._overflow[0])
+                except queue.Full:
+                    return
+                self._overflow.popleft()
+
+    def write_json(self, path: str, obj: Any, indent: Optional[int] = 2):
+        """整文件写入JSON，obj 的序列化在写入线程中完成，调用方入队后不能再修改 obj"""
+        self.submit(_WriteJob(path, "replace", obj, lambda o: dump_json_bytes(o, indent)))
+
+    def write_json_gz(self, path: str, obj: Any):
+        """整文件写入gzip压缩的紧凑JSON，序列化和压缩都在写入线程中完成"""
+        self.submit(_WriteJob(path, "replace", obj, lambda o: gzip.compress(dump_json_bytes(o, None))))
+
+    def write_bytes(self, path: str, data: bytes):
+        """整文件写入已序列化的数据"""
+        self.submit(_WriteJob(path, "replace", data))
+
+    def append_json_line(self, path: str, obj: Any):
+        """向 JSON Lines 文件追加一条记录，序列化在写入线程中完成"""
+        self.submit(_WriteJob(path, "append", obj, lambda o: dump_json_bytes(o, None) + b"\n"))
+
+    def append_bytes(self, path: str, data: bytes):
+        """向文件追加已序列化的数据（如 JSON Lines 记录）"""
+        self.submit(_WriteJob(path, "append", data))
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """等待已入队的任务全部写入，超时返回 False"""
+        if timeout is None:
+            self._queue.join()
+            return True
+        deadline = time.time() + timeout
+        while self._queue.unfinished_tasks:
+            if time.time() >= deadline:
+                return False
+            time.sleep(0.005)
+        return True
+
+    def close(self, timeout: Optional[float] = None):
+        """写完剩余任务后停止写入线程"""
+        if self._closed:
+            return
+        self.flush(timeout)
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    # ---- 指标 ----
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["queue_depth"] = self.queue_depth
+        stats["overflow_depth"] = len(self._overflow)
+        stats["avg_write_ms"] = stats["total_write_ms"] / stats["batches"] if stats["batches"] else 0.0
+        return stats
+
+    # ---- 写入线程 ----
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                self._queue.task_done()
+                return
+            batch = [job]
+            stop = False
+            while len(batch) < self._max_batch:
+                try:
+                    job = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if job is None:
+                    stop = True
+                    break
+                batch.append(job)
+            self._write_batch(batch)
+            # 先补回溢出区再标记完成，flush() 不会在溢出区还有任务时提前返回
+            self._refill()
+            for _ in batch:
+                self._queue.task_done()
+            if stop:
+                self._queue.task_done()
+                return
+
+    def _write_batch(self, batch: List[_WriteJob]):
+        start = time.perf_counter()
+        written = 0
+        # 按文件分组：整文件覆盖只保留最后一次，之后的追加按顺序合并
+        plans: Dict[str, Dict[str, Any]] = {}
+        for job in batch:
+            plan = plans.setdefault(job.path, {"replace": None, "appends": []})
+            if job.mode == "replace":
+                plan["replace"] = job
+                plan["appends"] = []
+            else:
+                plan["appends"].append(job)
+
+        for path, plan in plans.items():
+            try:
+                directory = os.path.dirname(path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                if plan["replace"] is not None:
+                    data = self._serialize(plan["replace"])
+                    tmp_path = path + ".tmp"
+                    with open(tmp_path, 'wb') as f:
+                        f.write(data)
+                    os.replace(tmp_path, path)
+                    written += len(data)
+                if plan["appends"]:
+                    data = b"".join(self._serialize(job) for job in plan["appends"])
+                    with open(path, 'ab') as f:
+                        f.write(data)
+                    written += len(data)
+            except Exception as e:
+                self.last_error = f"{path}: {e}"
+                with self._lock:
+                    self._stats["errors"] += 1
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self._stats["jobs_written"] += len(batch)
+            self._stats["batches"] += 1
+            self._stats["bytes_written"] += written
+            self._stats["last_write_ms"] = elapsed_ms
+            self._stats["max_write_ms"] = max(self._stats["max_write_ms"], elapsed_ms)
+            self._stats["total_write_ms"] += elapsed_ms
+
+    @staticmethod
+    def _serialize(job: _WriteJob) -> bytes:
+        if job.serializer is not None:
+            return job.serializer(job.data)
+        return job.data
+
+
+def _on_event_loop() -> bool:
+    """当前线程是否正在运行事件循环"""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+_default_writer: Optional[LogWriter] = None
+_default_writer_lock = threading.Lock()
+
+
+def get_default_log_writer() -> LogWriter:
+    """获取进程内共享的日志写入器，首次调用时启动，进程退出时自动写完剩余日志"""
+    global _default_writer
+    with _default_writer_lock:
+        if _default_writer is None:
+            _default_writer = LogWriter()
+            atexit.register(_default_writer.close)
+        return _default_writer
@@ -0,0 +1,428 @@
+# luck_adjust.py
+# 运气调整后的成绩：按旧版游戏日志逐手重算每名玩家的结果，用胜率引擎去掉发牌运气带来的方差，
+# 并给出每名玩家和每个模型的置信区间，用更少的手牌得到显著的比较结论
+#
+# 三种估计（每手牌的筹码盈亏）：
+#   realised  实际结果
+#   allin     全押调整：下注结束后才发出的公共牌不再计入，改用下注结束时的期望值
+#   aivat     AIVAT 风格的控制变量估计：每个发牌节点都减去 v(发牌后) - E[v(发牌后)]，
+#             v 为“剩余玩家跟注到当前最高下注后直接摊牌”的期望收益。
+#             LLM 的策略未知，因此只对机会节点（发牌）做修正，估计仍然是无偏的
+
+import argparse
+import json
+import math
+import os
+import random
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations
+from math import comb
+from typing import Dict, List, Any, Optional, Tuple
+
+from analyze_logs import list_log_sources, load_log_source
+from equity import FULL_DECK, parse_cards, evaluate, stable_seed
+
+DEFAULT_TRIALS = 1000
+ESTIMATORS = ("realised", "allin", "aivat")
+Z_95 = 1.96
+
+Level = Tuple[int, List[str]]  # (池额, 有资格争夺该池的玩家)
+
+
+def pot_levels(contributions: Dict[str, int]) -> List[Level]:
+    """按投入金额划分主池和边池，与 PokerTable.award_pot 相同（弃牌玩家的投入也计入各层）"""
+    players = sorted((name for name, amount in contributions.items() if amount > 0), key=lambda n: contributions[n])
+    levels = []
+    previous = 0
+    for name in players:
+        threshold = contributions[name]
+        if threshold <= previous:
+            continue
+        eligible = [n for n in players if contributions[n] >= threshold]
+        levels.append(((threshold - previous) * len(eligible), eligible))
+        previous = threshold
+    return levels
+
+
+def settle(levels: List[Level], ranks: Dict[str, Tuple[int, ...]]) -> Dict[str, float]:
+    """按引擎规则分配各层奖池：牌力最大的玩家赢得其有资格的各层，没有赢家的层退还给该层所有玩家"""
+    best = max(ranks.values())
+    winners = {name for name, rank in ranks.items() if rank == best}
+    payouts: Dict[str, float] = defaultdict(float)
+    for amount, eligible in levels:
+        takers = [name for name in eligible if name in winners] or eligible
+        share = amount / len(takers)
+        for name in takers:
+            payouts[name] += share
+    return payouts
+
+
+def expected_payouts(
+    levels: List[Level],
+    hands: Dict[str, Optional[List[int]]],
+    board: List[int],
+    trials: int = DEFAULT_TRIALS,
+    seed: Optional[int] = None
+) -> Dict[str, float]:
+    """在剩余公共牌（以及 hands 中为 None 的底牌）随机的情况下，各玩家从 levels 中分得的期望筹码
+
+    hands 为仍在争夺奖池的玩家；没有未知底牌且剩余组合数不超过 trials 时穷举。
+    """
+    names = list(hands)
+    if len(names) == 1:
+        return dict(settle(levels, {names[0]: (0,)}))
+
+    unknown = [name for name in names if hands[name] is None]
+    dead = set(board)
+    for hand in hands.values():
+        if hand:
+            dead.update(hand)
+    deck = [card for card in FULL_DECK if card not in dead]
+    missing = 5 - len(board)
+    totals: Dict[str, float] = defaultdict(float)
+
+    def add_runout(runout: List[int], hole: Dict[str, Optional[List[int]]]):
+        full_board = board + runout
+        ranks = {name: evaluate(hole[name] + full_board) for name in names}
+        for name, payout in settle(levels, ranks).items():
+            totals[name] += payout
+
+    if not unknown and comb(len(deck), missing) <= trials:
+        runs = 0
+        for runout in combinations(deck, missing):
+            add_runout(list(runout), hands)
+            runs += 1
+    else:
+        rng = random.Random(seed)
+        runs = trials
+        for _ in range(trials):
+            sample = rng.sample(deck, missing + 2 * len(unknown))
+            hole = dict(hands)
+            for j, name in enumerate(unknown):
+                hole[name] = sample[missing + 2 * j:missing + 2 * j + 2]
+            add_runout(sample[:missing], hole)
+    return {name: value / runs for name, value in totals.items()}
+
+
+def split_hands(game_log: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+    """按手牌切分旧版日志（盲注记录在 type 1 之前，type 2 没有手牌编号，跟随所在的手）"""
+    hands: List[List[Dict[str, Any]]] = []
+    current = None
+    for record in game_log:
+        hand_number = record.get("hand_number")
+        if hand_number is not None and (current is None or hand_number != current):
+            hands.append([])
+            current = hand_number
+        if hands:
+            hands[-1].append(record)
+    return hands
+
+
+def realised_payouts(record: Dict[str, Any]) -> Dict[str, float]:
+    """type 5 记录中每名玩家实际拿回的筹码（赢得的奖池和退还的边池）"""
+    payouts: Dict[str, float] = defaultdict(float)
+    for winner in record.get("winners", []):
+        payouts[winner["player_name"]] += winner.get("amount", 0)
+    for side_pot in record.get("side_pots", []):
+        eligible = side_pot.get("eligible_players", [])
+        if not side_pot.get("refunded") or not eligible:
+            continue
+        per_player = side_pot.get("award_per_winner", 0)
+        for name in eligible:
+            payouts[name] += per_player
+        payouts[eligible[0]] += side_pot.get("pot_amount", 0) - per_player * len(eligible)
+    return payouts
+
+
+def hand_results(game_log: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """每手牌各玩家的实际盈亏（不做调整，开销很小）"""
+    results = []
+    for records in split_hands(game_log):
+        start = next((r for r in records if r.get("type") == 1), None)
+        result = next((r for r in records if r.get("type") == 5), None)
+        if start is None or result is None:
+            continue
+        contributions: Dict[str, int] = defaultdict(int)
+        for record in records:
+            if record.get("type") == 3:
+                contributions[record["player_name"]] += record.get("amount", 0)
+        payouts = realised_payouts(result)
+        results.append({
+            "hand_number": start["hand_number"],
+            "big_blind": start.get("big_blind", 0),
+            "players": {
+                p["name"]: payouts.get(p["name"], 0.0) - contributions[p["name"]]
+                for p in start.get("players", [])
+                if p.get("is_active", True) and len(p.get("hand") or []) == 2
+            }
+        })
+    return results
+
+
+def adjust_hand(records: List[Dict[str, Any]], trials: int = DEFAULT_TRIALS, seed_key: str = "") -> Optional[Dict[str, Any]]:
+    """计算一手牌中每名玩家三种估计下的盈亏，日志不完整（没有 type 1 或 type 5）时返回 None"""
+    start = next((r for r in records if r.get("type") == 1), None)
+    result = next((r for r in records if r.get("type") == 5), None)
+    if start is None or result is None:
+        return None
+
+    stacks, hole = {}, {}
+    for player in start.get("players", []):
+        if player.get("is_active", True) and len(player.get("hand") or []) == 2:
+            stacks[player["name"]] = player.get("chips", 0) + player.get("total_bet", 0)
+            hole[player["name"]] = parse_cards(player["hand"])
+    contributions = {name: 0 for name in stacks}
+    folded = set()
+    board: List[int] = []
+    last_action = max((i for i, r in enumerate(records) if r.get("type") == 3), default=-1)
+
+    def projected_levels() -> List[Level]:
+        # 仍在牌局中的玩家视为跟注到当前最高投入（不超过其筹码）
+        top = max(contributions.values(), default=0)
+        projected = {
+            name: amount if name in folded else min(stacks[name], max(amount, top))
+            for name, amount in contributions.items()
+        }
+        return pot_levels(projected)
+
+    def contenders(known: bool) -> Dict[str, Optional[List[int]]]:
+        return {name: (hole[name] if known else None) for name in stacks if name not in folded}
+
+    corrections = {"allin": defaultdict(float), "aivat": defaultdict(float)}
+
+    def add_correction(before: Dict[str, float], after: Dict[str, float], locked: bool):
+        for name in set(before) | set(after):
+            delta = after.get(name, 0.0) - before.get(name, 0.0)
+            corrections["aivat"][name] += delta
+            if locked:
+                corrections["allin"][name] += delta
+
+    dealt = False
+    for i, record in enumerate(records):
+        event_type = record.get("type")
+        if event_type == 3 and record.get("player_name") in contributions:
+            contributions[record["player_name"]] += record.get("amount", 0)
+            if record.get("action") == "fold":
+                folded.add(record["player_name"])
+        elif event_type == 1 and len(contenders(True)) > 1:
+            # 发底牌：发牌前所有底牌未知
+            dealt = True
+            levels = projected_levels()
+            before = expected_payouts(levels, contenders(False), [], trials, stable_seed(f"{seed_key}:deal:before"))
+            after = expected_payouts(levels, contenders(True), [], trials, stable_seed(f"{seed_key}:deal:after"))
+            add_correction(before, after, locked=i > last_action)
+        elif event_type == 2 and dealt:
+            new_board = parse_cards(record.get("community_cards", []))
+            if len(contenders(True)) > 1 and len(new_board) > len(board):
+                levels = projected_levels()
+                before = expected_payouts(levels, contenders(True), board, trials, stable_seed(f"{seed_key}:{len(board)}"))
+                after = expected_payouts(levels, contenders(True), new_board, trials, stable_seed(f"{seed_key}:{len(new_board)}"))
+                add_correction(before, after, locked=i > last_action)
+            board = new_board
+
+    payouts = realised_payouts(result)
+    players = {}
+    for name in stacks:
+        realised = payouts.get(name, 0.0) - contributions[name]
+        players[name] = {
+            "realised": realised,
+            "allin": realised - corrections["allin"][name],
+            "aivat": realised - corrections["aivat"][name]
+        }
+    return {"hand_number": start["hand_number"], "big_blind": start.get("big_blind", 0), "players": players}
+
+
+def adjust_game_log(filename: str, trials: int = DEFAULT_TRIALS) -> Dict[str, Any]:
+    """计算一个旧版游戏日志中每手牌的调整结果（在子进程中执行）"""
+    with open(filename, 'r', encoding='utf-8') as f:
+        game_log = json.load(f)
+    game_id = os.path.basename(filename)[len("poker_game_"):-len(".json")]
+    hands = []
+    for records in split_hands(game_log):
+        adjusted = adjust_hand(records, trials, seed_key=f"{game_id}:{records[0].get('hand_number')}")
+        if adjusted:
+            hands.append(adjusted)
+    return {"game_id": game_id, "hands": hands}
+
+
+def mean_interval(samples: List[float]) -> Dict[str, float]:
+    """均值、标准差和95%置信区间（正态近似）"""
+    n = len(samples)
+    if n == 0:
+        return {"mean": 0.0, "std": 0.0, "ci_low": 0.0, "ci_high": 0.0}
+    mean = sum(samples) / n
+    std = math.sqrt(sum((x - mean) ** 2 for x in samples) / (n - 1)) if n > 1 else 0.0
+    half = Z_95 * std / math.sqrt(n)
+    return {"mean": mean, "std": std, "ci_low": mean - half, "ci_high": mean + half}
+
+
+def summarize_samples(samples: Dict[str, List[float]]) -> Dict[str, Any]:
+    """把每手牌的结果（以大盲注计）汇总为 BB/100 及其置信区间，并给出相对实际结果的方差缩减倍数"""
+    summary: Dict[str, Any] = {"hands": len(samples["realised"])}
+    for estimator in ESTIMATORS:
+        stats = mean_interval(samples[estimator])
+        summary[estimator] = {
+            "total_bb": sum(samples[estimator]),
+            "bb_per_100": stats["mean"] * 100,
+            "ci95_bb_per_100": [stats["ci_low"] * 100, stats["ci_high"] * 100],
+            "std_bb": stats["std"]
+        }
+    for estimator in ("allin", "aivat"):
+        std = summary[estimator]["std_bb"]
+        summary[estimator]["variance_reduction"] = (summary["realised"]["std_bb"] / std) ** 2 if std > 0 else 0.0
+    return summary
+
+
+class LuckAdjustedAnalyzer:
+    """跨对局计算运气调整后的成绩
+
+    以每个 poker_game_<id>.json 为单位在进程池中计算，每个文件的结果按 mtime 和大小缓存到 cache_file；
+    玩家对应的模型从同一局的增强日志（或分段存储）中读取。
+    """
+
+    CACHE_VERSION = 1
+
+    def __init__(
+        self,
+        log_dir: str = "game_logs",
+        cache_file: Optional[str] = None,
+        max_workers: Optional[int] = None,
+        trials: int = DEFAULT_TRIALS
+    ):
+        self.log_dir = log_dir
+        self.cache_file = cache_file or os.path.join(log_dir, ".luck_cache.json")
+        self.max_workers = max_workers
+        self.trials = trials
+        self.last_processed = 0  # 最近一次统计中重新计算的日志数
+
+    def list_game_logs(self) -> List[str]:
+        if not os.path.exists(self.log_dir):
+            return []
+        return sorted(
+            os.path.join(self.log_dir, name) for name in os.listdir(self.log_dir)
+            if name.startswith("poker_game_") and name.endswith(".json")
+        )
+
+    def _load_cache(self) -> Dict[str, Any]:
+        if not os.path.exists(self.cache_file):
+            return {}
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if cache.get("version") != self.CACHE_VERSION or cache.get("trials") != self.trials:
+            return {}
+        return cache.get("files", {})
+
+    def _save_cache(self, files: Dict[str, Any]):
+        tmp_file = self.cache_file + ".tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump({"version": self.CACHE_VERSION, "trials": self.trials, "files": files}, f, ensure_ascii=False)
+        os.replace(tmp_file, self.cache_file)
+
+    def collect_games(self) -> List[Dict[str, Any]]:
+        """每局的逐手调整结果，只有新增或变化的日志会被重新计算"""
+        cached = self._load_cache()
+        files: Dict[str, Any] = {}
+        pending: List[Tuple[str, os.stat_result]] = []
+        for filename in self.list_game_logs():
+            stat = os.stat(filename)
+            name = os.path.basename(filename)
+            entry = cached.get(name)
+            if entry and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+                files[name] = entry
+            else:
+                pending.append((filename, stat))
+
+        if pending:
+            filenames = [filename for filename, _ in pending]
+            trials = [self.trials] * len(filenames)
+            if len(pending) == 1 or self.max_workers == 1:
+                results = [adjust_game_log(filename, self.trials) for filename in filenames]
+            else:
+                with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+                    results = list(executor.map(adjust_game_log, filenames, trials))
+            for (filename, stat), game in zip(pending, results):
+                files[os.path.basename(filename)] = {"mtime": stat.st_mtime, "size": stat.st_size, "game": game}
+
+        if pending or len(files) != len(cached):
+            self._save_cache(files)
+        self.last_processed = len(pending)
+        return [entry["game"] for entry in files.values()]
+
+    def player_models(self) -> Dict[str, Dict[str, str]]:
+        """game_id -> {玩家名: 模型名}"""
+        models = {}
+        for filename, game_id in list_log_sources(self.log_dir):
+            log = load_log_source(filename)
+            models[game_id] = {p["name"]: p.get("model_name", "unknown") for p in log.get("players", [])}
+        return models
+
+    def analyze(self) -> Dict[str, Any]:
+        """按玩家和模型汇总三种估计的 BB/100 及其95%置信区间"""
+        games = self.collect_games()
+        models_by_game = self.player_models()
+
+        def new_samples() -> Dict[str, List[float]]:
+            return {estimator: [] for estimator in ESTIMATORS}
+
+        by_player: Dict[str, Dict[str, List[float]]] = defaultdict(new_samples)
+        by_model: Dict[str, Dict[str, List[float]]] = defaultdict(new_samples)
+        player_model: Dict[str, str] = {}
+        total_hands = 0
+        for game in games:
+            game_models = models_by_game.get(game["game_id"], {})
+            for hand in game["hands"]:
+                total_hands += 1
+                big_blind = hand["big_blind"] or 1
+                for name, values in hand["players"].items():
+                    model_name = game_models.get(name, "unknown")
+                    player_model.setdefault(name, model_name)
+                    for estimator in ESTIMATORS:
+                        by_player[name][estimator].append(values[estimator] / big_blind)
+                        by_model[model_name][estimator].append(values[estimator] / big_blind)
+
+        return {
+            "total_games": len(games),
+            "total_hands": total_hands,
+            "processed_files": self.last_processed,
+            "trials": self.trials,
+            "players": {
+                name: {"model_name": player_model[name], **summarize_samples(samples)}
+                for name, samples in by_player.items()
+            },
+            "models": {name: summarize_samples(samples) for name, samples in by_model.items()}
+        }
+
+
+def print_luck_report(result: Dict[str, Any]):
+    """打印运气调整后的成绩"""
+    print(f"共 {result['total_games']} 局、{result['total_hands']} 手牌，本次计算 {result['processed_files']} 个新增或变化的日志")
+    for title, table in (("模型", result["models"]), ("玩家", result["players"])):
+        print("=" * 116)
+        print(f"{title:<20}{'手数':>6}  {'实际 BB/100 (95% CI)':<30}{'全押调整':<30}{'AIVAT':<30}{'方差缩减':>8}")
+        for name, stats in sorted(table.items(), key=lambda item: -item[1]["aivat"]["bb_per_100"]):
+            cells = []
+            for estimator in ESTIMATORS:
+                s = stats[estimator]
+                low, high = s["ci95_bb_per_100"]
+                cells.append(f"{s['bb_per_100']:+.1f} [{low:+.1f}, {high:+.1f}]")
+            print(f"{name:<20}{stats['hands']:>6}  {cells[0]:<30}{cells[1]:<30}{cells[2]:<30}"
+                  f"{stats['aivat']['variance_reduction']:>7.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="计算运气调整后的玩家/模型成绩及置信区间")
+    parser.add_argument("--log-dir", default="game_logs")
+    parser.add_argument("--workers", type=int, default=None, help="进程数，默认使用全部CPU")
+    parser.add_argument("--trials", type=int, default=DEFAULT_TRIALS, help="每个发牌节点的模拟次数")
+    parser.add_argument("--json", action="store_true", help="以JSON格式输出")
+    args = parser.parse_args()
+
+    result = LuckAdjustedAnalyzer(args.log_dir, max_workers=args.workers, trials=args.trials).analyze()
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+    else:
+        print_luck_report(result)
@@ -6,8 +6,9 @@ import os
 from typing import List
 from dotenv import load_dotenv
 
-from ai_player import AIPlayer, HumanPlayer, OpenAiLLMUser, AnthropicLLMUser
-from game_controller import GameController
+from ai_player import AIPlayer, HumanPlayer, LLMPlayer, OpenAiLLMUser, AnthropicLLMUser
+from game_controller import GameController, print_duplicate_summary
+from early_stopping import EarlyStopping, STOP_RULES
 
 # 加载环境变量
 load_dotenv(override=True)
@@ -59,6 +60,12 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--view", choices=["debug", "user"], default="debug")
     parser.add_argument("--human-name", default="You")
+    parser.add_argument("--seed", type=int, default=None, help="对局随机种子，指定后可复现每一手牌的发牌")
+    parser.add_argument("--live", action="store_true", help="实时写出决策记录，可用 python live_stats.py 查看统计")
+    parser.add_argument("--duplicate", action="store_true", help="复式赛：AI玩家在多张镜像牌桌上轮转座位打同一发牌序列")
+    parser.add_argument("--duplicate-tables", type=int, default=None, help="复式赛牌桌数，默认等于AI玩家数")
+    parser.add_argument("--stop-rule", choices=STOP_RULES, default=None, help="序贯提前停止规则：比较已有结论时提前结束对局")
+    parser.add_argument("--min-effect", type=float, default=50.0, help="提前停止关心的最小差距（BB/100）")
     args = parser.parse_args()
 
     # 从环境变量读取配置
@@ -108,14 +115,40 @@ if __name__ == "__main__":
     if len(players) <= 1:
         raise ValueError("请至少配置一个 AI 玩家")
 
+    stopper = EarlyStopping(rule=args.stop_rule, min_effect_bb100=args.min_effect) if args.stop_rule else None
+
+    if args.duplicate:
+        # 复式赛不包含人类玩家，每张牌桌用相同配置重新创建AI玩家
+        llm_players = [p for p in players if isinstance(p, LLMPlayer)]
+        factories = [
+            lambda p=p: type(p)(name=p.name, model_name=p.model_name, api_key=p.api_key, base_url=p.base_url)
+            for p in llm_players
+        ]
+        summary = GameController.run_duplicate(
+            factories,
+            num_hands=num_hands,
+            seed=args.seed,
+            rotations=args.duplicate_tables,
+            stopper=stopper,
+            small_blind=small_blind,
+            big_blind=big_blind,
+            initial_chips=initial_chips,
+            reveal_hole_cards=False,
+            live_stream=args.live
+        )
+        print_duplicate_summary(summary)
+        raise SystemExit(0)
+
     controller = GameController(
         small_blind=small_blind,
         big_blind=big_blind,
         initial_chips=initial_chips,
         reveal_hole_cards=(args.view == "debug"),
-        human_player_name=args.human_name
+        human_player_name=args.human_name,
+        seed=args.seed,
+        live_stream=args.live
     )
     for player in players:
         controller.add_player(player)
 
-    controller.run_tournament(num_hands=num_hands, verbose=True)
+    controller.run_tournament(num_hands=num_hands, verbose=True, stopper=stopper)
@@ -4,10 +4,16 @@
 import random
 import json
 import os
+import hashlib
 from typing import List, Dict, Any, Tuple, Optional
 from enum import Enum
 from game_info import GameAction, GameResult, GameWinnerInfo
 from engine_info import Card, Action, GameStage, Player, Suit
+from game_events import (
+    EventBus, LegacyLogSink, HandStartedEvent, StreetDealtEvent, ActionTakenEvent, ShowdownEvent, PotAwardedEvent
+)
+from replay_engine import ReplayEngine, play
+from bounded_history import JsonlSpill, write_json_array
 
 
 class HandRank(Enum):
@@ -24,10 +30,30 @@ class HandRank(Enum):
     ROYAL_FLUSH = 10  # 皇家同花顺
 
 
+def derive_hand_seed(game_seed: int, hand_number: int) -> int:
+    """由对局种子和手牌编号推导出该手牌的洗牌种子"""
+    digest = hashlib.sha256(f"{game_seed}:{hand_number}".encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big")
+
+
+def build_deck(deck_seed: int, rng: Optional[random.Random] = None) -> List[Card]:
+    """按洗牌种子生成一副洗好的牌，相同种子得到完全相同的牌序"""
+    rng = rng or random.Random()
+    rng.seed(deck_seed)
+    deck = [Card(suit, value) for suit in Suit for value in range(2, 15)]  # 2-14 (2-A)
+    rng.shuffle(deck)
+    return deck
+
+
 class PokerTable:
     """德州扑克牌桌类"""
 
-    def __init__(self, small_blind: int = 5, big_blind: int = 10, max_players: int = 10):
+    def __init__(self, small_blind: int = 5, big_blind: int = 10, max_players: int = 10,
+                 seed: Optional[int] = None):
+        # 未指定种子时随机生成一个，保证每一手牌都可以按种子复现
+        self.seed = seed if seed is not None else random.SystemRandom().randrange(2 ** 63)
+        self.rng = random.Random(self.seed)  # 牌桌独立的随机数生成器，不与全局random共享状态
+        self.deck_seed = 0  # 当前手牌的洗牌种子
         self.players: List[Player] = []
         self.deck: List[Card] = []
         self.community_cards: List[Card] = []
@@ -40,15 +66,71 @@ class PokerTable:
         self.current_player_idx = 0  # 当前行动玩家索引
         self.stage = GameStage.PREFLOP  # 当前游戏阶段
         self.hand_number = 0  # 当前是第几手牌
+        self.state_version = 0  # 牌桌状态版本号，桌面上任何可见状态变化时递增，供上层缓存序列化结果
         self.action_history: List[GameAction] = []  # 行动历史
-        self.game_log: List[Dict[str, Any]] = []  # 游戏日志
+        self.game_log: List[Dict[str, Any]] = []  # 游戏日志（旧版格式，由 legacy_sink 写入）
         self.game_result_log: Dict[int, GameResult] = {}
+        # 牌桌事件总线：每个事件只构建一次，由订阅的 sink 生成各自的日志格式
+        self.events = EventBus()
+        self.legacy_sink = self.events.subscribe(LegacyLogSink(self))
+        # 有界内存模式：history_hands 大于0时只在内存中保留最近这么多手牌的历史，见 enable_bounded_history
+        self.history_hands = 0
+        self.game_log_spill: Optional[JsonlSpill] = None
+        self._spilled_in_window = 0  # game_log 开头已写入 spill 文件的记录数
+
+    def enable_bounded_history(self, history_hands: int, spill_file: str, writer: Optional[Any] = None):
+        """开启有界内存模式
+
+        action_history、game_log、game_result_log 只保留最近 history_hands 手牌，
+        game_log 中更早的记录按 JSON Lines 追加到 spill_file，保存日志时再拼成完整文件
+        """
+        self.history_hands = history_hands
+        self.game_log_spill = JsonlSpill(spill_file, writer=writer)
+        self._spilled_in_window = 0
+
+    def mark_changed(self):
+        """递增状态版本号；直接修改玩家或牌桌状态（不经过牌桌方法）时需要手动调用"""
+        self.state_version += 1
+
+    def get_game_result(self, hand_number: int) -> Optional[GameResult]:
+        """获取指定手牌的结算结果，有界内存模式下超出窗口的手牌返回 None"""
+        return self.game_result_log.get(hand_number)
+
+    def checkpoint_game_log(self):
+        """把尚未写出的 game_log 记录追加到 spill 文件（仅有界内存模式）"""
+        if self.game_log_spill is None:
+            return
+        self.game_log_spill.append(self.game_log[self._spilled_in_window:])
+        self._spilled_in_window = len(self.game_log)
+
+    def _trim_history(self):
+        """有界内存模式下丢弃窗口之外的手牌历史"""
+        if not self.history_hands:
+            return
+        cutoff = self.hand_number - self.history_hands + 1  # 保留 [cutoff, hand_number]
+        if cutoff <= 1:
+            return
+
+        self.checkpoint_game_log()
+        cut = 0
+        for record in self.game_log:
+            # 公共牌记录（type 2）不带手牌编号，跟随它前面的记录一起丢弃
+            if record.get("hand_number", 0) >= cutoff:
+                break
+            cut += 1
+        del self.game_log[:cut]
+        self._spilled_in_window -= cut
+
+        self.action_history = [a for a in self.action_history if a.hand_number >= cutoff]
+        for hand_number in [h for h in self.game_result_log if h < cutoff]:
+            del self.game_result_log[hand_number]
 
     def add_player(self, player: Player) -> bool:
         """添加玩家到牌桌"""
         if len(self.players) >= self.max_players:
             return False
         self.players.append(player)
+        self.mark_changed()
         return True
 
     def remove_player(self, player_name: str) -> bool:
@@ -56,16 +138,14 @@ class PokerTable:
         for i, player in enumerate(self.players):
             if player.name == player_name:
                 self.players.pop(i)
+                self.mark_changed()
                 return True
         return False
 
     def initialize_deck(self):
-        """初始化一副牌"""
-        self.deck = []
-        for suit in Suit:
-            for value in range(2, 15):  # 2-14 (2-A)
-                self.deck.append(Card(suit, value))
-        random.shuffle(self.deck)
+        """初始化一副牌，洗牌种子由对局种子和手牌编号推导"""
+        self.deck_seed = derive_hand_seed(self.seed, self.hand_number)
+        self.deck = build_deck(self.deck_seed, self.rng)
 
     def deal_hole_cards(self):
         """发放底牌给每个玩家"""
@@ -73,11 +153,13 @@ class PokerTable:
             for player in self.players:
                 if player.is_active and not player.folded:
                     player.receive_card(self.deck.pop())
+        self.mark_changed()
 
     def deal_community_cards(self, count: int):
         """发放公共牌"""
         for _ in range(count):
             self.community_cards.append(self.deck.pop())
+        self.mark_changed()
 
     def post_blinds(self):
         """下盲注，确保只有活跃玩家才能被选为大小盲"""
@@ -140,6 +222,7 @@ class PokerTable:
         if player.folded or not player.is_active or player.all_in:
             return False
 
+        # 成功的行动都会经过 log_action，由它递增状态版本号
         if action == Action.FOLD:
             player.folded = True
             self.log_action(player, action, 0, behavior)
@@ -184,6 +267,7 @@ class PokerTable:
 
     def log_action(self, player: Player, action: Action, amount: int = 0, behavior: str = ""):
         """记录玩家行动"""
+        self.mark_changed()
         gameAction = GameAction(
             hand_number=self.hand_number,
             stage=self.stage,
@@ -196,19 +280,17 @@ class PokerTable:
         )
         self.action_history.append(gameAction)
 
-        # 添加玩家行动到游戏日志
-        action_record = {
-            "type": 3,
-            "hand_number": self.hand_number,
-            "stage": self.stage.value,
-            "player_name": player.name,
-            "action": action.value,
-            "amount": amount,
-            "pot": self.pot,
-            "player_chips": player.chips,
-            "behavior": behavior
-        }
-        self.game_log.append(action_record)
+        if self.events.wants(ActionTakenEvent):
+            self.events.emit(ActionTakenEvent(
+                hand_number=self.hand_number,
+                stage=self.stage.value,
+                player_name=player.name,
+                action=action.value,
+                amount=amount,
+                pot=self.pot,
+                player_chips=player.chips,
+                behavior=behavior
+            ))
 
     def is_round_complete(self) -> bool:
         """检查当前回合是否结束"""
@@ -250,35 +332,21 @@ class PokerTable:
         for player in self.players:
             player.bet_in_round = 0
         self.current_bet = 0
+        self.mark_changed()
 
         # 根据当前阶段进入下一阶段
         if self.stage == GameStage.PREFLOP:
             self.stage = GameStage.FLOP
             self.deal_community_cards(3)  # 发放3张翻牌
-            # 记录翻牌阶段
-            self.game_log.append({
-                "type": 2,
-                "stage": self.stage.value,
-                "community_cards": [str(card) for card in self.community_cards]
-            })
+            self._emit_street_dealt()  # 记录翻牌阶段
         elif self.stage == GameStage.FLOP:
             self.stage = GameStage.TURN
             self.deal_community_cards(1)  # 发放1张转牌
-            # 记录转牌阶段
-            self.game_log.append({
-                "type": 2,
-                "stage": self.stage.value,
-                "community_cards": [str(card) for card in self.community_cards]
-            })
+            self._emit_street_dealt()  # 记录转牌阶段
         elif self.stage == GameStage.TURN:
             self.stage = GameStage.RIVER
             self.deal_community_cards(1)  # 发放1张河牌
-            # 记录河牌阶段
-            self.game_log.append({
-                "type": 2,
-                "stage": self.stage.value,
-                "community_cards": [str(card) for card in self.community_cards]
-            })
+            self._emit_street_dealt()  # 记录河牌阶段
         elif self.stage == GameStage.RIVER:
             self.stage = GameStage.SHOWDOWN
             self.showdown()  # 进行摊牌
@@ -287,6 +355,14 @@ class PokerTable:
         if len(self.players) > 0:
             self.current_player_idx = (self.dealer_position + 1) % len(self.players)
 
+    def _emit_street_dealt(self):
+        if self.events.wants(StreetDealtEvent):
+            self.events.emit(StreetDealtEvent(
+                hand_number=self.hand_number,
+                stage=self.stage.value,
+                community_cards=[str(card) for card in self.community_cards]
+            ))
+
     def evaluate_hand(self, player: Player) -> Tuple[HandRank, List[int]]:
         """评估玩家的最佳牌型"""
         all_cards = player.hand + self.community_cards
@@ -520,23 +596,18 @@ class PokerTable:
                 best_players.append(player)
 
         # 记录摊牌结果
-        showdown_record = {
-            "type": 4,
-            "hand_number": self.hand_number,
-            "community_cards": [str(card) for card in self.community_cards],
-            "players": []
-        }
-
-        for player in active_players:
-            player_record = {
-                "player_name": player.name,
-                "hand": [str(card) for card in player.hand],
-                "hand_rank": player_hands[player.name][0].name,
-                "is_winner": player in best_players
-            }
-            showdown_record["players"].append(player_record)
-
-        self.game_log.append(showdown_record)
+        if self.events.wants(ShowdownEvent):
+            self.events.emit(ShowdownEvent(
+                hand_number=self.hand_number,
+                community_cards=[str(card) for card in self.community_cards],
+                players=[{
+                    "player_name": player.name,
+                    "hand": [str(card) for card in player.hand],
+                    "hand_rank": player_hands[player.name][0].name,
+                    "is_winner": player in best_players,
+                    "chips": player.chips
+                } for player in active_players]
+            ))
 
         # 分配奖池
         self.award_pot(best_players)
@@ -550,6 +621,7 @@ class PokerTable:
         # 注意：需要包括所有已下注的玩家（包括弃牌的），因为他们已经投入了筹码
         all_players = [p for p in self.players if p.total_bet > 0]
         all_players.sort(key=lambda p: p.total_bet)
+        chips_before = {p.name: p.chips + p.total_bet for p in self.players}  # 本手牌开始时的筹码
 
         # 计算主池和边池
         previous_bet = 0
@@ -620,18 +692,6 @@ class PokerTable:
 
             previous_bet = current_bet
 
-        # 记录奖池分配（包含边池信息）
-        pot_award_record = {
-            "type": 5,
-            "hand_number": self.hand_number,
-            "pot": self.pot,
-            "side_pots": side_pots_info,
-            "winners": [{
-                "player_name": player.name,
-                "amount": total_awards[player.name]
-            } for player in winners]
-        }
-
         self.game_result_log[self.hand_number] = GameResult(
             hand_number=self.hand_number,
             pot=self.pot,
@@ -644,8 +704,32 @@ class PokerTable:
             ) for player in winners]
         )
 
-        self.game_log.append(pot_award_record)
+        # 先清空底池再记录奖池分配（包含边池信息和未弃牌玩家的结算），订阅者看到的是分配完成后的牌桌
+        pot = self.pot
         self.pot = 0
+        self.mark_changed()
+        if self.events.wants(PotAwardedEvent):
+            hands = {p.name: [str(card) for card in p.hand] for p in self.players if not p.folded}
+            self.events.emit(PotAwardedEvent(
+                hand_number=self.hand_number,
+                pot=pot,
+                stage=self.stage.value,
+                community_cards=[str(card) for card in self.community_cards],
+                side_pots=side_pots_info,
+                winners=[{
+                    "player_name": player.name,
+                    "hand": hands.get(player.name, []),
+                    "amount": total_awards[player.name]
+                } for player in winners],
+                players=[{
+                    "name": p.name,
+                    "hand": hands[p.name],
+                    "chips_before": chips_before[p.name],
+                    "chips_after": p.chips,
+                    "total_bet": p.total_bet,
+                    "net_result": p.chips - chips_before[p.name]
+                } for p in self.players if not p.folded]
+            ))
 
 
     def start_new_hand(self):
@@ -658,12 +742,14 @@ class PokerTable:
                 self.dealer_position = current_pos
                 break
         self.hand_number += 1
+        self._trim_history()
 
         # 重置牌桌状态
         self.pot = 0
         self.current_bet = 0
         self.community_cards = []
         self.stage = GameStage.PREFLOP
+        self.mark_changed()
 
         # 重置玩家状态
         for player in self.players:
@@ -679,18 +765,29 @@ class PokerTable:
         self.deal_hole_cards()
 
         # 记录新一手牌开始
-        hand_start_record = {
-            "type": 1,
-            "hand_number": self.hand_number,
-            "dealer": self.dealer_position,
-            "small_blind": self.small_blind,
-            "big_blind": self.big_blind,
-            "players": [player.to_dict() for player in self.players]
-        }
-        self.game_log.append(hand_start_record)
-
-    def save_game_log(self, filename: str):
-        """保存游戏日志到文件"""
+        if self.events.wants(HandStartedEvent):
+            self.events.emit(HandStartedEvent(
+                hand_number=self.hand_number,
+                dealer=self.dealer_position,
+                small_blind=self.small_blind,
+                big_blind=self.big_blind,
+                deck_seed=self.deck_seed,
+                players=[player.to_dict() for player in self.players]
+            ))
+
+    def save_game_log(self, filename: str, writer: Optional[Any] = None):
+        """保存游戏日志到文件，传入 writer（LogWriter）时交给后台线程写入
+
+        有界内存模式下由 spill 文件和内存中的窗口拼出完整日志，同步写入
+        """
+        if self.game_log_spill is not None:
+            self.checkpoint_game_log()
+            write_json_array(filename, self.game_log_spill)
+            return
+        if writer is not None:
+            # 日志记录追加后不会再被修改，浅拷贝列表即可安全地交给写入线程序列化
+            writer.write_json(filename, list(self.game_log))
+            return
         with open(filename, 'w', encoding='utf-8') as f:
             json.dump(self.game_log, f, ensure_ascii=False, indent=2)
 
@@ -706,77 +803,4 @@ class PokerTable:
 
     def replay_game(self):
         """根据游戏日志重放游戏"""
-        if not self.game_log:
-            print("没有游戏日志可供重放")
-            return
-
-        print("开始重放游戏...")
-        for record in self.game_log:
-            # 根据事件类型处理不同的记录
-            event_type = record.get('type', 0)
-
-            if event_type == 1:
-                # 对局开局信息
-                print(f"\n=== 新一手牌 #{record['hand_number']} ===")
-                print(f"庄家位置: {record['dealer']}")
-                print(f"盲注: 小盲 {record['small_blind']}, 大盲 {record['big_blind']}")
-                print("玩家信息:")
-                for player in record["players"]:
-                    status = ""
-                    if player['folded']:
-                        status = "(已弃牌)"
-                    elif player['all_in']:
-                        status = "(全押)"
-                    elif not player['is_active']:
-                        status = "(出局)"
-                    print(f"  {player['name']} {status}:")
-                    print(f"    筹码: {player['chips']}")
-                    print(f"    手牌: {', '.join(player['hand'])}")
-
-            elif event_type == 2:
-                # 系统发牌信息
-                print(f"\n=== {record['stage']} 阶段 ===")
-                print(f"公共牌: {', '.join(record['community_cards'])}")
-                # 显示所有玩家的手牌
-                print("当前玩家手牌:")
-                for player in record.get("players", []):
-                    status = ""
-                    if player['folded']:
-                        status = "(已弃牌)"
-                    elif player['all_in']:
-                        status = "(全押)"
-                    elif not player['is_active']:
-                        continue
-                    print(f"  {player['name']} {status}: {', '.join(player['hand'])}")
-
-            elif event_type == 3:
-                # 玩家行动信息
-                action_str = f"玩家 {record['player_name']} 选择 {record['action']}"
-                if record['amount'] > 0:
-                    action_str += f", 金额: {record['amount']}"
-                print(action_str)
-                if record['behavior']:
-                    print(f"表现: {record['behavior']}")
-                print(f"底池: {record['pot']}")
-                print(f"剩余筹码: {record['player_chips']}")
-                # 显示该玩家的手牌
-                if 'hand' in record:
-                    print(f"手牌: {', '.join(record['hand'])}")
-
-            elif event_type == 4:
-                # 摊牌信息
-                print("\n=== 摊牌阶段 ===")
-                print(f"公共牌: {', '.join(record['community_cards'])}")
-                for player in record["players"]:
-                    winner_mark = "(赢家)" if player.get("is_winner", False) else ""
-                    status = ""
-                    if player.get('folded', False):
-                        status = "(已弃牌)"
-                    elif player.get('all_in', False):
-                        status = "(全押)"
-                    print(f"\n玩家 {player['player_name']} {winner_mark} {status}")
-                    print(f"手牌: {', '.join(player['hand'])}")
-                    print(f"牌型: {player['hand_rank']}")
-
-            # 暂停一下，便于观察
-            input("按Enter键继续...")
+        play(ReplayEngine(self.game_log), step=True)
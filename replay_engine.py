@@ -0,0 +1,359 @@
+# replay_engine.py
+# 无头回放引擎：根据游戏日志重建牌桌状态，支持按事件/手牌随机跳转
+
+import bisect
+import copy
+import json
+import time
+from dataclasses import dataclass, field, asdict
+from typing import List, Dict, Any, Optional, Iterator, Tuple
+
+
+@dataclass
+class ReplayPlayerState:
+    """回放中的玩家状态"""
+    name: str
+    chips: int = 0
+    hand: List[str] = field(default_factory=list)
+    bet_in_round: int = 0
+    total_bet: int = 0
+    folded: bool = False
+    all_in: bool = False
+    is_active: bool = True
+
+
+@dataclass
+class ReplayState:
+    """回放中某一时刻的完整牌桌状态"""
+    event_index: int = -1  # 已应用的最后一个事件下标，-1 表示尚未应用任何事件
+    hand_number: int = 0
+    dealer: int = 0
+    small_blind: int = 0
+    big_blind: int = 0
+    deck_seed: Optional[int] = None
+    stage: str = "preflop"
+    pot: int = 0
+    community_cards: List[str] = field(default_factory=list)
+    players: List[ReplayPlayerState] = field(default_factory=list)
+    showdown: List[Dict[str, Any]] = field(default_factory=list)
+    winners: List[Dict[str, Any]] = field(default_factory=list)
+
+    def get_player(self, name: str) -> ReplayPlayerState:
+        """按名字获取玩家，不存在时自动补充（日志中可能先出现盲注再出现开局记录）"""
+        for player in self.players:
+            if player.name == name:
+                return player
+        player = ReplayPlayerState(name=name)
+        self.players.append(player)
+        return player
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def get_record_hand_number(record: Dict[str, Any]) -> Optional[int]:
+    """获取事件所属的手牌编号，发牌记录(type 2)没有该字段"""
+    return record.get("hand_number")
+
+
+def start_hand(state: ReplayState, hand_number: int):
+    """进入新的一手牌，重置本手相关状态"""
+    state.hand_number = hand_number
+    state.stage = "preflop"
+    state.pot = 0
+    state.community_cards = []
+    state.showdown = []
+    state.winners = []
+    for player in state.players:
+        player.hand = []
+        player.bet_in_round = 0
+        player.total_bet = 0
+        player.folded = False
+        player.all_in = False
+        player.is_active = player.chips > 0
+
+
+def apply_event(state: ReplayState, record: Dict[str, Any]):
+    """将一条日志事件应用到牌桌状态上"""
+    event_type = record.get("type", 0)
+    hand_number = get_record_hand_number(record)
+    if hand_number is not None and hand_number != state.hand_number:
+        start_hand(state, hand_number)
+
+    if event_type == 1:
+        # 对局开局信息，记录的是下盲注并发完底牌后的完整状态
+        state.dealer = record.get("dealer", 0)
+        state.small_blind = record.get("small_blind", 0)
+        state.big_blind = record.get("big_blind", 0)
+        state.deck_seed = record.get("deck_seed")
+        state.players = [
+            ReplayPlayerState(
+                name=p["name"],
+                chips=p.get("chips", 0),
+                hand=list(p.get("hand", [])),
+                bet_in_round=p.get("bet_in_round", 0),
+                total_bet=p.get("total_bet", 0),
+                folded=p.get("folded", False),
+                all_in=p.get("all_in", False),
+                is_active=p.get("is_active", True)
+            )
+            for p in record.get("players", [])
+        ]
+        state.pot = sum(p.total_bet for p in state.players)
+
+    elif event_type == 2:
+        # 系统发牌信息
+        state.stage = record.get("stage", state.stage)
+        state.community_cards = list(record.get("community_cards", []))
+        for player in state.players:
+            player.bet_in_round = 0
+
+    elif event_type == 3:
+        # 玩家行动信息
+        state.stage = record.get("stage", state.stage)
+        player = state.get_player(record["player_name"])
+        amount = record.get("amount", 0)
+        player.chips = record.get("player_chips", player.chips)
+        player.bet_in_round += amount
+        player.total_bet += amount
+        if record.get("action") == "fold":
+            player.folded = True
+        if player.chips == 0 and player.total_bet > 0:
+            player.all_in = True
+        state.pot = record.get("pot", state.pot)
+
+    elif event_type == 4:
+        # 摊牌信息
+        state.stage = "showdown"
+        state.community_cards = list(record.get("community_cards", state.community_cards))
+        state.showdown = copy.deepcopy(record.get("players", []))
+        for info in state.showdown:
+            state.get_player(info["player_name"]).hand = list(info.get("hand", []))
+
+    elif event_type == 5:
+        # 奖池分配，包含赢得的筹码和边池退还
+        for winner in record.get("winners", []):
+            state.get_player(winner["player_name"]).chips += winner.get("amount", 0)
+        for side_pot in record.get("side_pots", []):
+            if not side_pot.get("refunded"):
+                continue
+            eligible = side_pot.get("eligible_players", [])
+            if not eligible:
+                continue
+            per_player = side_pot.get("award_per_winner", 0)
+            for name in eligible:
+                state.get_player(name).chips += per_player
+            state.get_player(eligible[0]).chips += side_pot.get("pot_amount", 0) - per_player * len(eligible)
+        state.winners = copy.deepcopy(record.get("winners", []))
+        state.pot = 0
+
+    state.event_index += 1
+
+
+class ReplayEngine:
+    """基于关键帧的回放引擎
+
+    构造时顺序扫描一次日志，每隔 keyframe_interval 个事件以及每手牌开始时保存一份状态快照，
+    之后跳转到任意事件只需从最近的关键帧重放至多 keyframe_interval 个事件。
+    """
+
+    def __init__(self, game_log: List[Dict[str, Any]], keyframe_interval: int = 64):
+        if keyframe_interval <= 0:
+            raise ValueError("keyframe_interval 必须为正整数")
+        self.game_log = game_log
+        self.keyframe_interval = keyframe_interval
+        self._keyframe_indices: List[int] = []  # 关键帧对应的事件下标（该事件尚未应用）
+        self._keyframes: List[ReplayState] = []
+        self._hand_start_index: Dict[int, int] = {}  # 手牌编号 -> 该手第一个事件的下标
+        self._build_index()
+
+    @classmethod
+    def from_file(cls, filename: str, keyframe_interval: int = 64) -> "ReplayEngine":
+        """从游戏日志文件创建回放引擎"""
+        with open(filename, 'r', encoding='utf-8') as f:
+            return cls(json.load(f), keyframe_interval=keyframe_interval)
+
+    def __len__(self) -> int:
+        return len(self.game_log)
+
+    def _build_index(self):
+        """顺序扫描日志，建立关键帧和手牌索引"""
+        state = ReplayState()
+        last_keyframe = None
+        for index, record in enumerate(self.game_log):
+            hand_number = get_record_hand_number(record)
+            is_hand_start = hand_number is not None and hand_number not in self._hand_start_index
+            if is_hand_start:
+                self._hand_start_index[hand_number] = index
+            if is_hand_start or last_keyframe is None or index - last_keyframe >= self.keyframe_interval:
+                self._keyframe_indices.append(index)
+                self._keyframes.append(copy.deepcopy(state))
+                last_keyframe = index
+            apply_event(state, record)
+
+    @property
+    def hand_numbers(self) -> List[int]:
+        """日志中出现的所有手牌编号"""
+        return sorted(self._hand_start_index.keys())
+
+    @property
+    def keyframe_count(self) -> int:
+        return len(self._keyframes)
+
+    def hand_start_index(self, hand_number: int) -> int:
+        """获取指定手牌第一个事件的下标"""
+        if hand_number not in self._hand_start_index:
+            raise KeyError(f"日志中没有第 {hand_number} 手牌")
+        return self._hand_start_index[hand_number]
+
+    def state_before(self, index: int) -> ReplayState:
+        """获取应用第 index 个事件之前的牌桌状态（index 可以等于事件总数）"""
+        if index < 0 or index > len(self.game_log):
+            raise IndexError(f"事件下标越界: {index}")
+        pos = bisect.bisect_right(self._keyframe_indices, index) - 1
+        if pos < 0:
+            state, start = ReplayState(), 0
+        else:
+            state, start = copy.deepcopy(self._keyframes[pos]), self._keyframe_indices[pos]
+        for record in self.game_log[start:index]:
+            apply_event(state, record)
+        return state
+
+    def state_at(self, index: int) -> ReplayState:
+        """获取应用第 index 个事件之后的牌桌状态"""
+        if index < 0 or index >= len(self.game_log):
+            raise IndexError(f"事件下标越界: {index}")
+        return self.state_before(index + 1)
+
+    def iter_events(self, start: int = 0, end: Optional[int] = None) -> Iterator[Tuple[int, Dict[str, Any], ReplayState]]:
+        """从 start 开始逐个应用事件，依次产出 (下标, 事件, 应用后的状态)，状态对象会被原地更新"""
+        end = len(self.game_log) if end is None else min(end, len(self.game_log))
+        state = self.state_before(start)
+        for index in range(start, end):
+            record = self.game_log[index]
+            apply_event(state, record)
+            yield index, record, state
+
+
+def format_event(record: Dict[str, Any]) -> str:
+    """将一条日志事件格式化为可读文本"""
+    lines = []
+    event_type = record.get('type', 0)
+
+    if event_type == 1:
+        # 对局开局信息
+        lines.append(f"\n=== 新一手牌 #{record['hand_number']} ===")
+        lines.append(f"庄家位置: {record['dealer']}")
+        lines.append(f"盲注: 小盲 {record['small_blind']}, 大盲 {record['big_blind']}")
+        if record.get('deck_seed') is not None:
+            lines.append(f"洗牌种子: {record['deck_seed']}")
+        lines.append("玩家信息:")
+        for player in record["players"]:
+            status = ""
+            if player['folded']:
+                status = "(已弃牌)"
+            elif player['all_in']:
+                status = "(全押)"
+            elif not player['is_active']:
+                status = "(出局)"
+            lines.append(f"  {player['name']} {status}:")
+            lines.append(f"    筹码: {player['chips']}")
+            lines.append(f"    手牌: {', '.join(player['hand'])}")
+
+    elif event_type == 2:
+        # 系统发牌信息
+        lines.append(f"\n=== {record['stage']} 阶段 ===")
+        lines.append(f"公共牌: {', '.join(record['community_cards'])}")
+        # 显示所有玩家的手牌
+        if record.get("players"):
+            lines.append("当前玩家手牌:")
+        for player in record.get("players", []):
+            status = ""
+            if player['folded']:
+                status = "(已弃牌)"
+            elif player['all_in']:
+                status = "(全押)"
+            elif not player['is_active']:
+                continue
+            lines.append(f"  {player['name']} {status}: {', '.join(player['hand'])}")
+
+    elif event_type == 3:
+        # 玩家行动信息
+        action_str = f"玩家 {record['player_name']} 选择 {record['action']}"
+        if record['amount'] > 0:
+            action_str += f", 金额: {record['amount']}"
+        lines.append(action_str)
+        if record['behavior']:
+            lines.append(f"表现: {record['behavior']}")
+        lines.append(f"底池: {record['pot']}")
+        lines.append(f"剩余筹码: {record['player_chips']}")
+        # 显示该玩家的手牌
+        if 'hand' in record:
+            lines.append(f"手牌: {', '.join(record['hand'])}")
+
+    elif event_type == 4:
+        # 摊牌信息
+        lines.append("\n=== 摊牌阶段 ===")
+        lines.append(f"公共牌: {', '.join(record['community_cards'])}")
+        for player in record["players"]:
+            winner_mark = "(赢家)" if player.get("is_winner", False) else ""
+            status = ""
+            if player.get('folded', False):
+                status = "(已弃牌)"
+            elif player.get('all_in', False):
+                status = "(全押)"
+            lines.append(f"\n玩家 {player['player_name']} {winner_mark} {status}")
+            lines.append(f"手牌: {', '.join(player['hand'])}")
+            lines.append(f"牌型: {player['hand_rank']}")
+
+    elif event_type == 5:
+        # 奖池分配信息
+        winners = ", ".join(f"{w['player_name']} +{w['amount']}" for w in record.get("winners", []))
+        lines.append(f"奖池 {record.get('pot', 0)} 分配: {winners}")
+
+    return "\n".join(lines)
+
+
+def format_state(state: ReplayState) -> str:
+    """将牌桌状态格式化为可读文本"""
+    lines = [
+        f"--- 第 {state.hand_number} 手牌 / 事件 #{state.event_index} / 阶段 {state.stage} ---",
+        f"底池: {state.pot}  公共牌: {', '.join(state.community_cards) if state.community_cards else '暂无'}"
+    ]
+    for i, player in enumerate(state.players):
+        dealer_str = "(庄家)" if i == state.dealer else ""
+        status = []
+        if player.folded:
+            status.append("弃牌")
+        if player.all_in:
+            status.append("全押")
+        if not player.is_active:
+            status.append("出局")
+        status_str = f" [{' / '.join(status)}]" if status else ""
+        lines.append(f"  {player.name}{dealer_str}: 筹码 {player.chips}, 本轮下注 {player.bet_in_round}, "
+                     f"手牌 {', '.join(player.hand) if player.hand else '??'}{status_str}")
+    return "\n".join(lines)
+
+
+def play(engine: ReplayEngine, start: int = 0, end: Optional[int] = None, speed: float = 0.0, step: bool = False):
+    """从指定事件开始在终端中播放回放
+
+    Args:
+        speed: 每个事件之间的停顿秒数，0 表示不停顿
+        step: 为 True 时每个事件后等待回车，与旧版回放行为一致
+    """
+    if not engine.game_log:
+        print("没有游戏日志可供重放")
+        return
+
+    if start > 0:
+        print(format_state(engine.state_before(start)))
+    print("开始重放游戏...")
+    for _, record, _ in engine.iter_events(start, end):
+        text = format_event(record)
+        if text:
+            print(text)
+        if step:
+            input("按Enter键继续...")
+        elif speed > 0:
+            time.sleep(speed)
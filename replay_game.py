@@ -1,9 +1,67 @@
-from game_controller import GameController
+# replay_game.py
+# 命令行回放工具，基于 replay_engine 支持按手牌/事件跳转
+
+import argparse
+import os
+import sys
+
+from replay_engine import ReplayEngine, format_state, play
+
+
+def find_log_file(log_dir: str, game_id: str = None) -> str:
+    """根据游戏ID查找日志文件，未指定时返回最新的一局"""
+    if game_id:
+        return os.path.join(log_dir, f"poker_game_{game_id}.json")
+
+    if not os.path.exists(log_dir):
+        return ""
+    game_files = [
+        os.path.join(log_dir, f) for f in os.listdir(log_dir)
+        if f.startswith("poker_game_") and f.endswith(".json")
+    ]
+    return max(game_files, key=os.path.getmtime) if game_files else ""
 
 
 def main():
-    gc = GameController()
-    gc.replay_game("1447fe12")
+    parser = argparse.ArgumentParser(description="德州扑克对局回放")
+    parser.add_argument("game_id", nargs="?", default=None, help="游戏ID，默认回放最新的一局")
+    parser.add_argument("--file", default=None, help="直接指定游戏日志文件")
+    parser.add_argument("--log-dir", default="game_logs")
+    parser.add_argument("--hand", type=int, default=None, help="从指定手牌开始回放")
+    parser.add_argument("--event", type=int, default=None, help="从指定事件下标开始回放")
+    parser.add_argument("--count", type=int, default=None, help="最多回放的事件数量")
+    parser.add_argument("--speed", type=float, default=0.0, help="每个事件之间停顿的秒数")
+    parser.add_argument("--step", action="store_true", help="每个事件后按回车继续")
+    parser.add_argument("--state", action="store_true", help="只输出跳转位置的牌桌状态，不播放")
+    parser.add_argument("--keyframe-interval", type=int, default=64)
+    args = parser.parse_args()
+
+    filename = args.file or find_log_file(args.log_dir, args.game_id)
+    if not filename or not os.path.exists(filename):
+        print(f"找不到游戏日志文件: {filename or args.log_dir}")
+        sys.exit(1)
+
+    engine = ReplayEngine.from_file(filename, keyframe_interval=args.keyframe_interval)
+
+    start = 0
+    if args.hand is not None:
+        try:
+            start = engine.hand_start_index(args.hand)
+        except KeyError as e:
+            print(e.args[0])
+            sys.exit(1)
+    if args.event is not None:
+        start = args.event
+    if start < 0 or start > len(engine):
+        print(f"事件下标越界: {start}（共 {len(engine)} 个事件）")
+        sys.exit(1)
+
+    if args.state:
+        print(format_state(engine.state_before(start)))
+        return
+
+    end = start + args.count if args.count is not None else None
+    play(engine, start=start, end=end, speed=args.speed, step=args.step)
 
 
 if __name__ == '__main__':
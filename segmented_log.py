@@ -0,0 +1,315 @@
+# segmented_log.py
+# 增强日志的分段存储：每 N 手牌压缩为一个分段文件，另有一个小的索引文件记录对局信息、分段位置和每手牌摘要
+# 读取方只需加载索引和需要的分段，对局中途进程退出时已写入的分段不会丢失
+
+import argparse
+import bisect
+import gzip
+import json
+import os
+from typing import Dict, List, Any, Optional, Tuple
+
+SEGMENT_DIR = "segments"
+INDEX_FILE = "index.json"
+SEGMENTS_FILE = "segments.jsonl"
+HANDS_FILE = "hands.jsonl"
+FORMAT_VERSION = 2
+
+# 逐手牌记录的列表字段，其余字段为对局级元信息
+RECORD_FIELDS = ["events", "llm_decisions", "llm_reflections"]
+META_FIELDS = [
+    "game_id", "start_time", "end_time", "initial_chips", "small_blind", "big_blind", "seed",
+    "players", "final_rankings", "prompt_templates"
+]
+
+
+def get_segment_path(log_dir: str, game_id: str) -> str:
+    return os.path.join(log_dir, SEGMENT_DIR, game_id)
+
+
+def segment_filename(seq: int) -> str:
+    return f"segment_{seq:05d}.json.gz"
+
+
+def encode_segment(segment: Dict[str, Any]) -> bytes:
+    return gzip.compress(json.dumps(segment, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+
+def decode_segment(data: bytes) -> Dict[str, Any]:
+    return json.loads(gzip.decompress(data).decode("utf-8"))
+
+
+def summarize_hands(segment: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """根据分段中的记录生成每手牌的摘要"""
+    hands: Dict[int, Dict[str, Any]] = {}
+
+    def hand(number: int) -> Dict[str, Any]:
+        if number not in hands:
+            hands[number] = {
+                "hand_number": number, "pot": 0, "stage": "", "winners": [],
+                "community_cards": [], "decisions": 0, "reflections": 0
+            }
+        return hands[number]
+
+    for event in segment["events"]:
+        if event.get("type") == 6:
+            summary = hand(event.get("hand_number", 0))
+            summary["pot"] = event.get("pot", 0)
+            summary["stage"] = event.get("stage", "")
+            summary["winners"] = [w.get("name") for w in event.get("winners", [])]
+            summary["community_cards"] = event.get("community_cards", [])
+    for decision in segment["llm_decisions"]:
+        hand(decision.get("hand_number", 0))["decisions"] += 1
+    for reflection in segment["llm_reflections"]:
+        hand(reflection.get("hand_number", 0))["reflections"] += 1
+    return [hands[number] for number in sorted(hands)]
+
+
+class SegmentedLogStore:
+    """分段日志的写入端，GameLogger 和转换工具共用
+
+    已封闭分段的信息和每手牌摘要追加到 segments.jsonl / hands.jsonl，index.json 只保存对局信息和
+    最后一个未封闭的分段，因此写入端不需要在内存中保留全部手牌，重写索引的开销也不随对局变长而增加。
+    未封闭的分段按序号重复写入时覆盖（用于对局结束前反复保存最后一个未满的分段）；
+    传入 writer（LogWriter）时压缩和写盘都在后台线程完成
+    """
+
+    def __init__(self, path: str, writer: Optional[Any] = None):
+        self.path = path
+        self.writer = writer
+        self.closed_segments = 0
+        self.open_segment: Optional[Dict[str, Any]] = None
+        self.open_hands: List[Dict[str, Any]] = []
+        os.makedirs(path, exist_ok=True)
+        for name in (SEGMENTS_FILE, HANDS_FILE):
+            with open(os.path.join(path, name), 'wb'):
+                pass
+
+    def _append_lines(self, name: str, rows: List[Dict[str, Any]]):
+        data = b"".join(json.dumps(row, ensure_ascii=False).encode("utf-8") + b"\n" for row in rows)
+        full_path = os.path.join(self.path, name)
+        if self.writer is not None:
+            self.writer.append_bytes(full_path, data)
+        else:
+            with open(full_path, 'ab') as f:
+                f.write(data)
+
+    def write_segment(
+        self,
+        seq: int,
+        records: Dict[str, List[Dict[str, Any]]],
+        prompt_blobs: Dict[str, str],
+        close: bool = True
+    ):
+        """写入一个分段，records 包含 events/llm_decisions/llm_reflections 三个列表，close 为 True 时该分段不再改写"""
+        hand_numbers = [r.get("hand_number", 0) for name in RECORD_FIELDS for r in records[name]]
+        first_hand, last_hand = (min(hand_numbers), max(hand_numbers)) if hand_numbers else (0, 0)
+        # 只保存本分段记录引用到的完整prompt
+        hashes = {r["prompt_hash"] for name in ("llm_decisions", "llm_reflections")
+                  for r in records[name] if r.get("prompt_hash")}
+        segment = {
+            "seq": seq,
+            "first_hand": first_hand,
+            "last_hand": last_hand,
+            **{name: records[name] for name in RECORD_FIELDS},
+            "prompt_blobs": {h: prompt_blobs[h] for h in hashes if h in prompt_blobs}
+        }
+
+        filename = segment_filename(seq)
+        full_path = os.path.join(self.path, filename)
+        if self.writer is not None:
+            self.writer.write_json_gz(full_path, segment)
+        else:
+            with open(full_path, 'wb') as f:
+                f.write(encode_segment(segment))
+
+        info = {
+            "seq": seq,
+            "file": filename,
+            "first_hand": first_hand,
+            "last_hand": last_hand,
+            **{name: len(records[name]) for name in RECORD_FIELDS}
+        }
+        summaries = summarize_hands(segment)
+        for summary in summaries:
+            summary["segment"] = seq
+        if close:
+            self._append_lines(SEGMENTS_FILE, [info])
+            self._append_lines(HANDS_FILE, summaries)
+            self.closed_segments += 1
+            self.open_segment, self.open_hands = None, []
+        else:
+            self.open_segment, self.open_hands = info, summaries
+
+    def write_index(self, meta: Dict[str, Any]):
+        """重写索引文件，分段写入后调用"""
+        index = {
+            "format": "segmented",
+            "version": FORMAT_VERSION,
+            **{name: meta.get(name) for name in META_FIELDS},
+            "closed_segments": self.closed_segments,
+            "open_segment": self.open_segment,
+            "open_hands": self.open_hands
+        }
+        full_path = os.path.join(self.path, INDEX_FILE)
+        if self.writer is not None:
+            self.writer.write_json(full_path, index, indent=None)
+            return
+        tmp_path = full_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f, ensure_ascii=False)
+        os.replace(tmp_path, full_path)
+
+
+def _read_lines(filename: str) -> List[Dict[str, Any]]:
+    """读取 JSON Lines 文件，忽略进程中途退出时可能残留的不完整行"""
+    rows = []
+    if not os.path.exists(filename):
+        return rows
+    with open(filename, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                rows.append(json.loads(line))
+            except ValueError:
+                continue
+    return rows
+
+
+class SegmentedLog:
+    """分段日志的读取端，按需加载分段"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, INDEX_FILE), 'r', encoding='utf-8') as f:
+            self.index: Dict[str, Any] = json.load(f)
+        self.segments = self._merge_open(_read_lines(os.path.join(path, SEGMENTS_FILE)), [self.index.get("open_segment")])
+        self.hands = self._merge_open(_read_lines(os.path.join(path, HANDS_FILE)), self.index.get("open_hands", []))
+        self._first_hands = [s["first_hand"] for s in self.segments]
+        self._cache: Dict[int, Dict[str, Any]] = {}
+
+    @classmethod
+    def open(cls, log_dir: str, game_id: str) -> "SegmentedLog":
+        return cls(get_segment_path(log_dir, game_id))
+
+    @staticmethod
+    def exists(log_dir: str, game_id: str) -> bool:
+        return os.path.exists(os.path.join(get_segment_path(log_dir, game_id), INDEX_FILE))
+
+    @property
+    def game_id(self) -> str:
+        return self.index["game_id"]
+
+    @staticmethod
+    def _merge_open(closed: List[Dict[str, Any]], open_rows: List[Optional[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        # 封闭分段写入后、索引重写前退出时，索引中的未封闭分段可能已经出现在 jsonl 中
+        closed_seqs = {row.get("seq", row.get("segment")) for row in closed}
+        return closed + [
+            row for row in open_rows if row and row.get("seq", row.get("segment")) not in closed_seqs
+        ]
+
+    @property
+    def hand_summaries(self) -> List[Dict[str, Any]]:
+        return self.hands
+
+    def meta(self) -> Dict[str, Any]:
+        return {name: self.index.get(name) for name in META_FIELDS}
+
+    def load_segment(self, position: int) -> Dict[str, Any]:
+        """加载第 position 个分段（按索引中的顺序）"""
+        if position not in self._cache:
+            with open(os.path.join(self.path, self.segments[position]["file"]), 'rb') as f:
+                self._cache[position] = decode_segment(f.read())
+        return self._cache[position]
+
+    def segment_positions(self, first_hand: int, last_hand: int) -> List[int]:
+        """覆盖 [first_hand, last_hand] 的分段位置"""
+        start = max(0, bisect.bisect_right(self._first_hands, first_hand) - 1)
+        end = bisect.bisect_right(self._first_hands, last_hand)
+        return [i for i in range(start, end) if self.segments[i]["last_hand"] >= first_hand]
+
+    def load_hands(self, first_hand: int, last_hand: Optional[int] = None) -> Dict[str, Any]:
+        """只加载指定手牌范围内的记录，返回 events/llm_decisions/llm_reflections/prompt_blobs"""
+        last_hand = first_hand if last_hand is None else last_hand
+        result: Dict[str, Any] = {name: [] for name in RECORD_FIELDS}
+        result["prompt_blobs"] = {}
+        for position in self.segment_positions(first_hand, last_hand):
+            segment = self.load_segment(position)
+            for name in RECORD_FIELDS:
+                result[name].extend(
+                    r for r in segment[name] if first_hand <= r.get("hand_number", 0) <= last_hand
+                )
+            result["prompt_blobs"].update(segment["prompt_blobs"])
+        return result
+
+    def to_enhanced(self) -> Dict[str, Any]:
+        """拼接所有分段，得到与 enhanced_poker_game_*.json 相同结构的日志"""
+        data = self.meta()
+        for name in RECORD_FIELDS:
+            data[name] = []
+        data["prompt_blobs"] = {}
+        for position in range(len(self.segments)):
+            segment = self.load_segment(position)
+            for name in RECORD_FIELDS:
+                data[name].extend(segment[name])
+            data["prompt_blobs"].update(segment["prompt_blobs"])
+        data["prompt_templates"] = data.get("prompt_templates") or {}
+        return data
+
+
+def split_into_segments(
+    log: Dict[str, Any],
+    hands_per_segment: int
+) -> List[Tuple[int, Dict[str, List[Dict[str, Any]]]]]:
+    """把完整的增强日志按手牌编号切分为分段，返回 (序号, records) 列表"""
+    buckets: Dict[int, Dict[str, List[Dict[str, Any]]]] = {}
+    for name in RECORD_FIELDS:
+        for record in log.get(name, []):
+            # 第1手牌之前的记录（hand_number 为0）归入第一个分段
+            seq = max(record.get("hand_number", 0) - 1, 0) // hands_per_segment
+            buckets.setdefault(seq, {n: [] for n in RECORD_FIELDS})[name].append(record)
+    return sorted(buckets.items())
+
+
+def convert_enhanced_log(filename: str, log_dir: Optional[str] = None, hands_per_segment: int = 10) -> str:
+    """把已有的 enhanced_poker_game_*.json 转换为分段存储，返回分段目录"""
+    with open(filename, 'r', encoding='utf-8') as f:
+        log = json.load(f)
+    log_dir = log_dir or os.path.dirname(filename)
+    store = SegmentedLogStore(get_segment_path(log_dir, log["game_id"]))
+    blobs = log.get("prompt_blobs", {})
+    for seq, records in split_into_segments(log, hands_per_segment):
+        store.write_segment(seq, records, blobs, close=True)
+    store.write_index(log)
+    return store.path
+
+
+def join_segments(log_dir: str, game_id: str, filename: Optional[str] = None) -> str:
+    """把分段存储拼回单个 enhanced_poker_game_*.json（供网页上传等需要完整文件的场景）"""
+    data = SegmentedLog.open(log_dir, game_id).to_enhanced()
+    filename = filename or os.path.join(log_dir, f"enhanced_poker_game_{game_id}.json")
+    with open(filename, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    return filename
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="增强日志分段存储转换工具")
+    parser.add_argument("files", nargs="*", help="要转换的增强日志文件，默认转换 log_dir 下所有增强日志")
+    parser.add_argument("--log-dir", default="game_logs")
+    parser.add_argument("--hands-per-segment", type=int, default=10)
+    parser.add_argument("--join", metavar="GAME_ID", default=None, help="把分段存储拼回单个JSON文件")
+    args = parser.parse_args()
+
+    if args.join:
+        print(f"已生成: {join_segments(args.log_dir, args.join)}")
+    else:
+        files = args.files
+        if not files and os.path.isdir(args.log_dir):
+            files = sorted(
+                os.path.join(args.log_dir, name) for name in os.listdir(args.log_dir)
+                if name.startswith("enhanced_poker_game_") and name.endswith(".json")
+            )
+        for filename in files:
+            path = convert_enhanced_log(filename, args.log_dir, args.hands_per_segment)
+            print(f"{filename} -> {path}")
+        print(f"共转换 {len(files)} 个日志")
@@ -0,0 +1,447 @@
+# sqlite_log.py
+# 把 game_logs 中的增强日志导入本地 SQLite 数据库，跨对局的查询和 LogAnalyzer 的统计都用带索引的 SQL 完成
+
+import argparse
+import json
+import os
+import sqlite3
+import threading
+from typing import Dict, List, Any, Optional, Tuple
+
+from analyze_logs import LogAnalyzer, normalize_action, list_log_sources, load_log_source
+from game_logger import resolve_prompt
+
+DB_FILE = "poker_logs.db"
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS source_files (
+    path TEXT PRIMARY KEY,
+    game_id TEXT NOT NULL,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS games (
+    game_id TEXT PRIMARY KEY,
+    start_time TEXT,
+    end_time TEXT,
+    initial_chips INTEGER,
+    small_blind INTEGER,
+    big_blind INTEGER,
+    seed INTEGER,
+    total_hands INTEGER,
+    players TEXT,
+    final_rankings TEXT,
+    prompt_templates TEXT,
+    prompt_blobs TEXT
+);
+CREATE TABLE IF NOT EXISTS hands (
+    game_id TEXT NOT NULL,
+    hand_number INTEGER NOT NULL,
+    pot INTEGER,
+    stage TEXT,
+    community_cards TEXT,
+    winners TEXT,
+    PRIMARY KEY (game_id, hand_number)
+);
+CREATE TABLE IF NOT EXISTS events (
+    game_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    type INTEGER NOT NULL,
+    hand_number INTEGER,
+    pot INTEGER,
+    data TEXT NOT NULL,
+    PRIMARY KEY (game_id, seq)
+);
+CREATE TABLE IF NOT EXISTS decisions (
+    game_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    player_name TEXT NOT NULL,
+    model_name TEXT NOT NULL,
+    hand_number INTEGER NOT NULL,
+    stage TEXT NOT NULL,
+    action TEXT NOT NULL,
+    amount INTEGER,
+    pot INTEGER,
+    current_bet INTEGER,
+    response_time REAL,
+    timestamp TEXT,
+    has_error INTEGER,
+    data TEXT NOT NULL,
+    PRIMARY KEY (game_id, seq)
+);
+CREATE TABLE IF NOT EXISTS reflections (
+    game_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    player_name TEXT NOT NULL,
+    model_name TEXT NOT NULL,
+    hand_number INTEGER NOT NULL,
+    timestamp TEXT,
+    data TEXT NOT NULL,
+    PRIMARY KEY (game_id, seq)
+);
+CREATE INDEX IF NOT EXISTS idx_decisions_model_stage ON decisions (model_name, stage);
+CREATE INDEX IF NOT EXISTS idx_decisions_game_hand ON decisions (game_id, hand_number);
+CREATE INDEX IF NOT EXISTS idx_decisions_player ON decisions (player_name, game_id);
+CREATE INDEX IF NOT EXISTS idx_events_game_type ON events (game_id, type);
+CREATE INDEX IF NOT EXISTS idx_reflections_player ON reflections (player_name, game_id);
+"""
+
+GAME_TABLES = ["games", "hands", "events", "decisions", "reflections"]
+
+
+def get_db_path(log_dir: str) -> str:
+    return os.path.join(log_dir, DB_FILE)
+
+
+def connect(db_path: str) -> sqlite3.Connection:
+    """打开数据库并确保表结构存在"""
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+    return conn
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False)
+
+
+def insert_game(conn: sqlite3.Connection, log: Dict[str, Any]):
+    """写入一局游戏的所有数据，已存在的同一局先删除，因此重复导入结果不变"""
+    game_id = log.get("game_id", "")
+    for table in GAME_TABLES:
+        conn.execute(f"DELETE FROM {table} WHERE game_id = ?", (game_id,))
+
+    events = log.get("events", [])
+    conn.execute(
+        "INSERT INTO games VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (
+            game_id, log.get("start_time", ""), log.get("end_time", ""), log.get("initial_chips", 0),
+            log.get("small_blind", 0), log.get("big_blind", 0), log.get("seed"),
+            max([e.get("hand_number", 0) for e in events], default=0),
+            _dumps(log.get("players", [])), _dumps(log.get("final_rankings", [])),
+            _dumps(log.get("prompt_templates", {})), _dumps(log.get("prompt_blobs", {}))
+        )
+    )
+    conn.executemany(
+        "INSERT INTO events VALUES (?, ?, ?, ?, ?, ?)",
+        (
+            (game_id, i, e.get("type", 0), e.get("hand_number", 0), e.get("pot", 0), _dumps(e))
+            for i, e in enumerate(events)
+        )
+    )
+    conn.executemany(
+        "INSERT OR REPLACE INTO hands VALUES (?, ?, ?, ?, ?, ?)",
+        (
+            (
+                game_id, e.get("hand_number", 0), e.get("pot", 0), e.get("stage", ""),
+                _dumps(e.get("community_cards", [])), _dumps([w.get("name") for w in e.get("winners", [])])
+            )
+            for e in events if e.get("type") == 6
+        )
+    )
+    conn.executemany(
+        "INSERT INTO decisions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (
+            (
+                game_id, i, d["player_name"], d["model_name"], d["hand_number"], d["stage"],
+                normalize_action(d.get("parsed_action", "")), d.get("action_amount", 0),
+                (d.get("game_state") or {}).get("pot", 0), (d.get("game_state") or {}).get("current_bet", 0),
+                d.get("response_time", 0.0), d.get("timestamp", ""), int(bool(d.get("error"))), _dumps(d)
+            )
+            for i, d in enumerate(log.get("llm_decisions", []))
+        )
+    )
+    conn.executemany(
+        "INSERT INTO reflections VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (
+            (game_id, i, r["player_name"], r["model_name"], r["hand_number"], r.get("timestamp", ""), _dumps(r))
+            for i, r in enumerate(log.get("llm_reflections", []))
+        )
+    )
+
+
+def ingest_log_dir(log_dir: str = "game_logs", db_path: Optional[str] = None, force: bool = False) -> List[str]:
+    """增量导入 log_dir 下的日志，按 mtime 和大小跳过未变化的文件，源文件已删除的对局同时移除；返回本次导入的游戏ID"""
+    conn = connect(db_path or get_db_path(log_dir))
+    ingested = []
+    try:
+        known = {row["path"]: row for row in conn.execute("SELECT * FROM source_files")}
+        sources = list_log_sources(log_dir)
+
+        # 源文件消失时只有对局本身也不在了才删除它的数据：对局结束后单文件日志取代分段索引，
+        # 同一局换了源文件，数据由下面的导入覆盖
+        current = {os.path.abspath(filename) for filename, _ in sources}
+        current_games = {game_id for _, game_id in sources}
+        with conn:
+            for path, row in list(known.items()):
+                if path in current:
+                    continue
+                if row["game_id"] not in current_games:
+                    for table in GAME_TABLES:
+                        conn.execute(f"DELETE FROM {table} WHERE game_id = ?", (row["game_id"],))
+                conn.execute("DELETE FROM source_files WHERE path = ?", (path,))
+                del known[path]
+
+        for filename, game_id in sources:
+            stat = os.stat(filename)
+            key = os.path.abspath(filename)
+            row = known.get(key)
+            if not force and row and row["mtime"] == stat.st_mtime and row["size"] == stat.st_size:
+                continue
+            log = load_log_source(filename)
+            with conn:
+                insert_game(conn, log)
+                conn.execute(
+                    "INSERT OR REPLACE INTO source_files VALUES (?, ?, ?, ?)",
+                    (key, log.get("game_id", game_id), stat.st_mtime, stat.st_size)
+                )
+            ingested.append(game_id)
+    finally:
+        conn.close()
+    return ingested
+
+
+class SQLiteLogAnalyzer(LogAnalyzer):
+    """在 SQLite 数据库上用带索引的 SQL 完成查询和统计的日志分析器，未导入的对局回退到 JSON 日志"""
+
+    def __init__(self, log_dir: str = "game_logs", db_path: Optional[str] = None, **kwargs):
+        super().__init__(log_dir, **kwargs)
+        self.db_path = db_path or get_db_path(log_dir)
+        self.conn = connect(self.db_path)
+        self._lock = threading.Lock()
+
+    def ingest(self, force: bool = False) -> List[str]:
+        """增量导入 log_dir 下的日志"""
+        return ingest_log_dir(self.log_dir, self.db_path, force=force)
+
+    def _query(self, sql: str, params: Tuple = ()) -> List[sqlite3.Row]:
+        with self._lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def has_game(self, game_id: str) -> bool:
+        return bool(self._query("SELECT 1 FROM games WHERE game_id = ?", (game_id,)))
+
+    @staticmethod
+    def _records(rows: List[sqlite3.Row]) -> List[Dict[str, Any]]:
+        return [json.loads(row["data"]) for row in rows]
+
+    def query_decisions(
+        self,
+        model_name: Optional[str] = None,
+        stage: Optional[str] = None,
+        player_name: Optional[str] = None,
+        game_id: Optional[str] = None,
+        action: Optional[str] = None,
+        min_pot: Optional[int] = None,
+        limit: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """跨对局筛选决策，例如 query_decisions(model_name="X", stage="river", min_pot=500)"""
+        conditions, params = [], []
+        for column, value in (("model_name", model_name), ("stage", stage), ("player_name", player_name),
+                              ("game_id", game_id)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        if action is not None:
+            conditions.append("action = ?")
+            params.append(normalize_action(action))
+        if min_pot is not None:
+            conditions.append("pot > ?")
+            params.append(min_pot)
+        sql = "SELECT data FROM decisions"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY game_id, seq"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return self._records(self._query(sql, tuple(params)))
+
+    def get_game_summary(self, game_id: str) -> Dict[str, Any]:
+        rows = self._query("SELECT * FROM games WHERE game_id = ?", (game_id,))
+        if not rows:
+            return super().get_game_summary(game_id)
+        game = rows[0]
+        counts = self._query(
+            "SELECT (SELECT COUNT(*) FROM decisions WHERE game_id = ?) AS decisions, "
+            "(SELECT COUNT(*) FROM reflections WHERE game_id = ?) AS reflections",
+            (game_id, game_id)
+        )[0]
+        return {
+            "game_id": game["game_id"],
+            "start_time": game["start_time"],
+            "end_time": game["end_time"] or "进行中",
+            "players": json.loads(game["players"]),
+            "total_decisions": counts["decisions"],
+            "total_reflections": counts["reflections"],
+            "final_rankings": json.loads(game["final_rankings"]),
+            "total_hands": game["total_hands"]
+        }
+
+    def get_player_decisions(self, game_id: str, player_name: str) -> List[Dict[str, Any]]:
+        if not self.has_game(game_id):
+            return super().get_player_decisions(game_id, player_name)
+        return self._records(self._query(
+            "SELECT data FROM decisions WHERE player_name = ? AND game_id = ? ORDER BY seq", (player_name, game_id)
+        ))
+
+    def get_player_reflections(self, game_id: str, player_name: str) -> List[Dict[str, Any]]:
+        if not self.has_game(game_id):
+            return super().get_player_reflections(game_id, player_name)
+        return self._records(self._query(
+            "SELECT data FROM reflections WHERE player_name = ? AND game_id = ? ORDER BY seq", (player_name, game_id)
+        ))
+
+    def get_stage_decisions(self, game_id: str, stage: str) -> List[Dict[str, Any]]:
+        if not self.has_game(game_id):
+            return super().get_stage_decisions(game_id, stage)
+        return self._records(self._query(
+            "SELECT data FROM decisions WHERE game_id = ? AND stage = ? ORDER BY seq", (game_id, stage)
+        ))
+
+    def get_hand_decisions(self, game_id: str, hand_number: int) -> List[Dict[str, Any]]:
+        if not self.has_game(game_id):
+            return super().get_hand_decisions(game_id, hand_number)
+        return self._records(self._query(
+            "SELECT data FROM decisions WHERE game_id = ? AND hand_number = ? ORDER BY seq", (game_id, hand_number)
+        ))
+
+    def get_decision_by_stage(self, game_id: str, hand_number: int, stage: str, player_name: str = None) -> List[Dict[str, Any]]:
+        if not self.has_game(game_id):
+            return super().get_decision_by_stage(game_id, hand_number, stage, player_name)
+        sql = "SELECT data FROM decisions WHERE game_id = ? AND hand_number = ? AND stage = ?"
+        params: Tuple = (game_id, hand_number, stage)
+        if player_name:
+            sql += " AND player_name = ?"
+            params += (player_name,)
+        return self._records(self._query(sql + " ORDER BY seq", params))
+
+    def get_events_by_type(self, game_id: str, event_type: int) -> List[Dict[str, Any]]:
+        if not self.has_game(game_id):
+            return super().get_events_by_type(game_id, event_type)
+        return self._records(self._query(
+            "SELECT data FROM events WHERE game_id = ? AND type = ? ORDER BY seq", (game_id, event_type)
+        ))
+
+    def get_prompt(self, game_id: str, record: Dict[str, Any]) -> str:
+        rows = self._query("SELECT prompt_templates, prompt_blobs FROM games WHERE game_id = ?", (game_id,))
+        if not rows:
+            return super().get_prompt(game_id, record)
+        return resolve_prompt(record, json.loads(rows[0]["prompt_templates"]), json.loads(rows[0]["prompt_blobs"]))
+
+    def analyze_decision_patterns(self, game_id: str, player_name: str) -> Dict[str, Any]:
+        if not self.has_game(game_id):
+            return super().analyze_decision_patterns(game_id, player_name)
+
+        rows = self._query(
+            "SELECT stage, action, COUNT(*) AS n, SUM(response_time) AS rt FROM decisions "
+            "WHERE player_name = ? AND game_id = ? GROUP BY stage, action",
+            (player_name, game_id)
+        )
+        action_distribution: Dict[str, int] = {}
+        stage_action_distribution: Dict[str, Dict[str, int]] = {}
+        total_response_time = 0.0
+        for row in rows:
+            action_distribution[row["action"]] = action_distribution.get(row["action"], 0) + row["n"]
+            stage_action_distribution.setdefault(row["stage"], {})[row["action"]] = row["n"]
+            total_response_time += row["rt"] or 0.0
+        total_decisions = sum(action_distribution.values())
+
+        def rate(*actions: str) -> float:
+            count = sum(action_distribution.get(a, 0) for a in actions)
+            return count / total_decisions if total_decisions > 0 else 0
+
+        return {
+            "player_name": player_name,
+            "total_decisions": total_decisions,
+            "action_distribution": action_distribution,
+            "stage_action_distribution": stage_action_distribution,
+            "avg_response_time": total_response_time / total_decisions if total_decisions > 0 else 0,
+            "aggression_score": rate("raise", "all-in"),
+            "fold_rate": rate("fold"),
+            "call_rate": rate("call")
+        }
+
+    def compare_models(self, game_id: str) -> Dict[str, Any]:
+        if not self.has_game(game_id):
+            return super().compare_models(game_id)
+
+        rows = self._query(
+            "SELECT model_name, COUNT(*) AS n, SUM(response_time) AS rt, "
+            "SUM(action = 'fold') AS folds, SUM(action = 'raise') AS raises, SUM(action = 'call') AS calls "
+            "FROM decisions WHERE game_id = ? GROUP BY model_name",
+            (game_id,)
+        )
+        return {
+            row["model_name"]: {
+                "total_decisions": row["n"],
+                "avg_response_time": (row["rt"] or 0.0) / row["n"],
+                "aggression_rate": row["raises"] / row["n"],
+                "fold_rate": row["folds"] / row["n"],
+                "call_rate": row["calls"] / row["n"]
+            }
+            for row in rows
+        }
+
+    def export_decision_timeline(self, game_id: str, output_file: str = None) -> str:
+        if not self.has_game(game_id):
+            return super().export_decision_timeline(game_id, output_file)
+
+        timeline = []
+        for decision in self._records(self._query(
+            "SELECT data FROM decisions WHERE game_id = ? ORDER BY timestamp, seq", (game_id,)
+        )):
+            timeline.append({
+                "time": decision["timestamp"],
+                "hand_number": decision["hand_number"],
+                "stage": decision["stage"],
+                "player": decision["player_name"],
+                "model": decision["model_name"],
+                "action": decision["parsed_action"],
+                "amount": decision["action_amount"],
+                "reason": decision["play_reason"],
+                "behavior": decision["behavior"],
+                "hand": decision["game_state"]["hand"],
+                "community_cards": decision["game_state"]["community_cards"],
+                "pot": decision["game_state"]["pot"]
+            })
+
+        if output_file:
+            with open(output_file, 'w', encoding='utf-8') as f:
+                json.dump(timeline, f, ensure_ascii=False, indent=2)
+            return output_file
+
+        return json.dumps(timeline, ensure_ascii=False, indent=2)
+
+    def close(self):
+        self.conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="将增强日志导入 SQLite 数据库并查询决策")
+    parser.add_argument("--log-dir", default="game_logs")
+    parser.add_argument("--db", default=None, help=f"数据库文件，默认 <log-dir>/{DB_FILE}")
+    parser.add_argument("--force", action="store_true", help="重新导入所有日志")
+    parser.add_argument("--model", default=None, help="按模型筛选决策")
+    parser.add_argument("--stage", default=None, help="按阶段筛选决策（preflop/flop/turn/river）")
+    parser.add_argument("--player", default=None, help="按玩家筛选决策")
+    parser.add_argument("--min-pot", type=int, default=None, help="只保留底池大于该值的决策")
+    parser.add_argument("--limit", type=int, default=20, help="最多输出的决策数量")
+    args = parser.parse_args()
+
+    ingested = ingest_log_dir(args.log_dir, args.db, force=args.force)
+    print(f"已导入 {len(ingested)} 个日志到 {args.db or get_db_path(args.log_dir)}")
+
+    if args.model or args.stage or args.player or args.min_pot is not None:
+        analyzer = SQLiteLogAnalyzer(args.log_dir, db_path=args.db)
+        decisions = analyzer.query_decisions(
+            model_name=args.model, stage=args.stage, player_name=args.player, min_pot=args.min_pot, limit=args.limit
+        )
+        for d in decisions:
+            print(f"[第{d['hand_number']}手 {d['stage']}] {d['player_name']}({d['model_name']}) "
+                  f"{d['parsed_action']} {d['action_amount']}  底池 {d['game_state'].get('pot', 0)}")
+        print(f"共 {len(decisions)} 条（最多显示 {args.limit} 条）")
+        analyzer.close()